@@ -1,10 +1,12 @@
 """
 Converts the farm's accounts into the needed JSON format.
 """
-import json
-import os
+import re
+import threading
 
 import helpers
+import manifest
+import serialization
 
 # Constants
 SYSTEM_ACCOUNTS = {
@@ -19,14 +21,10 @@ SYSTEM_ACCOUNTS = {
     'GST': 'GST',
     'Refunds/Payments': 'GSTPAYMENTS',
     'Historical Adjustment': 'HISTORICAL',
-    'Historical Adjustment8': 'HISTORICAL',
     'Realised Currency Gains': 'REALISEDCURRENCYGAIN',
     'Retained Earnings': 'RETAINEDEARNINGS',
-    'Retained earnings': 'RETAINEDEARNINGS',
     'Rounding': 'ROUNDING',
-    'Rounding8': 'ROUNDING',
     'Tracking Transfers': 'TRACKINGTRANSFERS',
-    'Tracking Transfers8': 'TRACKINGTRANSFERS',
     'Unpaid Expense Claims': 'UNPAIDEXPCLM',
     'Unrealised Currency Gains': 'UNREALISEDCURRENCYGAIN',
     'Wages Payable': 'WAGESPAYABLE',
@@ -34,11 +32,31 @@ SYSTEM_ACCOUNTS = {
     'Sales Tax': 'GST',
     'Vat control account': 'GST',
     'Realized Currency Gains': 'REALISEDCURRENCYGAIN',
-    'Unpaid expense claims (3564)': 'UNPAIDEXPCLM',
     'Unrealized Currency Gains': 'UNREALISEDCURRENCYGAIN',
     'Unapplied Cash Payment Income': 'UnappliedCashPaymentIncome',
     'Current Year Earnings': 'CURRENTYEAREARNINGS',
 }
+EQUITY_CLASSES = frozenset({'EQUITY', 'LIABILITY', 'ASSET'})
+WHITESPACE_PATTERN = re.compile(r'\s+')
+NUMBER_SUFFIX_PATTERN = re.compile(r'\s*(\(\d+\)|\d+)$')
+
+
+def normalise_account_name(name: str) -> str:
+    """
+    Normalises an account name for system account lookups.
+    Ignores case, repeated whitespace and numeric suffixes, e.g. 'Rounding8' or 'Unpaid expense claims (3564)'.
+    :param name: Account name.
+    :return: Normalised account name.
+    """
+    name = WHITESPACE_PATTERN.sub(' ', name).strip().casefold()
+    return NUMBER_SUFFIX_PATTERN.sub('', name)
+
+
+NORMALISED_SYSTEM_ACCOUNTS = {normalise_account_name(name): code for name, code in SYSTEM_ACCOUNTS.items()}
+
+# Global Variables
+ACCOUNTS_INDEX = None
+ACCOUNTS_INDEX_LOCK = threading.Lock()
 
 
 def get_accounts_api() -> dict:
@@ -54,25 +72,97 @@ def get_accounts() -> dict:
     Returns the farm's accounts from the JSON file or API request.
     :return: Dictionary of farm accounts.
     """
-    # Check if file exists
-    if not os.path.exists(os.path.join(os.path.dirname(__file__), 'original_accounts.json')):
-        return get_accounts_api()
-    # Check if file is empty
-    if os.path.getsize(os.path.join(os.path.dirname(__file__), 'original_accounts.json')) == 0:
+    # Use the saved copy in any supported format if there is one
+    file_path = serialization.find_file(helpers.get_output_path('Accounts', 'original_accounts.json'))
+    if file_path is None:
         return get_accounts_api()
-    # Return file contents
-    with open(os.path.join(os.path.dirname(__file__), 'original_accounts.json'), 'r', encoding='utf-8') as file:
-        accounts = json.load(file)
-        return accounts
+    return serialization.load_file(file_path)
+
+
+def build_accounts_index(data_list: dict) -> dict:
+    """
+    Creates a dictionary of the farm's accounts keyed by their UUID.
+    :param data_list: Dictionary of farm accounts.
+    :return: Dictionary of UUID: account.
+    """
+    index = {}
+    for key, item in data_list.items():
+        index[key] = item
+        uuid = item.get('uuid') or item.get('id')
+        if uuid is not None:
+            index[uuid] = item
+    return index
 
 
-def convert_accounts(data_list: dict) -> None:
+def set_accounts_index(data_list: dict) -> None:
+    """
+    Replaces the accounts index with the given accounts.
+    :param data_list: Dictionary of farm accounts.
+    """
+    global ACCOUNTS_INDEX
+
+    with ACCOUNTS_INDEX_LOCK:
+        ACCOUNTS_INDEX = build_accounts_index(data_list)
+
+
+def get_accounts_index() -> dict:
+    """
+    Returns the accounts index, populating it from the bulk accounts request on first use.
+    :return: Dictionary of UUID: account.
+    """
+    global ACCOUNTS_INDEX
+
+    if ACCOUNTS_INDEX is not None:
+        return ACCOUNTS_INDEX
+
+    with ACCOUNTS_INDEX_LOCK:
+        if ACCOUNTS_INDEX is None:
+            ACCOUNTS_INDEX = build_accounts_index(get_accounts() or {})
+
+    return ACCOUNTS_INDEX
+
+
+def get_account(uuid: str) -> dict | None:
+    """
+    Returns the farm account with the given UUID.
+    Checks the accounts index first and only requests the single account on a miss.
+    :param uuid: Account UUID.
+    :return: Account dictionary if found, None otherwise.
+    """
+    index = get_accounts_index()
+    account = index.get(uuid)
+    if account is not None:
+        return account
+
+    account = helpers.get_api('account', path_vars=[uuid])
+    if account is not None:
+        with ACCOUNTS_INDEX_LOCK:
+            index[uuid] = account
+    return account
+
+
+def get_system_account(name: str | None) -> str | None:
+    """
+    Returns the system account type of the account name.
+    :param name: Account name.
+    :return: System account type if known, None otherwise.
+    """
+    if name in SYSTEM_ACCOUNTS:
+        return SYSTEM_ACCOUNTS[name]
+    if not name:
+        return None
+    return NORMALISED_SYSTEM_ACCOUNTS.get(normalise_account_name(name))
+
+
+def convert_accounts(data_list: dict) -> bool:
     """
     Converts the farm's accounts from API into the needed JSON format.
-    Found in accounts.json
+    Found in accounts.json, the revenue.json and equity.json account lists are created in the same pass.
     :param data_list: Dictionary of farm accounts.
+    :return: True if the accounts were converted, False if there were errors.
     """
     new_list = []
+    seen = set()
     errors = False
     revenue = []
     equity = []
@@ -95,24 +185,24 @@ def convert_accounts(data_list: dict) -> None:
 
         if is_system_account:
             print(f'Found system account: {name}')
-
-        if name in SYSTEM_ACCOUNTS and is_system_account:
-            obj = create_account(code, name, item, SYSTEM_ACCOUNTS.get(name))
-        elif name not in SYSTEM_ACCOUNTS and is_system_account:
-            print(f"Error: {name} is a system account but is not in the system_accounts dictionary.")
-            errors = True
-            break
+            system_account = get_system_account(name)
+            if system_account is None:
+                print(f"Error: {name} is a system account but is not in the system_accounts dictionary.")
+                errors = True
+                break
+            obj = create_account(code, name, item, system_account)
         else:
             obj = create_account(code, name, item, '')
 
-        if any(d['Code'] == obj['Code'] and d['Name'] == obj['Name'] for d in new_list):
+        if (obj['Code'], obj['Name']) in seen:
             continue
+        seen.add((obj['Code'], obj['Name']))
 
         account_add = obj.get('Code') or obj.get('Name')
 
         if obj['Class'] == 'REVENUE':
             revenue.append(account_add)
-        elif obj['Class'] in ['EQUITY', 'LIABILITY', 'ASSET']:
+        elif obj['Class'] in EQUITY_CLASSES:
             equity.append(account_add)
         elif obj['SystemAccount'] == 'GST':
             equity.append(account_add)
@@ -121,16 +211,15 @@ def convert_accounts(data_list: dict) -> None:
 
     if not errors:
         new_list = sorted(new_list, key=lambda x: x['Code'] if x['Code'] is not None else float('inf'))
-        with open(os.path.join(os.path.dirname(__file__), 'accounts.json'), 'w', encoding='utf-8') as new:
-            json.dump(new_list, new, ensure_ascii=False, indent=4)
+        serialization.dump_file(helpers.get_output_path('Accounts', 'accounts.json'), new_list, ensure_ascii=False)
         print('Accounts converted successfully.')
-        with open(os.path.join(os.path.dirname(__file__), 'revenue.json'), 'w', encoding='utf-8') as new:
-            json.dump(revenue, new, ensure_ascii=False, indent=4)
-        with open(os.path.join(os.path.dirname(__file__), 'equity.json'), 'w', encoding='utf-8') as new:
-            json.dump(equity, new, ensure_ascii=False, indent=4)
+        serialization.dump_file(helpers.get_output_path('Accounts', 'revenue.json'), revenue, ensure_ascii=False)
+        serialization.dump_file(helpers.get_output_path('Accounts', 'equity.json'), equity, ensure_ascii=False)
     else:
         print('Accounts not converted due to errors.')
 
+    return not errors
+
 
 def create_account(code: str | int, name: str, item: dict, system_account: str) -> dict:
     """
@@ -157,7 +246,18 @@ def convert():
     Converts the farm's accounts into the needed JSON format.
     """
     accounts = get_accounts()
-    if accounts is not None:
-        convert_accounts(accounts)
-    else:
+    if accounts is None:
         print('Could not get accounts.')
+        return
+
+    set_accounts_index(accounts)
+
+    inputs_hash = manifest.get_inputs_hash('accounts', __file__, [accounts, SYSTEM_ACCOUNTS])
+    if manifest.is_unchanged('accounts', inputs_hash):
+        print('Accounts unchanged, skipping conversion.')
+        return
+
+    if convert_accounts(accounts):
+        manifest.record('accounts', inputs_hash, [helpers.get_output_path('Accounts', 'accounts.json'),
+                                                  helpers.get_output_path('Accounts', 'revenue.json'),
+                                                  helpers.get_output_path('Accounts', 'equity.json')])
@@ -0,0 +1,231 @@
+"""
+Times the conversion functions on synthetic farms of increasing size.
+Run from the repository root: python -m Benchmarks.benchmark --scales 1 10 100
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+from datetime import datetime
+from time import perf_counter
+from typing import Callable
+
+# Placeholder settings, in case a benchmarked function reads one of them
+BENCHMARK_ENV = {
+    'FARM_SHORTCODE_ID': 'benchmark',
+    'CLIENT_ID': 'benchmark',
+    'CLIENT_SECRET': 'benchmark',
+    'API_URL': 'http://127.0.0.1',
+    'TOKEN_URL': 'http://127.0.0.1/oauth/token',
+    'AUTH_URL': 'http://127.0.0.1/oauth/authorize',
+    'REDIRECT_URI': 'http://localhost',
+    'FARM_COUNTRY': 'NZ',
+    'USER_NAME': 'benchmark',
+    'PASSWORD': 'benchmark',
+    'CROP_URL': 'http://127.0.0.1',
+}
+for env_name, env_value in BENCHMARK_ENV.items():
+    os.environ.setdefault(env_name, env_value)
+
+import helpers
+import serialization
+from Accounts import accounts
+from Benchmarks import synthetic
+from Livestock import livestock
+from Transactions import transactions
+
+# Constants
+DEFAULT_SCALES = [1, 10, 100]
+DEFAULT_REPEAT = 3
+DEFAULT_RESULTS_PATH = os.path.join(os.path.dirname(__file__), 'results.json')
+
+
+def time_function(func: Callable, repeat: int) -> list:
+    """
+    Runs the function several times, hiding its output.
+    :param func: Function without arguments.
+    :param repeat: Number of runs.
+    :return: List of run times in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = perf_counter()
+            func()
+            times.append(perf_counter() - start)
+    return times
+
+
+def create_farm(scale: int, seed: int) -> dict:
+    """
+    Generates a synthetic farm and writes the input files the duplicate removal functions read.
+    Each input is created by the previous conversion, like a real run of the tool.
+    :param scale: Farm size multiplier.
+    :param seed: Random seed.
+    :return: Dictionary of the farm's data and item counts.
+    """
+    farm_accounts = synthetic.generate_accounts(scale, seed)
+    trackers = synthetic.generate_trackers(scale, seed)
+    mappings = synthetic.generate_account_mappings(trackers, farm_accounts, seed)
+    livestock_transactions = synthetic.generate_livestock_transactions(trackers, scale, seed)
+    cashflows = [synthetic.generate_cashflow_report(farm_accounts, scale, seed, data_type)['data']
+                 for data_type in transactions.CASHFLOW_DATA_TYPES]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        accounts.convert_accounts(farm_accounts)
+        transactions.get_rev_equity_codes()
+        farm_transactions = transactions.convert_transactions_from_json(cashflows)
+        livestock.convert_transactions(livestock_transactions, trackers)
+
+    tracker = trackers[0]
+    purchase_account, sale_account = (farm_accounts[mapping['account_id']]['code'] for mapping in mappings[tracker['id']])
+    tracker_transactions = serialization.load_file(
+        helpers.get_output_path('Livestock', tracker['name'], 'transactions.json'))
+    farm_transactions = synthetic.add_livestock_transactions(
+        farm_transactions, tracker_transactions, purchase_account, sale_account, seed=seed)
+    invoices = synthetic.generate_invoices(farm_transactions, farm_accounts, scale, seed)
+
+    serialization.dump_file(helpers.get_output_path('Transactions', 'transactions.json'), farm_transactions)
+    serialization.dump_file(helpers.get_output_path('Transactions', 'livestock.json'), tracker_transactions)
+    serialization.dump_file(helpers.get_output_path('Transactions', 'invoices.json'), invoices)
+
+    return {
+        'accounts': farm_accounts,
+        'trackers': trackers,
+        'livestock_transactions': livestock_transactions,
+        'cashflows': cashflows,
+        'purchase_account': purchase_account,
+        'sale_account': sale_account,
+        'counts': {
+            'accounts': len(farm_accounts),
+            'trackers': len(trackers),
+            'livestock_transactions': len(livestock_transactions),
+            'cashflow_rows': sum(len(section['rows']) for cashflow in cashflows
+                                 for top_section in cashflow['sections'].values()
+                                 for section in top_section['sections'].values()),
+            'farm_transactions': len(farm_transactions),
+            'invoices': len(invoices),
+        },
+    }
+
+
+def get_benchmarks(farm: dict) -> dict:
+    """
+    Returns the benchmarked functions bound to the farm's data.
+    :param farm: Farm from create_farm.
+    :return: Dictionary of benchmark name: function without arguments.
+    """
+    return {
+        'accounts.convert_accounts': lambda: accounts.convert_accounts(farm['accounts']),
+        'livestock.convert_transactions':
+            lambda: livestock.convert_transactions(farm['livestock_transactions'], farm['trackers']),
+        'transactions.convert_transactions_from_json':
+            lambda: transactions.convert_transactions_from_json(farm['cashflows']),
+        'transactions.remove_duplicate_livestock_transactions':
+            lambda: transactions.remove_duplicate_livestock_transactions(farm['purchase_account'],
+                                                                         farm['sale_account']),
+        'transactions.remove_duplicate_crop_transactions': transactions.remove_duplicate_crop_transactions,
+    }
+
+
+def run_scale(scale: int, repeat: int, seed: int) -> dict:
+    """
+    Benchmarks every function on a synthetic farm in a temporary output directory.
+    :param scale: Farm size multiplier.
+    :param repeat: Number of runs of each function.
+    :param seed: Random seed.
+    :return: Dictionary of the farm's item counts and benchmark name: timings.
+    """
+    old_output_dir = helpers.OUTPUT_DIR
+    with tempfile.TemporaryDirectory(prefix=f'benchmark-{scale}x-') as output_dir:
+        helpers.OUTPUT_DIR = output_dir
+        try:
+            farm = create_farm(scale, seed)
+            timings = {}
+            for name, func in get_benchmarks(farm).items():
+                times = time_function(func, repeat)
+                timings[name] = {
+                    'min': min(times),
+                    'median': statistics.median(times),
+                    'runs': times,
+                }
+                print(f'{scale:>4}x  {name:<55} {min(times):9.4f}s')
+        finally:
+            helpers.OUTPUT_DIR = old_output_dir
+
+    return {'counts': farm['counts'], 'timings': timings}
+
+
+def get_growth(results: dict) -> dict:
+    """
+    Returns how each function's run time grows between consecutive scales, as the exponent k in time ~ size^k.
+    About 1 is linear, about 2 is quadratic.
+    :param results: Dictionary of scale: result from run_scale.
+    :return: Dictionary of benchmark name: dictionary of 'AxBx': exponent.
+    """
+    scales = sorted(results)
+    growth = {}
+    for smaller, larger in zip(scales, scales[1:]):
+        for name, timing in results[larger]['timings'].items():
+            before = results[smaller]['timings'][name]['min']
+            exponent = math.log(timing['min'] / before) / math.log(larger / smaller) if before > 0 else None
+            growth.setdefault(name, {})[f'{smaller}x-{larger}x'] = exponent
+    return growth
+
+
+def parse_args(args: list = None) -> argparse.Namespace:
+    """
+    Parses the command line arguments.
+    :param args: Arguments, defaults to sys.argv.
+    :return: Parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the conversion functions on synthetic farms.')
+    parser.add_argument('--scales', nargs='+', type=int, default=DEFAULT_SCALES,
+                        help='Farm size multipliers to benchmark.')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='Runs of each function, the fastest run is reported.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic farms.')
+    parser.add_argument('--output', default=DEFAULT_RESULTS_PATH, help='Results JSON file.')
+    parser.add_argument('--max-exponent', type=float,
+                        help='Exit with an error when a function grows faster than size^MAX_EXPONENT, e.g. 1.5.')
+    return parser.parse_args(args)
+
+
+def main(args: list = None) -> int:
+    """
+    Runs the benchmarks and writes the results.
+    :param args: Arguments, defaults to sys.argv.
+    :return: Exit code, 1 if a function grew faster than --max-exponent.
+    """
+    args = parse_args(args)
+    results = {scale: run_scale(scale, args.repeat, args.seed) for scale in sorted(set(args.scales))}
+    growth = get_growth(results)
+
+    serialization.dump_file(args.output, {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'scales': {f'{scale}x': result for scale, result in results.items()},
+        'growth': growth,
+    })
+    print(f'Results written to {args.output}')
+
+    if args.max_exponent is None:
+        return 0
+    regressions = [(name, step, exponent) for name, steps in growth.items() for step, exponent in steps.items()
+                   if exponent is not None and exponent > args.max_exponent]
+    for name, step, exponent in regressions:
+        print(f'{name} grows as size^{exponent:.2f} from {step}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
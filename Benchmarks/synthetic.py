@@ -0,0 +1,293 @@
+"""
+Generates synthetic farms for benchmarks and the mock API.
+- Account charts
+- Livestock trackers, account mappings and transactions
+- Cashflow reports with nested sections
+- Crop invoices
+Sizes are per farm and multiplied by the scale, the same seed always generates the same farm.
+"""
+import random
+from datetime import datetime
+
+# Constants
+ACCOUNTS_PER_FARM = 250
+TRACKERS_PER_FARM = 4
+STOCK_CLASSES_PER_TRACKER = 6
+LIVESTOCK_TRANSACTIONS_PER_FARM = 2000
+CASHFLOW_ROWS_PER_FARM = 120
+INVOICES_PER_FARM = 60
+CASHFLOW_COMPARE = 60
+SYSTEM_ACCOUNT_NAMES = [
+    'Accounts Payable', 'Accounts Receivable', 'GST', 'Historical Adjustment', 'Rounding',
+    'Retained Earnings', 'Tracking Transfers', 'Unpaid Expense Claims', 'Wages Payable',
+    'Current Year Earnings', 'Bank Revaluations', 'Realised Currency Gains',
+]
+ACCOUNT_CLASSES = ['REVENUE', 'EXPENSE', 'EXPENSE', 'EXPENSE', 'ASSET', 'LIABILITY', 'EQUITY']
+ACCOUNT_WORDS = ['Feed', 'Fertiliser', 'Fuel', 'Wages', 'Repairs', 'Milk', 'Wool', 'Grain', 'Seed', 'Freight',
+                 'Vet', 'Insurance', 'Rates', 'Electricity', 'Contracting', 'Animal Health', 'Irrigation']
+STOCK_TYPES = ['Sheep', 'Beef', 'Dairy', 'Deer', 'Goats']
+STOCK_CLASS_NAMES = ['Ewes', 'Rams', 'Lambs', 'Hoggets', 'Wethers', 'Cows', 'Bulls', 'Calves', 'Heifers', 'Steers']
+TRANSITIONS = ['purchase', 'sale', 'sale', 'birth', 'death', 'opening', 'aging_out']
+SECTION_NAMES = ['Income', 'Expenses', 'Capital', 'Funding']
+
+
+def generate_accounts(scale: int = 1, seed: int = 0) -> dict:
+    """
+    Generates a chart of accounts in the accounts API format.
+    Includes system accounts, accounts without codes and duplicates like real charts do.
+    :param scale: Farm size multiplier.
+    :param seed: Random seed.
+    :return: Dictionary of account UUID: account.
+    """
+    rng = random.Random(f'accounts-{seed}')
+    accounts = {}
+
+    for i in range(ACCOUNTS_PER_FARM * scale):
+        uuid = f'account-{seed}-{i}'
+        if i < len(SYSTEM_ACCOUNT_NAMES):
+            name, code, system_account = SYSTEM_ACCOUNT_NAMES[i], str(800 + i), True
+        elif rng.random() < 0.02 and accounts:
+            # Duplicate of an earlier account
+            duplicate = accounts[rng.choice(list(accounts))]
+            name, code, system_account = duplicate['name'], duplicate['code'], duplicate['system_account']
+        else:
+            name = f'{rng.choice(ACCOUNT_WORDS)} {i}'
+            code = None if rng.random() < 0.03 else str(100 + i)
+            system_account = False
+
+        accounts[uuid] = {
+            'uuid': uuid,
+            'code': code,
+            'name': name,
+            'class': 'LIABILITY' if system_account else rng.choice(ACCOUNT_CLASSES),
+            'type': 'CURRENT',
+            'tax_type': rng.choice(['INPUT', 'OUTPUT', 'NONE']),
+            'system_account': system_account,
+            'active': rng.random() > 0.1,
+        }
+
+    return accounts
+
+
+def generate_trackers(scale: int = 1, seed: int = 0) -> list:
+    """
+    Generates livestock trackers in the trackers API format.
+    :param scale: Farm size multiplier.
+    :param seed: Random seed.
+    :return: List of trackers.
+    """
+    rng = random.Random(f'trackers-{seed}')
+    trackers = []
+
+    for i in range(TRACKERS_PER_FARM * scale):
+        tracker_id = f'tracker-{seed}-{i}'
+        stock_type = rng.choice(STOCK_TYPES)
+        trackers.append({
+            'id': tracker_id,
+            'name': f'{stock_type} {i}',
+            'stock_type_id': f'stock-type-{stock_type.lower()}',
+            'stock_classes': [{
+                'uuid': f'{tracker_id}-class-{j}',
+                'name': STOCK_CLASS_NAMES[(i + j) % len(STOCK_CLASS_NAMES)],
+                'enabled': rng.random() > 0.1,
+            } for j in range(STOCK_CLASSES_PER_TRACKER)],
+        })
+
+    return trackers
+
+
+def generate_account_mappings(trackers: list, accounts: dict, seed: int = 0) -> dict:
+    """
+    Generates every tracker's purchase and sale account mappings in the account mappings API format.
+    :param trackers: Trackers from generate_trackers.
+    :param accounts: Accounts from generate_accounts.
+    :param seed: Random seed.
+    :return: Dictionary of tracker ID: list of account mappings.
+    """
+    rng = random.Random(f'mappings-{seed}')
+    coded_accounts = [uuid for uuid, account in accounts.items()
+                      if account['code'] is not None and not account['system_account']]
+    return {
+        tracker['id']: [
+            {'transition': 'purchase', 'account_id': rng.choice(coded_accounts)},
+            {'transition': 'sale', 'account_id': rng.choice(coded_accounts)},
+        ] for tracker in trackers
+    }
+
+
+def generate_livestock_transactions(trackers: list, scale: int = 1, seed: int = 0) -> list:
+    """
+    Generates livestock transactions in the livestock transactions API format.
+    Every aging_out transaction is followed by its aging_in transaction.
+    :param trackers: Trackers from generate_trackers.
+    :param scale: Farm size multiplier.
+    :param seed: Random seed.
+    :return: List of livestock transactions.
+    """
+    rng = random.Random(f'livestock-{seed}')
+    current_year = datetime.now().year
+    transactions = []
+
+    while len(transactions) < LIVESTOCK_TRANSACTIONS_PER_FARM * scale:
+        tracker = rng.choice(trackers)
+        stock_class = rng.choice(tracker['stock_classes'])
+        transition = rng.choice(TRANSITIONS)
+        date = f'{rng.randint(current_year - 3, current_year + 2)}-{rng.randint(1, 12):02d}-01 00:00:00'
+        transaction = {
+            'tracker_id': tracker['id'],
+            'stock_class_id': stock_class['uuid'],
+            'transition': transition,
+            'quantity': rng.randint(1, 500),
+            'accrual_date': {'date': date},
+            'amount': round(rng.uniform(-50000, 50000), 2) if transition in ('purchase', 'sale') else None,
+            'weight_per_head': rng.choice([None, 0, round(rng.uniform(20, 600), 1)]),
+            'type': rng.choice([None, 'actual', 'forecast']),
+        }
+        transactions.append(transaction)
+
+        if transition == 'aging_out':
+            transactions.append(dict(transaction, transition='aging_in',
+                                     stock_class_id=rng.choice(tracker['stock_classes'])['uuid']))
+
+    return transactions
+
+
+def get_report_months(date_end: str, compare: int) -> list:
+    """
+    Returns the months of a report window.
+    :param date_end: Last month of the report, e.g. '2025-12'.
+    :param compare: Number of months before date_end in the report.
+    :return: List of 'YYYY-MM' months, oldest first.
+    """
+    year, month = map(int, date_end.split('-'))
+    end = year * 12 + month - 1
+    return [f'{index // 12}-{index % 12 + 1:02d}' for index in range(end - compare, end + 1)]
+
+
+def get_cashflow_value(row_index: int, date: str, seed: int) -> float:
+    """
+    Returns a row's cashflow value for a month.
+    Values only depend on the row, month and seed, so any report window of the same farm agrees.
+    :param row_index: Row number in the report.
+    :param date: 'YYYY-MM' month.
+    :param seed: Random seed.
+    :return: Value, roughly a third are 0.
+    """
+    year, month = map(int, date.split('-'))
+    mixed = (row_index * 7919 + (year * 12 + month) * 104729 + seed * 1299709) % 9973
+    if mixed % 3 == 0:
+        return 0
+    return round((mixed - 4986) * 3.17, 2)
+
+
+def generate_cashflow_report(accounts: dict, scale: int = 1, seed: int = 0, data_type: str = 'actuals',
+                             date_end: str = None, compare: int = CASHFLOW_COMPARE) -> dict:
+    """
+    Generates a cashflow report in the cashflow report API format, rows are nested two sections deep.
+    :param accounts: Accounts from generate_accounts, rows use their codes and names.
+    :param scale: Farm size multiplier.
+    :param seed: Random seed.
+    :param data_type: 'actuals' or 'forecast'
+    :param date_end: Last month of the report, defaults to December two years from now.
+    :param compare: Number of months before date_end in the report.
+    :return: Dictionary of the cashflow report.
+    """
+    now = datetime.now()
+    date_end = date_end or f'{now.year + 2}-12'
+    months = get_report_months(date_end, compare)
+    current_month = f'{now.year}-{now.month:02d}'
+    account_list = [account for account in accounts.values() if not account['system_account']]
+    rows_per_section = max(CASHFLOW_ROWS_PER_FARM * scale // (len(SECTION_NAMES) * 4), 1)
+    row_index = 0
+    sections = {}
+
+    for name in SECTION_NAMES:
+        subsections = {}
+        for sub in range(4):
+            rows = {}
+            for _ in range(rows_per_section):
+                account = account_list[row_index % len(account_list)]
+                rows[f'row-{row_index}'] = {
+                    'account_code': account['code'] or '',
+                    'account_name': account['name'],
+                    'data': {date: {'date': date, 'value': get_cashflow_value(row_index, date, seed)}
+                             for date in months},
+                }
+                row_index += 1
+            subsections[f'{name} {sub}'] = {
+                'rows': rows,
+                'totals': {date: {'value': round(sum(row['data'][date]['value'] for row in rows.values()), 2)}
+                           for date in months},
+            }
+        sections[name] = {
+            'rows': {},
+            'totals': {date: {'value': round(sum(section['totals'][date]['value']
+                                                 for section in subsections.values()), 2)}
+                       for date in months},
+            'sections': subsections,
+        }
+
+    return {
+        'data': {
+            'period': {date: {'data_type': 'actuals' if date <= current_month else 'forecast'} for date in months},
+            'sections': sections,
+        },
+        'meta': {'data_type': data_type, 'date_end': date_end, 'compare': compare},
+    }
+
+
+def generate_invoices(transactions: list, accounts: dict, scale: int = 1, seed: int = 0) -> list:
+    """
+    Generates crop season invoices, about half of the lines duplicate one of the farm transactions.
+    :param transactions: Converted farm transactions, e.g. from transactions.convert_transactions_from_json.
+    :param accounts: Accounts from generate_accounts.
+    :param scale: Farm size multiplier.
+    :param seed: Random seed.
+    :return: List of invoices.
+    """
+    rng = random.Random(f'invoices-{seed}')
+    account_names = {account['code']: account['name'] for account in accounts.values() if account['code']}
+    invoices = []
+
+    for _ in range(INVOICES_PER_FARM * scale):
+        lines = []
+        transaction = rng.choice(transactions) if transactions else None
+        for _ in range(rng.randint(1, 4)):
+            if transaction is not None and rng.random() < 0.5:
+                account = account_names.get(str(transaction['Account']), transaction['Account'])
+                lines.append({'account': account, 'amount': str(transaction['Amount'])})
+            else:
+                lines.append({'account': rng.choice(list(account_names.values())),
+                              'amount': str(round(rng.uniform(-20000, 20000), 2))})
+        invoices.append({
+            'transaction_type': transaction['Type'].lower() if transaction is not None else 'actuals',
+            'year': transaction['Year'] if transaction is not None else 0,
+            'month': transaction['Month'] if transaction is not None else 1,
+            'lines': lines,
+        })
+
+    return invoices
+
+
+def add_livestock_transactions(transactions: list, livestock: list, purchase_account: str, sale_account: str,
+                               fraction: float = 0.5, seed: int = 0) -> list:
+    """
+    Adds farm transactions duplicating a fraction of a tracker's converted purchases and sales.
+    :param transactions: Converted farm transactions.
+    :param livestock: Tracker's converted livestock transactions.
+    :param purchase_account: Tracker's purchase account.
+    :param sale_account: Tracker's sales account.
+    :param fraction: Share of the purchases and sales to duplicate.
+    :param seed: Random seed.
+    :return: New list of farm transactions.
+    """
+    rng = random.Random(f'livestock-duplicates-{seed}')
+    duplicates = [{
+        'Type': (livestock_t.get('Type') or 'forecast').capitalize(),
+        'Account': purchase_account if livestock_t['Transition'] == 'purchase' else sale_account,
+        'Amount': -livestock_t['Amount'] if livestock_t['Transition'] == 'purchase' else livestock_t['Amount'],
+        'Year': livestock_t['Year'],
+        'Month': livestock_t['Month'],
+    } for livestock_t in livestock
+        if livestock_t['Transition'] in ('purchase', 'sale') and 'Amount' in livestock_t and rng.random() < fraction]
+    return transactions + duplicates
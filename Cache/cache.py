@@ -0,0 +1,231 @@
+"""
+Persistent API response cache.
+- SQLite storage
+- Per-endpoint TTLs
+- ETag/Last-Modified revalidation
+- Size-bounded LRU eviction
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from time import time
+
+import config
+
+config.load_env()
+
+# Constants
+CACHE_FILE_PATH = os.environ.get('CACHE_FILE') or os.path.join(os.path.dirname(__file__), 'cache.sqlite')
+CACHE_ENABLED = os.environ.get('CACHE_ENABLED', '1').lower() not in ('0', 'false', 'no', '')
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 512 * 1024 * 1024))
+DEFAULT_TTL = int(os.environ.get('CACHE_TTL', 3600))
+CACHE_TTLS = {
+    'accounts': 6 * 3600,
+    'account': 6 * 3600,
+    'livestock_list': 3600,
+    'livestock_account_mappings': 6 * 3600,
+    'livestock_transactions': 3600,
+    'cashflow': 3600,
+}
+
+# Global Variables
+CONNECTION = None
+LOCK = threading.Lock()
+STATS = {
+    'hits': 0,
+    'misses': 0,
+    'revalidated': 0,
+    'evictions': 0,
+}
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Returns the SQLite connection, creating the database on first use.
+    :return: SQLite connection.
+    """
+    global CONNECTION
+
+    if CONNECTION is not None:
+        return CONNECTION
+
+    with LOCK:
+        if CONNECTION is None:
+            connection = sqlite3.connect(CACHE_FILE_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, '
+                'api_type TEXT NOT NULL, '
+                'body BLOB NOT NULL, '
+                'etag TEXT, '
+                'last_modified TEXT, '
+                'stored_at REAL NOT NULL, '
+                'accessed_at REAL NOT NULL, '
+                'size INTEGER NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+            CONNECTION = connection
+
+    return CONNECTION
+
+
+def get_ttl(api_type: str) -> int:
+    """
+    Returns the number of seconds a response from the API stays fresh.
+    Can be overridden per endpoint with CACHE_TTL_<API_TYPE>, e.g. CACHE_TTL_CASHFLOW.
+    :param api_type: API type, see helpers.get_url.
+    :return: TTL in seconds.
+    """
+    override = os.environ.get(f'CACHE_TTL_{api_type.upper()}')
+    if override:
+        return int(override)
+    return CACHE_TTLS.get(api_type, DEFAULT_TTL)
+
+
+def make_key(api_type: str, path_vars: list | None, query_params: dict | None, farm_id: str) -> str:
+    """
+    Creates the cache key for a request.
+    :param api_type: API type, see helpers.get_url.
+    :param path_vars: URL path variables.
+    :param query_params: Query parameters.
+    :param farm_id: Farm shortcode.
+    :return: Hex digest key.
+    """
+    parts = [farm_id, api_type, [str(var) for var in path_vars or []],
+             sorted((str(k), str(v)) for k, v in (query_params or {}).items())]
+    return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+
+def count(stat: str) -> None:
+    """
+    Increments a cache counter.
+    :param stat: Counter name from STATS.
+    """
+    with LOCK:
+        STATS[stat] += 1
+
+
+def get_stats() -> dict:
+    """
+    Returns a copy of the cache counters.
+    :return: Dictionary of counter name: value.
+    """
+    with LOCK:
+        return dict(STATS)
+
+
+def lookup(key: str) -> dict | None:
+    """
+    Returns the cached response for the key and marks it as recently used.
+    :param key: Cache key from make_key.
+    :return: Entry dictionary if cached, None otherwise.
+    """
+    if not CACHE_ENABLED:
+        return None
+
+    connection = get_connection()
+    with LOCK:
+        row = connection.execute(
+            'SELECT api_type, body, etag, last_modified, stored_at FROM responses WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (time(), key))
+
+    return {
+        'api_type': row[0],
+        'body': row[1],
+        'etag': row[2],
+        'last_modified': row[3],
+        'stored_at': row[4],
+    }
+
+
+def is_fresh(entry: dict) -> bool:
+    """
+    Checks if a cached entry is within its endpoint's TTL.
+    :param entry: Entry dictionary from lookup.
+    :return: True or False
+    """
+    return entry['stored_at'] + get_ttl(entry['api_type']) > time()
+
+
+def conditional_headers(entry: dict | None) -> dict:
+    """
+    Returns the revalidation headers for a stale entry.
+    :param entry: Entry dictionary from lookup.
+    :return: Dictionary of If-None-Match/If-Modified-Since headers.
+    """
+    headers = {}
+    if entry is None:
+        return headers
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def store(key: str, api_type: str, body: bytes, etag: str = None, last_modified: str = None) -> None:
+    """
+    Saves a response body and evicts the least recently used entries when over CACHE_MAX_BYTES.
+    :param key: Cache key from make_key.
+    :param api_type: API type, see helpers.get_url.
+    :param body: Raw response body.
+    :param etag: Response ETag header.
+    :param last_modified: Response Last-Modified header.
+    """
+    if not CACHE_ENABLED or len(body) > CACHE_MAX_BYTES:
+        return
+
+    connection = get_connection()
+    now = time()
+    with LOCK:
+        connection.execute(
+            'INSERT OR REPLACE INTO responses '
+            '(key, api_type, body, etag, last_modified, stored_at, accessed_at, size) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, api_type, body, etag, last_modified, now, now, len(body))
+        )
+    evict()
+
+
+def refresh(key: str) -> None:
+    """
+    Restarts an entry's TTL after the server confirmed it is unchanged.
+    :param key: Cache key from make_key.
+    """
+    connection = get_connection()
+    now = time()
+    with LOCK:
+        connection.execute('UPDATE responses SET stored_at = ?, accessed_at = ? WHERE key = ?', (now, now, key))
+
+
+def evict() -> None:
+    """
+    Deletes the least recently used entries until the cache fits in CACHE_MAX_BYTES.
+    """
+    connection = get_connection()
+    with LOCK:
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= CACHE_MAX_BYTES:
+            return
+        rows = connection.execute('SELECT key, size FROM responses ORDER BY accessed_at').fetchall()
+        for key, size in rows:
+            if total <= CACHE_MAX_BYTES:
+                break
+            connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            STATS['evictions'] += 1
+
+
+def clear() -> None:
+    """
+    Deletes every cached response.
+    """
+    connection = get_connection()
+    with LOCK:
+        connection.execute('DELETE FROM responses')
@@ -1,77 +1,380 @@
-import time
-import selenium
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from bs4 import BeautifulSoup
+"""
+Scrapes the farm's crop season activities into the invoices.json format.
+The expanded activity page is read in a single page_source snapshot and parsed offline with BeautifulSoup.
+Chrome is only started when crops are converted, and its session cookies are kept so later runs skip the login.
+"""
+import os
+from collections import Counter
+from importlib.util import find_spec
+from time import monotonic
 
 import helpers
+import serialization
 
-chrome_options = Options()
-# chrome_options.add_argument("--headless")  # Run Chrome in headless mode
+HTML_PARSER = 'lxml' if find_spec('lxml') is not None else 'html.parser'
 
-driver = selenium.webdriver.Chrome(options=chrome_options)
-driver.get(helpers.CROP_URL)
-driver.implicitly_wait(10)
+# Constants
+SNAPSHOT_FILE_PATH = os.path.join(os.path.dirname(__file__), 'snapshot.html')
+COOKIES_FILE_PATH = os.path.join(os.path.dirname(__file__), 'cookies.json')
+HEADLESS = os.environ.get('CROPS_HEADLESS', '1').lower() not in ('0', 'false', 'no', '')
+WAIT_TIMEOUT = float(os.environ.get('CROPS_WAIT_TIMEOUT', 30))
+# Seconds between checks of a wait condition
+POLL_INTERVAL = 0.25
+# Seconds the number of activity lines has to stay the same before the expanded page is read
+SETTLE_TIME = 1.0
+ACTIVITY_LIST_CLASS = 'activity-list'
+# Shown instead of the activity lists when the season has no activities
+ACTIVITY_EMPTY_CLASS = 'activity-empty'
+SUMMARY_XPATH = "//div[contains(text(), 'Costs & Other Income')]"
+ACTIVITY_ROW_CLASS = 'activity-line-row'
+STATUS_CLASSES = {
+    'status-future': 'forecast',
+    'status-current': 'actuals',
+}
+# Text fields of an activity line, in the order the activity page shows them
+ACTIVITY_LINE_FIELDS = ('activity', 'date', 'account', 'quantity', 'rate', 'amount')
+DATE_FORMATS = ('%d %b %Y', '%d %B %Y', '%d/%m/%Y', '%Y-%m-%d', '%b %Y', '%B %Y')
 
-email_input = driver.find_element(By.ID, 'email')
-email_input.send_keys(helpers.USER_NAME)
 
-next_button = driver.find_element(By.XPATH, "//span[contains(text(),'Next')]")
-next_button.click()
+def get_row_status(row) -> str | None:
+    """
+    Returns the status of an activity line from its status element's class.
+    :param row: BeautifulSoup activity-line-row element.
+    :return: 'forecast', 'actuals' or None if the row has no status element.
+    """
+    for status_class, status in STATUS_CLASSES.items():
+        if row.select_one(f'.{status_class}') is not None:
+            return status
+    return None
 
-pass_input = driver.find_element(By.ID, 'password')
-pass_input.send_keys(helpers.PASSWORD)
 
-login_button = driver.find_element(By.XPATH, "//span[contains(text(),'Log in')]")
-login_button.click()
+def get_row_fields(row) -> list:
+    """
+    Returns the text fields of an activity line, leaving out any text of its status element, e.g. 'Actual'.
+    The status elements are removed from the row, read the status with get_row_status first.
+    :param row: BeautifulSoup activity-line-row element.
+    :return: List of strings.
+    """
+    for element in row.select(', '.join(f'.{status_class}' for status_class in STATUS_CLASSES)):
+        element.extract()
+    return list(row.stripped_strings)
 
-time.sleep(10)
 
-summary_list = driver.find_element(By.XPATH, "//div[contains(text(), 'Costs & Other Income')]")
-summary_list.click()
+def parse_activity_rows(html: str) -> list:
+    """
+    Returns the text fields and status of every activity line on the page.
+    :param html: Page source of the expanded activity page.
+    :return: List of dictionaries: {'fields': list of strings, 'status': 'forecast', 'actuals' or None}
+    """
+    from bs4 import BeautifulSoup
 
-activity_list_list = driver.find_elements(By.CLASS_NAME, 'activity-list')
+    soup = BeautifulSoup(html, HTML_PARSER)
+    rows = []
+    for row in soup.find_all(class_=ACTIVITY_ROW_CLASS):
+        status = get_row_status(row)
+        rows.append({'fields': get_row_fields(row), 'status': status})
+    return rows
 
-for activity_list in activity_list_list:
-    time.sleep(2)
-    activity_list.click()
 
-activity_details = driver.find_elements(By.CLASS_NAME, 'activity-line-row')
-print(activity_details)
+def parse_date(date_string: str) -> tuple | None:
+    """
+    Returns the relative year and month of an activity line's date.
+    :param date_string: Date as shown on the page, e.g. '15 Sep 2023'.
+    :return: Tuple: (relative year, month), None if the date is in an unknown format.
+    """
+    for date_format in DATE_FORMATS:
+        try:
+            return helpers.get_relative_date(date_string.strip(), date_format)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_amount(amount_string: str) -> float | None:
+    """
+    Returns an activity line's amount as a number.
+    :param amount_string: Amount as shown on the page, e.g. '$1,234.50', '-$20.00' or '($20.00)'.
+    :return: Amount, None if the text isn't an amount.
+    """
+    text = amount_string.strip()
+    negative = text.startswith('-') or (text.startswith('(') and text.endswith(')'))
+    text = text.strip('-()').replace('$', '').replace(',', '').strip()
+    try:
+        amount = float(text)
+    except ValueError:
+        return None
+    return -amount if negative else amount
+
+
+def parse_activity_line(row: dict) -> dict | None:
+    """
+    Converts an activity line's text fields into a crop line record.
+    :param row: Row dictionary from parse_activity_rows.
+    :return: Dictionary of the ACTIVITY_LINE_FIELDS plus 'status', 'year' and 'month', None if the row isn't a line.
+    """
+    if len(row['fields']) != len(ACTIVITY_LINE_FIELDS) or row['status'] is None:
+        return None
+
+    line = dict(zip(ACTIVITY_LINE_FIELDS, row['fields']))
+    date = parse_date(line['date'])
+    amount = parse_amount(line['amount'])
+    if date is None or amount is None:
+        return None
+
+    line['status'] = row['status']
+    line['year'], line['month'] = date
+    line['amount'] = amount
+    return line
+
+
+def create_invoices(lines: list) -> list:
+    """
+    Groups crop line records into invoices, one per status and month.
+    :param lines: Line dictionaries from parse_activity_line.
+    :return: List of invoices in the invoices.json format.
+    """
+    invoices = {}
+    for line in lines:
+        key = (line['status'], line['year'], line['month'])
+        if key not in invoices:
+            invoices[key] = {
+                'transaction_type': line['status'],
+                'year': line['year'],
+                'month': line['month'],
+                'lines': [],
+            }
+        invoices[key]['lines'].append({
+            'activity': line['activity'],
+            'account': line['account'],
+            'amount': str(line['amount']),
+        })
+    return list(invoices.values())
+
+
+def parse_snapshot(html: str) -> list:
+    """
+    Parses a page_source snapshot of the expanded activity page into crop invoices.
+    :param html: Page source, e.g. from a saved snapshot.html.
+    :return: List of invoices in the invoices.json format.
+    """
+    lines = []
+    skipped = Counter()
+    for row in parse_activity_rows(html):
+        line = parse_activity_line(row)
+        if line is None:
+            skipped['no status' if row['status'] is None else 'not a line'] += 1
+            continue
+        lines.append(line)
 
-details = []
+    if skipped:
+        print(f"Skipped {sum(skipped.values())} activity rows: "
+              + ', '.join(f'{count} {reason}' for reason, count in skipped.items()))
+    return create_invoices(lines)
 
-for activity_detail in activity_details:
-    print(activity_detail.text)
-    detail = activity_detail.text.split('\n')
+
+def parse_snapshot_file(file_path: str = SNAPSHOT_FILE_PATH) -> list:
+    """
+    Parses a saved page_source snapshot into crop invoices.
+    :param file_path: Path to the HTML file.
+    :return: List of invoices in the invoices.json format.
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return parse_snapshot(file.read())
+
+
+def create_driver():
+    """
+    Starts Chrome, headless unless CROPS_HEADLESS is off.
+    :return: Chrome WebDriver.
+    """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+    if HEADLESS:
+        chrome_options.add_argument('--headless=new')
+        chrome_options.add_argument('--window-size=1920,1080')
+    return webdriver.Chrome(options=chrome_options)
+
+
+def wait_for(driver, condition, timeout: float = None):
+    """
+    Waits until the condition holds.
+    :param driver: WebDriver.
+    :param condition: Function of the driver returning a truthy value once it holds, e.g. an expected_conditions one.
+    :param timeout: Seconds to wait, defaults to WAIT_TIMEOUT.
+    :return: The condition's value.
+    """
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    return WebDriverWait(driver, WAIT_TIMEOUT if timeout is None else timeout, POLL_INTERVAL).until(condition)
+
+
+def load_cookies(driver) -> bool:
+    """
+    Adds the saved session cookies to the browser.
+    :param driver: WebDriver on a page of the crop site, cookies can only be added to the current domain.
+    :return: True if cookies were added.
+    """
+    from selenium.common.exceptions import (InvalidArgumentException, InvalidCookieDomainException,
+                                            UnableToSetCookieException)
+
+    if not os.path.exists(COOKIES_FILE_PATH):
+        return False
     try:
-        if activity_detail.find_element(By.CLASS_NAME, 'status-future'):
-            detail.append('forecast')
-            print('forecast')
-    except selenium.common.exceptions.NoSuchElementException:
+        cookies = serialization.load_file(COOKIES_FILE_PATH)
+    except (serialization.DecodeError, ValueError):
+        print('Saved crop site cookies are unreadable, logging in again.')
+        return False
+
+    for cookie in cookies:
+        # Chrome rejects cookies with an expiry as a float
+        if 'expiry' in cookie:
+            cookie['expiry'] = int(cookie['expiry'])
         try:
-            if activity_detail.find_element(By.CLASS_NAME, 'status-current'):
-                detail.append('actuals')
-                print('actuals')
-        except selenium.common.exceptions.NoSuchElementException:
-            detail.append('not found')
-            print('not found')
-    details.append(detail)
+            driver.add_cookie(cookie)
+        except (InvalidCookieDomainException, InvalidArgumentException, UnableToSetCookieException):
+            # The browser rejected this cookie, e.g. one of another domain, the others may still work
+            continue
+    return bool(cookies)
+
 
-driver.quit()
+def save_cookies(driver) -> None:
+    """
+    Saves the browser's session cookies for the next run.
+    :param driver: WebDriver.
+    """
+    serialization.dump_file(COOKIES_FILE_PATH, driver.get_cookies())
+
+
+def log_in(driver) -> None:
+    """
+    Logs in to the crop site with USER_NAME and PASSWORD.
+    :param driver: WebDriver on the login page.
+    """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions
+
+    email_input = wait_for(driver, expected_conditions.element_to_be_clickable((By.ID, 'email')))
+    email_input.send_keys(helpers.USER_NAME)
+    driver.find_element(By.XPATH, "//span[contains(text(),'Next')]").click()
+
+    pass_input = wait_for(driver, expected_conditions.element_to_be_clickable((By.ID, 'password')))
+    pass_input.send_keys(helpers.PASSWORD)
+    driver.find_element(By.XPATH, "//span[contains(text(),'Log in')]").click()
+
+
+def open_activity_page(driver) -> None:
+    """
+    Opens the crop season page, logging in if the saved session cookies are missing or expired.
+    :param driver: WebDriver.
+    """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions
+
+    summary_loaded = expected_conditions.element_to_be_clickable((By.XPATH, SUMMARY_XPATH))
+    login_loaded = expected_conditions.presence_of_element_located((By.ID, 'email'))
+
+    driver.get(helpers.CROP_URL)
+    if load_cookies(driver):
+        driver.get(helpers.CROP_URL)
+        # The page either loads with the saved session or sends us to the login form
+        wait_for(driver, expected_conditions.any_of(summary_loaded, login_loaded))
+        if driver.find_elements(By.XPATH, SUMMARY_XPATH):
+            return
+        print('Crop site session expired, logging in again.')
+
+    log_in(driver)
+    wait_for(driver, summary_loaded)
+
+
+def get_settled_condition(count, settle_time: float = SETTLE_TIME):
+    """
+    Returns a wait condition that holds once a count of page elements hasn't changed for settle_time seconds.
+    A count of 0 settles too, so a season without activity lines doesn't time out.
+    :param count: Function of the driver returning the number of elements.
+    :param settle_time: Seconds the count has to stay the same.
+    :return: Function of the driver returning True or False.
+    """
+    last_change = {'count': None, 'time': None}
+
+    def settled(driver) -> bool:
+        current = count(driver)
+        now = monotonic()
+        if current != last_change['count']:
+            last_change.update(count=current, time=now)
+            return False
+        return now - last_change['time'] >= settle_time
+
+    return settled
+
+
+def get_rows_settled_condition(settle_time: float = SETTLE_TIME):
+    """
+    Returns a wait condition that holds once the number of activity lines hasn't changed for settle_time seconds.
+    :param settle_time: Seconds the number of lines has to stay the same.
+    :return: Function of the driver returning True or False.
+    """
+    from selenium.webdriver.common.by import By
+
+    return get_settled_condition(lambda driver: len(driver.find_elements(By.CLASS_NAME, ACTIVITY_ROW_CLASS)),
+                                 settle_time)
+
+
+def expand_activities(driver) -> None:
+    """
+    Opens the costs & other income summary and expands every activity list.
+    :param driver: WebDriver on the crop season page.
+    """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions
+
+    wait_for(driver, expected_conditions.element_to_be_clickable((By.XPATH, SUMMARY_XPATH))).click()
+    # A season without activities shows the empty state instead of any activity lists
+    wait_for(driver, expected_conditions.any_of(
+        expected_conditions.presence_of_element_located((By.CLASS_NAME, ACTIVITY_LIST_CLASS)),
+        expected_conditions.presence_of_element_located((By.CLASS_NAME, ACTIVITY_EMPTY_CLASS))))
+    activity_lists = driver.find_elements(By.CLASS_NAME, ACTIVITY_LIST_CLASS)
+
+    for activity_list in activity_lists:
+        wait_for(driver, expected_conditions.element_to_be_clickable(activity_list)).click()
+
+    wait_for(driver, get_rows_settled_condition())
+
+
+def download_snapshot() -> str:
+    """
+    Opens the expanded crop season page in Chrome and returns its page source.
+    :return: Page source, also saved to SNAPSHOT_FILE_PATH.
+    """
+    driver = create_driver()
+    try:
+        open_activity_page(driver)
+        save_cookies(driver)
+        expand_activities(driver)
+        # One snapshot of the expanded page instead of a WebDriver round trip per activity line
+        html_content = driver.page_source
+    finally:
+        driver.quit()
 
-for detail in details:
-    if len(detail) == 6:
-        detail = {
-            ''
-        }
+    with open(SNAPSHOT_FILE_PATH, 'w', encoding='utf-8') as file:
+        file.write(html_content)
+    return html_content
 
-time.sleep(30)
 
-# html_content = driver.page_source
+def convert(snapshot_file_path: str = None) -> None:
+    """
+    Scrapes the crop season's activities and saves them as Transactions/invoices.json.
+    :param snapshot_file_path: Saved page source to parse instead of starting Chrome, e.g. SNAPSHOT_FILE_PATH.
+    """
+    if snapshot_file_path is None:
+        invoices = parse_snapshot(download_snapshot())
+    else:
+        invoices = parse_snapshot_file(snapshot_file_path)
 
-# soup = BeautifulSoup(html_content, 'html.parser')
+    serialization.dump_file(helpers.get_output_path('Transactions', 'invoices.json'), invoices)
+    print(f'{len(invoices)} crop invoices saved.')
 
-# with open('crops.html', 'w', encoding='utf-8') as file:
-#     file.write(soup.prettify())
 
+if __name__ == '__main__':
+    convert()
@@ -1,21 +1,27 @@
 """
 Converts the farm's livestock trackers and transactions into the needed JSON format.
 """
-import json
 import os
-
-from datetime import datetime
+from collections import Counter
+from typing import Iterable
 
 import helpers
+import manifest
+import serialization
+from Accounts import accounts
+
+# Constants
+# API transactions are downloaded to this file in the Livestock output directory while converting
+TRANSACTIONS_DOWNLOAD_FILE_NAME = 'livestock_transactions.download.ndjson'
 
 
 def get_farm_account(uuid: str) -> dict | None:
     """
-    Returns the farm account API request data.
-    :param uuid:
-    :return:
+    Returns the farm account, resolved from the bulk accounts index before falling back to the API.
+    :param uuid: Account UUID.
+    :return: Account dictionary if found, None otherwise.
     """
-    return helpers.get_api('account', path_vars=[uuid])
+    return accounts.get_account(uuid)
 
 
 def get_account_mappings_api(tracker_id: str) -> list | None:
@@ -26,72 +32,64 @@ def get_account_mappings_api(tracker_id: str) -> list | None:
     return helpers.get_api('livestock_account_mappings', path_vars=[tracker_id])
 
 
-def get_list_api(per_page: int = 15) -> list | None:
-    """
-    Returns the livestock list API request data.
-    :return: List of livestock trackers.
-    """
-    return helpers.get_api('livestock_list', {'per_page': per_page}).get('data')
-
-
-def get_transactions_api(per_page: int = 15) -> list | None:
+def get_trackers() -> list:
     """
-    Returns the livestock transactions API request data.
-    :return: List of livestock transactions.
+    Returns every one of the farm's livestock trackers from the API, page by page.
+    :return: List of livestock trackers, raises RuntimeError if a page couldn't be fetched.
     """
-    return helpers.get_api('livestock_transactions', {'per_page': per_page}).get('data')
+    return list(helpers.iter_api('livestock_list'))
 
 
-def get_trackers_total_api() -> int | None:
+def get_transactions_file() -> str | None:
     """
-    Returns the total number of livestock trackers.
-    :return: total livestock trackers.
+    Returns the saved copy of the farm's livestock transactions in any supported format.
+    :return: File path, None if there isn't one.
     """
-    return helpers.get_api('livestock_list', {'per_page': 1}).get('meta').get('total')
+    return serialization.find_file(helpers.join_output_path('Livestock', 'original_livestock.json'))
 
 
-def get_transactions_total_api() -> int | None:
+def iter_transactions_file(file_path: str) -> Iterable[dict]:
     """
-    Returns the total number of livestock transactions.
-    :return: total livestock transactions.
+    Returns the livestock transactions of a file, NDJSON files are streamed line by line.
+    :param file_path: Path to the transactions file.
+    :return: Iterable of livestock transactions.
     """
-    return helpers.get_api('livestock_transactions', {'per_page': 1}).get('meta').get('total')
+    if serialization.get_file_format(file_path) == 'ndjson':
+        return serialization.iter_ndjson(file_path)
+    return serialization.load_file(file_path)
 
 
-def get_trackers() -> list | None:
+def download_transactions(file_path: str) -> None:
     """
-    Returns the farm's livestock trackers from the JSON file or API request.
-    :return: List of livestock trackers.
+    Streams the farm's livestock transactions from the API, page by page, into an NDJSON file.
+    :param file_path: Path to the NDJSON file.
+    :return: Raises RuntimeError if a page couldn't be fetched.
     """
-    return get_list_api(get_trackers_total_api())
+    with open(file_path, 'wb') as file:
+        for transaction in helpers.iter_api('livestock_transactions'):
+            file.write(serialization.dumps(transaction) + b'\n')
 
 
-def get_transactions() -> list | None:
+def transaction_key(transaction: dict) -> frozenset:
     """
-    Returns the farm's livestock transactions from the JSON file or API request.
-    :return: List of livestock transactions.
+    Returns a hashable key of a converted transaction, equal keys mean equal transactions.
+    :param transaction: Converted livestock transaction.
+    :return: Frozenset of the transaction's items.
     """
-    # Check if file exists
-    if not os.path.exists(os.path.join(os.path.dirname(__file__), 'original_livestock.json')):
-        return get_transactions_api(get_transactions_total_api())
-    # Check if file is empty
-    if os.path.getsize(os.path.join(os.path.dirname(__file__), 'original_livestock.json')) == 0:
-        return get_transactions_api(get_transactions_total_api())
-    # Return file contents
-    with open(os.path.join(os.path.dirname(__file__), 'original_livestock.json'), 'r', encoding='utf-8') as file:
-        transactions = json.load(file)
-        return transactions
+    return frozenset(transaction.items())
 
 
-def convert_transactions(transactions: list, trackers: list):
+def convert_transactions(transactions: Iterable[dict], trackers: list):
     """
     NEEDS A REFACTOR
     Converts the farm's livestock transactions from API into the needed JSON format.
-    :param transactions: List of livestock transactions.
+    Each tracker keeps a count of its converted transactions' keys, so duplicate checks run in constant time.
+    :param transactions: Iterable of livestock transactions.
     :param trackers: List of livestock trackers.
     """
     trackers_dict = {}
     trackers_transactions_dict = {}
+    trackers_keys_dict = {}
     for tracker in trackers:
         trackers_dict[tracker.get('id')] = {
             'tracker': tracker.get('name'),
@@ -100,6 +98,7 @@ def convert_transactions(transactions: list, trackers: list):
             }
         }
         trackers_transactions_dict[tracker.get('name')] = []
+        trackers_keys_dict[tracker.get('name')] = Counter()
 
     for transaction in transactions:
         tracker = trackers_dict.get(transaction.get('tracker_id'))
@@ -107,8 +106,7 @@ def convert_transactions(transactions: list, trackers: list):
             continue
         tracker_name = tracker.get('tracker')
         date_string = transaction.get('accrual_date').get('date')
-        date_format = "%Y-%m-%d %H:%M:%S"
-        date_object = datetime.strptime(date_string, date_format)
+        year, month = helpers.get_relative_date(date_string, "%Y-%m-%d %H:%M:%S")
 
         if transaction.get('tracker_id') is None:
             continue
@@ -120,10 +118,13 @@ def convert_transactions(transactions: list, trackers: list):
             continue
 
         if transaction.get('transition') == 'aging_in':
-            trackers_transactions_dict[tracker_name][-1]['TransferIn'] = trackers_dict\
+            last_transaction = trackers_transactions_dict[tracker_name][-1]
+            trackers_keys_dict[tracker_name][transaction_key(last_transaction)] -= 1
+            last_transaction['TransferIn'] = trackers_dict\
                 .get(transaction.get('tracker_id'))\
                 .get('stock_classes')\
                 .get(transaction.get('stock_class_id'))
+            trackers_keys_dict[tracker_name][transaction_key(last_transaction)] += 1
             continue
 
         new_transaction = {
@@ -132,8 +133,8 @@ def convert_transactions(transactions: list, trackers: list):
             .get(transaction.get('stock_class_id')),
             'Transition': transaction.get('transition'),
             'Quantity': transaction.get('quantity'),
-            'Year': date_object.year - helpers.get_current_year(),
-            'Month': date_object.month,
+            'Year': year,
+            'Month': month,
         }
 
         if transaction.get('amount'):
@@ -148,10 +149,10 @@ def convert_transactions(transactions: list, trackers: list):
             find_transaction = new_transaction.copy()
             find_transaction['Type'] = None
 
-            if find_transaction in trackers_transactions_dict[tracker_name]:
+            if trackers_keys_dict[tracker_name][transaction_key(find_transaction)] > 0:
                 find_transaction['Type'] = 'forecast'
 
-                if find_transaction in trackers_transactions_dict[tracker_name]:
+                if trackers_keys_dict[tracker_name][transaction_key(find_transaction)] > 0:
                     continue
 
                 new_transaction['Type'] = 'forecast'
@@ -159,34 +160,48 @@ def convert_transactions(transactions: list, trackers: list):
                 new_transaction['Type'] = None
 
         trackers_transactions_dict[tracker_name].append(new_transaction)
-
-    parent_dir = os.path.dirname(__file__)
+        trackers_keys_dict[tracker_name][transaction_key(new_transaction)] += 1
 
     for tracker, transactions_list in trackers_transactions_dict.items():
-        dir_path = os.path.join(parent_dir, tracker)
-        os.makedirs(dir_path, exist_ok=True)
-        with open(os.path.join(dir_path, 'transactions.json'), 'w', encoding='utf-8') as file:
-            json.dump(transactions_list, file, indent=4)
+        serialization.dump_file(helpers.get_output_path('Livestock', tracker, 'transactions.json'), transactions_list)
 
 
-def convert_trackers(trackers):
+def get_tracker_accounts(tracker: dict) -> tuple:
     """
-    Converts the farm's livestock trackers from API into the needed JSON format.
-    :param trackers: List of livestock trackers.
+    Returns the tracker's purchase and sale accounts.
+    :param tracker: Livestock tracker.
+    :return: Tuple of the purchase and sale account dictionaries.
     """
-    parent_dir = os.path.dirname(__file__)
+    account_mappings = get_account_mappings_api(tracker.get('id'))
 
-    trackers_dict = {}
-    for tracker in trackers:
-        account_mappings = get_account_mappings_api(tracker.get('id'))
+    purchase_uuid = next(item["account_id"] for item in account_mappings if item["transition"] == "purchase")
+    sale_uuid = next(item["account_id"] for item in account_mappings if item["transition"] == "sale")
+
+    return get_farm_account(purchase_uuid), get_farm_account(sale_uuid)
 
-        purchase_uuid = next(item["account_id"] for item in account_mappings if item["transition"] == "purchase")
-        sale_uuid = next(item["account_id"] for item in account_mappings if item["transition"] == "sale")
 
-        purchase_account = get_farm_account(purchase_uuid)
-        sale_account = get_farm_account(sale_uuid)
+def get_trackers_accounts(trackers: list, workers: int = None) -> list:
+    """
+    Returns every tracker's purchase and sale accounts, the account lookups for each tracker are fetched concurrently.
+    :param trackers: List of livestock trackers.
+    :param workers: Maximum number of concurrent lookups, defaults to helpers.API_WORKERS. 1 runs serially.
+    :return: List of (purchase account, sale account) tuples in the same order as the trackers.
+    """
+    return helpers.concurrent_map(get_tracker_accounts, trackers, workers)
 
 
+def convert_trackers(trackers, workers: int = None, trackers_accounts: list = None):
+    """
+    Converts the farm's livestock trackers from API into the needed JSON format.
+    The account lookups for each tracker are fetched concurrently.
+    :param trackers: List of livestock trackers.
+    :param workers: Maximum number of concurrent lookups, defaults to helpers.API_WORKERS. 1 runs serially.
+    :param trackers_accounts: Already fetched accounts from get_trackers_accounts.
+    """
+    trackers_dict = {}
+    if trackers_accounts is None:
+        trackers_accounts = get_trackers_accounts(trackers, workers)
+    for tracker, (purchase_account, sale_account) in zip(trackers, trackers_accounts):
         trackers_dict[tracker.get('name')] = {
             'TrackerType': 'stock',
             'StockTypeUuid': tracker.get('stock_type_id'),
@@ -203,20 +218,51 @@ def convert_trackers(trackers):
             })
 
     for tracker in trackers:
-        dir_path = os.path.join(parent_dir, tracker.get('name'))
-        with open(os.path.join(dir_path, 'tracker.json'), 'w', encoding='utf-8') as file:
-            json.dump(trackers_dict.get(tracker.get('name')), file, indent=4)
+        serialization.dump_file(helpers.get_output_path('Livestock', tracker.get('name'), 'tracker.json'),
+                                trackers_dict.get(tracker.get('name')))
     print('Livestock trackers and transactions converted successfully.')
 
 
 def convert():
     """
     Converts the farm's livestock from API into the needed JSON format.
+    Uses the saved original_livestock transactions if there are some, otherwise the API transactions are
+    downloaded to a temporary NDJSON file. Either way the file is hashed before converting, so unchanged
+    livestock is skipped like the other stages, and the transactions are streamed from it.
     """
-    transactions = get_transactions()
-    trackers = get_list_api()
-    if transactions is not None and trackers is not None:
-        convert_transactions(transactions, trackers)
-        convert_trackers(trackers)
-    else:
-        print('Could not get transactions or trackers.')
+    try:
+        trackers = get_trackers()
+    except RuntimeError as e:
+        print('Could not get trackers:', e)
+        return
+
+    trackers_accounts = get_trackers_accounts(trackers)
+
+    file_path = get_transactions_file()
+    download_path = None
+    if file_path is None:
+        download_path = file_path = helpers.get_output_path('Livestock', TRANSACTIONS_DOWNLOAD_FILE_NAME)
+
+    try:
+        if download_path is not None:
+            download_transactions(download_path)
+
+        inputs_hash = manifest.get_inputs_hash('livestock', __file__, [trackers, trackers_accounts],
+                                               input_files=[file_path])
+        if manifest.is_unchanged('livestock', inputs_hash):
+            print('Livestock unchanged, skipping conversion.')
+            return
+
+        convert_transactions(iter_transactions_file(file_path), trackers)
+    except RuntimeError as e:
+        print('Could not get transactions:', e)
+        return
+    finally:
+        if download_path is not None and os.path.exists(download_path):
+            os.remove(download_path)
+
+    convert_trackers(trackers, trackers_accounts=trackers_accounts)
+    manifest.record('livestock', inputs_hash, [
+        helpers.get_output_path('Livestock', tracker.get('name'), file_name)
+        for tracker in trackers for file_name in ['transactions.json', 'tracker.json']
+    ])
@@ -0,0 +1,406 @@
+"""
+Local stand-in for the Figured API, serving synthetic farms from Benchmarks/synthetic.py.
+- OAuth2 token endpoint with configurable token expiry
+- Accounts, livestock and cashflow endpoints used by helpers.get_url
+- Configurable latency, rate limiting and 429/5xx injection
+- ETag revalidation and gzip responses
+Run from the repository root: python -m MockServer.server --port 8765
+"""
+import argparse
+import gzip
+import hashlib
+import random
+import re
+import secrets
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep, time
+from urllib.parse import parse_qs, urlsplit
+
+import serialization
+from Benchmarks import synthetic
+
+# Constants
+DEFAULT_PORT = 8765
+DEFAULT_PER_PAGE = 15
+GZIP_MIN_BYTES = 1024
+ROUTES = [
+    ('accounts', re.compile(r'^/farms/(?P<farm>[^/]+)/accounts$')),
+    ('account', re.compile(r'^/farms/(?P<farm>[^/]+)/account/(?P<uuid>[^/]+)$')),
+    ('livestock_list', re.compile(r'^/farms/(?P<farm>[^/]+)/livestock/trackers$')),
+    ('livestock_transactions', re.compile(r'^/farms/(?P<farm>[^/]+)/livestock/transactions$')),
+    ('livestock_account_mappings', re.compile(r'^/farms/(?P<farm>[^/]+)/livestock/(?P<tracker>[^/]+)/account_mappings$')),
+    ('cashflow', re.compile(r'^/farms/(?P<farm>[^/]+)/reports/cashflow$')),
+]
+
+# Global Variables
+CONFIG = {
+    'scale': 1,
+    'latency': 0.0,
+    'jitter': 0.0,
+    'error_rate': 0.0,
+    'rate_limit': 0.0,
+    'token_ttl': 3600,
+    'require_auth': True,
+}
+TOKENS = {}
+REFRESH_TOKENS = set()
+STATS = {
+    'requests': 0,
+    'endpoints': {},
+    'statuses': {},
+}
+RATE_LIMIT_STATE = {'tokens': 0.0, 'updated_at': time()}
+LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=32)
+def get_farm(farm_id: str) -> dict:
+    """
+    Returns the synthetic farm for a shortcode, every shortcode gets its own farm.
+    :param farm_id: Farm shortcode.
+    :return: Dictionary of the farm's accounts, trackers, account mappings and livestock transactions.
+    """
+    seed = int(hashlib.sha256(farm_id.encode('utf-8')).hexdigest()[:8], 16)
+    scale = CONFIG['scale']
+    accounts = synthetic.generate_accounts(scale, seed)
+    trackers = synthetic.generate_trackers(scale, seed)
+    return {
+        'seed': seed,
+        'accounts': accounts,
+        'trackers': trackers,
+        'account_mappings': synthetic.generate_account_mappings(trackers, accounts, seed),
+        'livestock_transactions': synthetic.generate_livestock_transactions(trackers, scale, seed),
+    }
+
+
+@lru_cache(maxsize=256)
+def get_cashflow(farm_id: str, data_type: str, date_end: str, compare: int) -> dict:
+    """
+    Returns the synthetic cashflow report of a farm's report window.
+    :param farm_id: Farm shortcode.
+    :param data_type: 'actuals' or 'forecast'
+    :param date_end: Last month of the report, e.g. '2025-12'.
+    :param compare: Number of months before date_end in the report.
+    :return: Dictionary of the cashflow report.
+    """
+    farm = get_farm(farm_id)
+    return synthetic.generate_cashflow_report(farm['accounts'], CONFIG['scale'], farm['seed'],
+                                              data_type, date_end, compare)
+
+
+def issue_token() -> dict:
+    """
+    Creates an access token that expires after CONFIG['token_ttl'] seconds.
+    :return: Token dictionary in the OAuth2 token response format.
+    """
+    access_token = secrets.token_urlsafe(24)
+    refresh_token = secrets.token_urlsafe(24)
+    expires_at = time() + CONFIG['token_ttl']
+    with LOCK:
+        TOKENS[access_token] = expires_at
+        REFRESH_TOKENS.add(refresh_token)
+    return {
+        'access_token': access_token,
+        'refresh_token': refresh_token,
+        'token_type': 'Bearer',
+        'expires_in': CONFIG['token_ttl'],
+        'expires_at': expires_at,
+    }
+
+
+def is_authorised(authorization: str | None) -> bool:
+    """
+    Checks if the Authorization header has an issued, unexpired access token.
+    :param authorization: Authorization header value.
+    :return: True or False
+    """
+    if not CONFIG['require_auth']:
+        return True
+    if not authorization or not authorization.startswith('Bearer '):
+        return False
+    with LOCK:
+        expires_at = TOKENS.get(authorization[len('Bearer '):])
+    return expires_at is not None and expires_at > time()
+
+
+def is_rate_limited() -> bool:
+    """
+    Takes a request from the token bucket of CONFIG['rate_limit'] requests per second.
+    :return: True if the request is over the rate limit, False otherwise.
+    """
+    rate = CONFIG['rate_limit']
+    if rate <= 0:
+        return False
+    with LOCK:
+        now = time()
+        # Allows bursts of up to a second's worth of requests
+        tokens = RATE_LIMIT_STATE['tokens'] + (now - RATE_LIMIT_STATE['updated_at']) * rate
+        RATE_LIMIT_STATE['tokens'] = min(max(rate, 1), tokens)
+        RATE_LIMIT_STATE['updated_at'] = now
+        if RATE_LIMIT_STATE['tokens'] < 1:
+            return True
+        RATE_LIMIT_STATE['tokens'] -= 1
+        return False
+
+
+def count(endpoint: str, status: int) -> None:
+    """
+    Counts a served request.
+    :param endpoint: API type or path.
+    :param status: Response status code.
+    """
+    with LOCK:
+        STATS['requests'] += 1
+        STATS['endpoints'][endpoint] = STATS['endpoints'].get(endpoint, 0) + 1
+        STATS['statuses'][str(status)] = STATS['statuses'].get(str(status), 0) + 1
+
+
+def get_stats() -> dict:
+    """
+    Returns a copy of the request counters.
+    :return: Dictionary of counters.
+    """
+    with LOCK:
+        return serialization.loads(serialization.dumps(STATS))
+
+
+def paginate(records: list, query: dict) -> dict:
+    """
+    Returns a page of the records with the meta the client paginates on.
+    :param records: All records.
+    :param query: Parsed query parameters with optional page and per_page.
+    :return: Dictionary of 'data' and 'meta'.
+    """
+    per_page = max(int(query.get('per_page', DEFAULT_PER_PAGE)), 1)
+    page = max(int(query.get('page', 1)), 1)
+    start = (page - 1) * per_page
+    return {
+        'data': records[start:start + per_page],
+        'meta': {
+            'current_page': page,
+            'per_page': per_page,
+            'total': len(records),
+            'last_page': max(-(-len(records) // per_page), 1),
+        },
+    }
+
+
+def route(path: str, query: dict) -> tuple:
+    """
+    Returns the response of an API request.
+    :param path: Request path.
+    :param query: Parsed query parameters.
+    :return: Tuple of (API type or None, status code, JSON serialisable body).
+    """
+    for api_type, pattern in ROUTES:
+        found = pattern.match(path)
+        if found is None:
+            continue
+        farm = get_farm(found.group('farm'))
+
+        match api_type:
+            case 'accounts':
+                return api_type, 200, farm['accounts']
+            case 'account':
+                account = farm['accounts'].get(found.group('uuid'))
+                return (api_type, 200, account) if account else (api_type, 404, {'message': 'Account not found.'})
+            case 'livestock_list':
+                return api_type, 200, paginate(farm['trackers'], query)
+            case 'livestock_transactions':
+                return api_type, 200, paginate(farm['livestock_transactions'], query)
+            case 'livestock_account_mappings':
+                mappings = farm['account_mappings'].get(found.group('tracker'))
+                return (api_type, 200, mappings) if mappings else (api_type, 404, {'message': 'Tracker not found.'})
+            case 'cashflow':
+                return api_type, 200, get_cashflow(found.group('farm'), query.get('data_type', 'actuals'),
+                                                   query.get('date_end'),
+                                                   int(query.get('compare', synthetic.CASHFLOW_COMPARE)))
+
+    return None, 404, {'message': 'Not found.'}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the mock API.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body, headers: dict = None):
+        """
+        Sends a JSON response.
+        :param status: Status code.
+        :param body: JSON serialisable body, None for no body.
+        :param headers: Extra response headers.
+        """
+        self.send_content(status, b'' if body is None else serialization.dumps(body), headers)
+
+    def send_content(self, status: int, content: bytes, headers: dict = None):
+        """
+        Sends an encoded JSON response, gzipped when the client accepts it.
+        :param status: Status code.
+        :param content: Encoded body.
+        :param headers: Extra response headers.
+        """
+        headers = dict(headers or {})
+        if content:
+            headers['Content-Type'] = 'application/json'
+        if len(content) >= GZIP_MIN_BYTES and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            content = gzip.compress(content, compresslevel=1)
+            headers['Content-Encoding'] = 'gzip'
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def inject_faults(self, endpoint: str) -> bool:
+        """
+        Applies the configured latency, rate limit and error injection.
+        :param endpoint: API type or path, for the counters.
+        :return: True if a fault response was sent, False if the request should be served.
+        """
+        delay = CONFIG['latency'] + random.uniform(0, CONFIG['jitter'])
+        if delay > 0:
+            sleep(delay)
+        if is_rate_limited():
+            count(endpoint, 429)
+            self.send_json(429, {'message': 'Too many requests.'}, {'Retry-After': '1'})
+            return True
+        if CONFIG['error_rate'] > 0 and random.random() < CONFIG['error_rate']:
+            status = random.choice([500, 502, 503])
+            count(endpoint, status)
+            self.send_json(status, {'message': 'Injected server error.'})
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if url.path == '/_stats':
+            self.send_json(200, get_stats())
+            return
+        if url.path == '/oauth/authorize':
+            self.send_json(200, {'code': 'mock-authorization-code', 'state': query.get('state')})
+            return
+
+        api_type, status, body = route(url.path, query)
+        endpoint = api_type or url.path
+        if self.inject_faults(endpoint):
+            return
+        if not is_authorised(self.headers.get('Authorization')):
+            count(endpoint, 401)
+            self.send_json(401, {'message': 'Unauthenticated.'})
+            return
+
+        content = serialization.dumps(body)
+        etag = '"' + hashlib.sha256(content).hexdigest()[:32] + '"'
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            count(endpoint, 304)
+            self.send_json(304, None, {'ETag': etag})
+            return
+        count(endpoint, status)
+        self.send_content(status, content, {'ETag': etag} if status == 200 else None)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        form = {key: values[-1] for key, values in parse_qs(self.rfile.read(length).decode('utf-8')).items()}
+
+        if url.path != '/oauth/token':
+            count(url.path, 404)
+            self.send_json(404, {'message': 'Not found.'})
+            return
+        if self.inject_faults('token'):
+            return
+
+        grant_type = form.get('grant_type')
+        if grant_type == 'refresh_token':
+            with LOCK:
+                valid = form.get('refresh_token') in REFRESH_TOKENS
+                REFRESH_TOKENS.discard(form.get('refresh_token'))
+            if not valid:
+                count('token', 400)
+                self.send_json(400, {'error': 'invalid_grant'})
+                return
+        elif grant_type not in ('authorization_code', 'client_credentials'):
+            count('token', 400)
+            self.send_json(400, {'error': 'unsupported_grant_type'})
+            return
+
+        count('token', 200)
+        self.send_json(200, issue_token())
+
+
+def create_server(host: str = '127.0.0.1', port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """
+    Creates the mock API server, port 0 picks a free port.
+    :param host: Interface to listen on.
+    :param port: Port to listen on.
+    :return: Server, call serve_forever() to start it.
+    """
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    return server
+
+
+def parse_args(args: list = None) -> argparse.Namespace:
+    """
+    Parses the command line arguments.
+    :param args: Arguments, defaults to sys.argv.
+    :return: Parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description='Run a local mock of the Figured API with synthetic farms.')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on.')
+    parser.add_argument('--scale', type=int, default=1, help='Farm size multiplier of the synthetic farms.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response.')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra seconds, up to this value.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 5xx.')
+    parser.add_argument('--rate-limit', type=float, default=0.0,
+                        help='Requests per second before answering with a 429, 0 for no limit.')
+    parser.add_argument('--token-ttl', type=int, default=3600, help='Seconds until an access token expires.')
+    parser.add_argument('--no-auth', action='store_true', help='Accept requests without a valid access token.')
+    parser.add_argument('--oauth-file', help='Write a freshly issued token to this file, e.g. OAuth2/oauth.json.')
+    return parser.parse_args(args)
+
+
+def main(args: list = None):
+    """
+    Runs the mock API server until interrupted.
+    :param args: Arguments, defaults to sys.argv.
+    """
+    args = parse_args(args)
+    CONFIG.update({
+        'scale': args.scale,
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'error_rate': args.error_rate,
+        'rate_limit': args.rate_limit,
+        'token_ttl': args.token_ttl,
+        'require_auth': not args.no_auth,
+    })
+    RATE_LIMIT_STATE['tokens'] = args.rate_limit
+
+    if args.oauth_file:
+        serialization.dump_file(args.oauth_file, issue_token())
+
+    server = create_server(args.host, args.port)
+    print(f'Mock API listening on http://{args.host}:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
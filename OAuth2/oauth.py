@@ -2,25 +2,43 @@
 OAuth2 authentication process.
 """
 import getpass
-import json
 import os
 import signal
-
-from requests import HTTPError, Timeout
-from requests_oauthlib import OAuth2Session
+import threading
+from contextlib import contextmanager
+from time import perf_counter, time
+from typing import TYPE_CHECKING
 
 import helpers
+import serialization
+import telemetry
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+if TYPE_CHECKING:
+    from requests_oauthlib import OAuth2Session
 
 # Constants
 OAUTH_FILE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'oauth.json'))
+OAUTH_LOCK_FILE_PATH = OAUTH_FILE_PATH + '.lock'
+REFRESH_MARGIN = int(os.environ.get('OAUTH_REFRESH_MARGIN', 300))
+REFRESHER_MIN_INTERVAL = 1
+REFRESHER_MAX_INTERVAL = 300
+REFRESHER_RETRY_INTERVAL = 30
 AUTH_ERROR_MESSAGE = 'An error occurred during the authorization process:'
 OAUTH_OBJ_ERROR_MESSAGE = 'Error creating OAuth2Session object:'
 
 # Non-local Variables
 oauth_session = None
+refresher_thread = None
+TOKEN_LOCK = threading.Lock()
+REFRESHER_STOP = threading.Event()
 
 
-def get_oauth_session() -> OAuth2Session | None:
+def get_oauth_session() -> 'OAuth2Session | None':
     """
     Returns an OAuth2 session object.
     :return: OAuth2 session object.
@@ -29,6 +47,9 @@ def get_oauth_session() -> OAuth2Session | None:
     if oauth_session is not None:
         return oauth_session
 
+    # requests_oauthlib is only imported when the API is used
+    from requests_oauthlib import OAuth2Session
+
     try:
         oauth_session = OAuth2Session(
             helpers.CLIENT_ID,
@@ -71,6 +92,8 @@ def get_access_token() -> dict | None:
     Fetches an OAuth2 access token for the application.
     :return: Token dictionary if successful, None otherwise.
     """
+    from requests import HTTPError, Timeout
+
     oauth = get_oauth_session()
     authorization_url, state = oauth.authorization_url(helpers.AUTH_URL)
     print('Please go to the following URL and authorize the application:', authorization_url)
@@ -85,17 +108,129 @@ def get_access_token() -> dict | None:
         return None
 
 
-def refresh_token():
+@contextmanager
+def oauth_file_lock():
     """
-    Refreshes the OAuth2 access token.
+    Context manager. Holds an exclusive lock on the OAuth JSON file shared by every process of the tool.
+    No-op on platforms without fcntl.
     """
-    oauth = get_oauth_session()
-    token = oauth.refresh_token(helpers.TOKEN_URL,
-                                client_id=helpers.CLIENT_ID,
-                                client_secret=helpers.CLIENT_SECRET,
-                                refresh_token=helpers.get_oauth_details().get('refresh_token'))
-    helpers.reset_oauth_details()
-    save_oauth_details(token)
+    if fcntl is None:
+        yield
+        return
+    with open(OAUTH_LOCK_FILE_PATH, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_refresh_at(token: dict) -> float:
+    """
+    Returns when the access token should be refreshed: REFRESH_MARGIN seconds before it expires,
+    or halfway through its lifetime for short-lived tokens.
+    :param token: Token dictionary.
+    :return: Unix timestamp.
+    """
+    lifetime = token.get('expires_in') or 2 * REFRESH_MARGIN
+    return token.get('expires_at', 0) - min(REFRESH_MARGIN, lifetime / 2)
+
+
+def needs_refresh(token: dict | None, failed_token: str = None) -> bool:
+    """
+    Checks if the saved token still has to be refreshed.
+    :param token: Saved token dictionary.
+    :param failed_token: Access token to replace, e.g. one the API rejected. Only refreshed if it's still the saved one.
+    :return: True or False
+    """
+    if token is None:
+        return False
+    if failed_token is not None:
+        return token.get('access_token') == failed_token
+    return get_refresh_at(token) <= time()
+
+
+def refresh_token(force: bool = False, failed_token: str = None) -> bool:
+    """
+    Refreshes the OAuth2 access token when it's close to expiring.
+    Concurrent calls are coalesced: threads wait on TOKEN_LOCK and processes on the OAuth file lock,
+    then re-read the saved token and skip the refresh if another caller already replaced it.
+    :param force: Refresh even if the token isn't close to expiring.
+    :param failed_token: Access token the API rejected, see needs_refresh.
+    :return: True if this call refreshed the token, False otherwise.
+    """
+    if force and failed_token is None:
+        # A forced refresh replaces the current token, unless another caller replaces it first
+        details = helpers.get_oauth_details()
+        failed_token = details.get('access_token') if details is not None else None
+
+    with TOKEN_LOCK:
+        if not needs_refresh(helpers.get_oauth_details(), failed_token):
+            return False
+
+        with oauth_file_lock():
+            # Another process may have refreshed the token while this one waited for the lock
+            helpers.reset_oauth_details()
+            details = helpers.get_oauth_details()
+            if not needs_refresh(details, failed_token):
+                return False
+
+            oauth = get_oauth_session()
+            start = perf_counter()
+            try:
+                token = oauth.refresh_token(helpers.TOKEN_URL,
+                                            client_id=helpers.CLIENT_ID,
+                                            client_secret=helpers.CLIENT_SECRET,
+                                            refresh_token=details.get('refresh_token'))
+            except Exception:
+                telemetry.record_request('token', 'error', perf_counter() - start)
+                raise
+            telemetry.record_request('token', 200, perf_counter() - start)
+            save_oauth_details(token)
+            helpers.reset_oauth_details()
+
+    return True
+
+
+def run_token_refresher():
+    """
+    Refreshes the access token ahead of expiry until stop_token_refresher is called. Runs in a background thread.
+    """
+    while not REFRESHER_STOP.is_set():
+        details = helpers.get_oauth_details()
+        if details is None:
+            return
+        delay = min(max(get_refresh_at(details) - time(), REFRESHER_MIN_INTERVAL), REFRESHER_MAX_INTERVAL)
+        if REFRESHER_STOP.wait(delay):
+            return
+        try:
+            refresh_token()
+        except Exception as e:
+            print('Error refreshing the access token:', e)
+            REFRESHER_STOP.wait(REFRESHER_RETRY_INTERVAL)
+
+
+def start_token_refresher():
+    """
+    Starts the background token refresher if it isn't running.
+    """
+    global refresher_thread
+
+    with TOKEN_LOCK:
+        if refresher_thread is not None and refresher_thread.is_alive():
+            return
+        REFRESHER_STOP.clear()
+        refresher_thread = threading.Thread(target=run_token_refresher, name='token-refresher', daemon=True)
+        refresher_thread.start()
+
+
+def stop_token_refresher():
+    """
+    Stops the background token refresher.
+    """
+    REFRESHER_STOP.set()
+    if refresher_thread is not None:
+        refresher_thread.join(timeout=5)
 
 
 def save_oauth_details(token, file_path=os.path.join(os.path.dirname(__file__), 'oauth.json')):
@@ -104,8 +239,7 @@ def save_oauth_details(token, file_path=os.path.join(os.path.dirname(__file__),
     :param token: The token to save.
     :param file_path: Filepath to JSON file.
     """
-    with open(file_path, 'w') as file:
-        json.dump(token, file, ensure_ascii=True, indent=4)
+    serialization.dump_file(file_path, dict(token))
 
 
 def initialise_oauth2():
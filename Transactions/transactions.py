@@ -2,11 +2,24 @@
 Converts the farm's transactions into the needed JSON format.
 """
 
-import json
 import os
-from datetime import datetime
+from importlib.util import find_spec
+from typing import Iterator
 
+import config
 import helpers
+import manifest
+import serialization
+
+# Optional dependencies, imported where they're used so commands that don't convert cashflows don't load them
+HAS_IJSON = find_spec('ijson') is not None
+# The NumPy conversion is opt in with CASHFLOW_NUMPY=1, building the transaction dictionaries dominates
+# and the pure Python conversion is faster on synthetic farms of every size
+HAS_NUMPY = find_spec('numpy') is not None \
+            and config.get('CASHFLOW_NUMPY', '0').lower() not in ('0', 'false', 'no', '')
+
+CASHFLOW_COMPARE = 60
+CASHFLOW_DATA_TYPES = ['actuals', 'forecast']
 
 REVENUE_ACCOUNT_CODES = set()
 EQUITY_ACCOUNT_CODES = set()
@@ -19,10 +32,8 @@ def get_rev_equity_codes():
     global REVENUE_ACCOUNT_CODES
     global EQUITY_ACCOUNT_CODES
 
-    with open(os.path.join('Accounts/revenue.json'), 'r', encoding='utf-8') as file:
-        REVENUE_ACCOUNT_CODES = set(json.load(file))
-    with open(os.path.join('Accounts/equity.json'), 'r', encoding='utf-8') as file:
-        EQUITY_ACCOUNT_CODES = set(json.load(file))
+    REVENUE_ACCOUNT_CODES = set(serialization.load_file(helpers.get_output_path('Accounts', 'revenue.json')))
+    EQUITY_ACCOUNT_CODES = set(serialization.load_file(helpers.get_output_path('Accounts', 'equity.json')))
 
 
 def get_cashflow_api(data_type: str) -> dict:
@@ -30,28 +41,205 @@ def get_cashflow_api(data_type: str) -> dict:
     Returns the cashflow report API request data.
     :return: Dictionary of the cashflow report for dates two years in the future to two years in the past. e.g.: Currently it's 2023-06. Cashflow period: 2020-12 - 2025-12
     """
+    return get_cashflows_api([data_type]).get(data_type)
+
+
+def get_cashflows_api(data_types: list) -> dict:
+    """
+    Returns the cashflow reports for each data type.
+    The 60 month report window is split into shards of about helpers.CASHFLOW_SHARD_MONTHS months,
+    every shard of every data type is requested concurrently and the shards are merged back into one report.
+    :param data_types: list of data types, e.g. ['actuals', 'forecast']
+    :return: Dictionary of data type: cashflow report, the report is None if any of its shards failed.
+    """
     date_string = f'{helpers.get_current_year() + 2}-12'
+    shards = get_cashflow_shards(date_string, CASHFLOW_COMPARE, helpers.CASHFLOW_SHARD_MONTHS)
+    shard_requests = [(data_type, shard_end, compare) for data_type in data_types for shard_end, compare in shards]
+
+    reports = helpers.concurrent_map(lambda request: get_cashflow_shard_api(*request), shard_requests)
+
+    return {
+        data_type: merge_cashflows([report for request, report in zip(shard_requests, reports) if request[0] == data_type])
+        for data_type in data_types
+    }
+
+
+def get_cashflow_shard_api(data_type: str, date_end: str, compare: int) -> dict | None:
+    """
+    Returns the cashflow report API request data for the months up to date_end.
+    :param data_type: 'actuals' or 'forecast'
+    :param date_end: last month of the report, e.g. '2025-12'
+    :param compare: number of months before date_end in the report
+    :return: Dictionary of the cashflow report
+    """
     query = {
-        'compare': 60,
-        'date_start': date_string,
-        'date_end': date_string,
+        'compare': compare,
+        'date_start': date_end,
+        'date_end': date_end,
         'data_type': data_type
     }
 
     return helpers.get_api('cashflow', query)
 
 
+def get_cashflow_shards(date_end: str, compare: int, shard_months: int) -> list:
+    """
+    Splits a cashflow report window into evenly sized shards.
+    :param date_end: last month of the report, e.g. '2025-12'
+    :param compare: number of months before date_end in the report
+    :param shard_months: maximum number of months in a shard, 0 or less for a single shard
+    :return: list of (date_end, compare) tuples, oldest first
+    """
+    months = compare + 1
+    if shard_months <= 0:
+        shard_months = months
+    shard_count = -(-months // shard_months)
+
+    year, month = (int(part) for part in date_end.split('-'))
+    end_index = year * 12 + month - 1
+    shards = []
+
+    for shard in range(shard_count):
+        size = months // shard_count + (1 if shard < months % shard_count else 0)
+        shards.append((f'{end_index // 12}-{end_index % 12 + 1:02d}', size - 1))
+        end_index -= size
+
+    return list(reversed(shards))
+
+
+def merge_cashflows(reports: list) -> dict | None:
+    """
+    Merges cashflow report shards into a single report with the same shape.
+    Periods and section totals are combined by date, sections by name, rows by their account and row data by date.
+    Other values are taken from the first shard.
+    :param reports: list of cashflow reports, oldest first
+    :return: Dictionary of the cashflow report, None if any shard is missing
+    """
+    if not reports or any(report is None for report in reports):
+        return None
+
+    merged = dict(reports[0])
+    merged['data'] = {**reports[0].get('data', {}), 'period': {}, 'sections': {}}
+
+    for report in reports:
+        data = report.get('data', {})
+        merge_by_date(merged['data']['period'], data.get('period') or {})
+        merge_sections(merged['data']['sections'], data.get('sections') or {})
+
+    return merged
+
+
+def merge_sections(target: dict, sections: dict) -> dict:
+    """
+    Recursive. Adds a shard's sections to the merged sections.
+    :param target: merged sections, dictionary of section name: section
+    :param sections: shard's sections
+    :return: the target dictionary
+    """
+    for name, section in sections.items():
+        merged = target.setdefault(name, {key: value for key, value in section.items()
+                                          if key not in ('totals', 'rows', 'sections')})
+        if section.get('totals') is not None:
+            merge_by_date(merged.setdefault('totals', {}), section.get('totals'))
+        if section.get('rows') is not None:
+            merge_rows(merged.setdefault('rows', {}), section.get('rows'))
+        if section.get('sections') is not None:
+            merge_sections(merged.setdefault('sections', {}), section.get('sections'))
+    return target
+
+
+def merge_rows(target: dict, rows: dict) -> dict:
+    """
+    Adds a shard's rows to the merged rows of a section, matching them by account instead of by row key.
+    Row keys are positions, so they point to other accounts once an account is added or removed within the report.
+    A row of an account only some shards have is added under its own key, renamed if another account has it.
+    :param target: merged rows, dictionary of row key: row
+    :param rows: shard's rows
+    :return: the target dictionary
+    """
+    keys = dict(zip(iter_row_identities(target), target))
+
+    for identity, (key, row) in zip(iter_row_identities(rows), rows.items()):
+        if identity in keys:
+            merge_by_date(target[keys[identity]]['data'], row.get('data') or {})
+            continue
+
+        new_key = key
+        while new_key in target:
+            new_key = f'{new_key}+'
+        target[new_key] = {**row, 'data': dict(row.get('data') or {})}
+        keys[identity] = new_key
+    return target
+
+
+def iter_row_identities(rows: dict) -> Iterator[tuple]:
+    """
+    Generator. Yields the identity of each row, numbering the rows of an account that has several in the section.
+    :param rows: dictionary of row key: row
+    :return: iterator of (account code, account name, number of earlier rows of the account) tuples
+    """
+    seen = {}
+    for row in rows.values():
+        identity = get_row_identity(row)
+        seen[identity] = seen.get(identity, -1) + 1
+        yield *identity, seen[identity]
+
+
+def get_row_identity(row: dict) -> tuple:
+    """
+    Returns the account a cashflow report row belongs to.
+    :param row: cashflow report row
+    :return: tuple: (account code, account name)
+    """
+    return row.get('account_code'), row.get('account_name')
+
+
+def merge_by_date(target: dict, values: dict) -> dict:
+    """
+    Adds a shard's values to the merged values, the first shard with a date wins.
+    :param target: merged values, dictionary of date: value
+    :param values: shard's values, e.g. a row's data or a section's totals
+    :return: the target dictionary
+    """
+    for date, value in values.items():
+        target.setdefault(date, value)
+    return target
+
+
 def create_cashflows():
     """
     Generates the cashflow files using the cashflow report API.
+    The files are intermediates, written in serialization.INTERMEDIATE_FORMAT.
+    The reports are downloaded and their shards merged in memory, only converting the files is streamed.
+    Raises RuntimeError without writing any file if a report couldn't be downloaded, so the stage fails.
+    """
+    cashflows = get_cashflows_api(CASHFLOW_DATA_TYPES)
+    failed = [data_type for data_type in CASHFLOW_DATA_TYPES if cashflows.get(data_type) is None]
+    if failed:
+        raise RuntimeError(f"Could not get the {', '.join(failed)} cashflow report.")
+    helpers.get_output_dir('Transactions')
+
+    for data_type in CASHFLOW_DATA_TYPES:
+        serialization.dump_file(get_cashflow_file_path(data_type), cashflows.get(data_type),
+                                serialization.INTERMEDIATE_FORMAT)
+
+
+def get_cashflow_file_path(data_type: str) -> str:
     """
-    actuals_cashflow = get_cashflow_api('actuals')
-    forecast_cashflow = get_cashflow_api('forecast')
+    Returns the path of a x_cashflow file in the intermediate format.
+    :param data_type: 'actuals' or 'forecast'
+    :return: file path, e.g. Transactions/actuals_cashflow.json
+    """
+    return serialization.get_intermediate_path(helpers.join_output_path('Transactions', f'{data_type}_cashflow.json'))
+
 
-    with open(os.path.join(os.path.dirname(__file__), 'actuals_cashflow.json'), 'w', encoding='utf-8') as file:
-        json.dump(actuals_cashflow, file, indent=4)
-    with open(os.path.join(os.path.dirname(__file__), 'forecast_cashflow.json'), 'w', encoding='utf-8') as file:
-        json.dump(forecast_cashflow, file, indent=4)
+def get_cashflow_file_paths() -> list:
+    """
+    Returns the paths of the existing x_cashflow files.
+    :return: list of file paths
+    """
+    return [file_path for file_path in map(get_cashflow_file_path, CASHFLOW_DATA_TYPES)
+            if os.path.isfile(file_path)]
 
 
 def get_json_transactions() -> list:
@@ -62,11 +250,8 @@ def get_json_transactions() -> list:
     create_cashflows()
     json_data = []
 
-    for file_name in os.listdir(os.path.dirname(__file__)):
-        if file_name.endswith('cashflow.json'):
-            file_path = os.path.join(os.path.dirname(__file__), file_name)
-            with open(file_path, 'r', encoding='utf-8') as file:
-                json_data.append(json.load(file).get('data'))
+    for file_path in get_cashflow_file_paths():
+        json_data.append(serialization.load_file(file_path).get('data'))
 
     return json_data
 
@@ -76,43 +261,113 @@ def create_transactions_from_row(rows: dict, periods: dict) -> list:
     Reformats a cashflow report's row into demo farm template transaction objects.
     :return: list of formatted transaction dicts for the row
     """
-    global REVENUE_ACCOUNT_CODES
-    global EQUITY_ACCOUNT_CODES
-    transactions = []
-    for row in rows.values():
-        account = row.get('account_code') or row.get('account_name')
+    return list(iter_transactions_from_row(rows, periods))
 
-        try:
-            inv_account = account in REVENUE_ACCOUNT_CODES \
-                          or account in EQUITY_ACCOUNT_CODES \
-                          or int(account) in REVENUE_ACCOUNT_CODES \
-                          or int(account) in EQUITY_ACCOUNT_CODES
-        except ValueError:
-            # Error comes from int(account) if account is a string
-            inv_account = False
+
+def iter_transactions_from_row(rows: dict, periods: dict, period_table: dict = None) -> Iterator[dict]:
+    """
+    Generator. Reformats a cashflow report's row into demo farm template transaction objects.
+    Uses the NumPy backed path when NumPy is installed and CASHFLOW_NUMPY is turned on.
+    :param rows: cashflow report section's rows
+    :param periods: cashflow report's periods
+    :param period_table: period table from helpers.build_period_table, built from the periods if not given
+    :return: iterator of formatted transaction dicts for the row
+    """
+    if period_table is None:
+        period_table = helpers.build_period_table(periods)
+
+    if HAS_NUMPY:
+        yield from iter_transactions_from_row_vectorized(rows, period_table)
+        return
+
+    for row in rows.values():
+        account, inv_account = get_row_account(row)
 
         for data in row.get('data').values():
-            date = data.get('date')
             amount = float(data.get('value'))
-            datetime_date = datetime.strptime(date, '%Y-%m')
-            year = datetime_date.year - helpers.get_current_year()
 
             if amount == 0:
                 continue
-            if account in {'', None}:
-                account = row.get('account_name')
             if inv_account:
                 amount = 0 - amount
 
-            transactions.append({
-                'Type': periods.get(date).get('data_type').capitalize(),
+            transaction_type, year, month = period_table[data.get('date')]
+            yield {
+                'Type': transaction_type,
                 'Account': account,
                 'Amount': amount,
                 'Year': year,
-                'Month': datetime.strptime(date, '%Y-%m').month,
-            })
+                'Month': month,
+            }
 
-    return transactions
+
+def iter_transactions_from_row_vectorized(rows: dict, period_table: dict) -> Iterator[dict]:
+    """
+    Generator. NumPy backed version of iter_transactions_from_row.
+    Gathers every value of the rows into one array, applies the zero filter and the
+    revenue/equity sign flip as array operations and only builds the remaining transactions.
+    :param rows: cashflow report section's rows
+    :param period_table: period table from helpers.build_period_table
+    :return: iterator of formatted transaction dicts for the rows
+    """
+    accounts = []
+    signs = []
+    counts = []
+    dates = []
+    values = []
+
+    for row in rows.values():
+        account, inv_account = get_row_account(row)
+        row_data = row.get('data').values()
+        accounts.append(account)
+        signs.append(-1.0 if inv_account else 1.0)
+        counts.append(len(row_data))
+        for data in row_data:
+            dates.append(data.get('date'))
+            values.append(data.get('value'))
+
+    if not values:
+        return
+
+    import numpy as np
+
+    amounts = np.array(values, dtype=float) * np.repeat(signs, counts)
+    row_indexes = np.repeat(np.arange(len(accounts)), counts)
+    keep = np.flatnonzero(amounts)
+
+    for index, amount, row_index in zip(keep.tolist(), amounts[keep].tolist(), row_indexes[keep].tolist()):
+        transaction_type, year, month = period_table[dates[index]]
+        yield {
+            'Type': transaction_type,
+            'Account': accounts[row_index],
+            'Amount': amount,
+            'Year': year,
+            'Month': month,
+        }
+
+
+def get_row_account(row: dict) -> tuple:
+    """
+    Returns a cashflow report row's account and if its amounts need to be inverted.
+    Revenue and equity account amounts are inverted.
+    :param row: cashflow report row
+    :return: tuple: (account code or name, True or False)
+    """
+    account = row.get('account_code') or row.get('account_name')
+
+    try:
+        inv_account = account in REVENUE_ACCOUNT_CODES \
+                      or account in EQUITY_ACCOUNT_CODES \
+                      or int(account) in REVENUE_ACCOUNT_CODES \
+                      or int(account) in EQUITY_ACCOUNT_CODES
+    except (TypeError, ValueError):
+        # Error comes from int(account) if account is a string or None
+        inv_account = False
+
+    if account in {'', None}:
+        account = row.get('account_name')
+
+    return account, inv_account
 
 
 def totals_is_zero(totals) -> bool:
@@ -131,18 +386,25 @@ def sum_rows_of_sections(sections: dict, periods: dict) -> list:
     Recursive. Adds the section's rows to a single list with formatted transactions.
     :return: Flattened list of all rows with transactions
     """
-    transactions = []
+    return list(iter_rows_of_sections(sections, periods))
+
+
+def iter_rows_of_sections(sections: dict, periods: dict, period_table: dict = None) -> Iterator[dict]:
+    """
+    Recursive generator. Yields the formatted transactions of the section's rows.
+    :return: Iterator of all rows' transactions
+    """
+    if period_table is None:
+        period_table = helpers.build_period_table(periods)
 
     for section in sections.values():
         if section.get('totals') is not None and totals_is_zero(section.get('totals')):
             continue
 
         if section.get('rows') is not None:
-            transactions += create_transactions_from_row(section.get('rows'), periods)
+            yield from iter_transactions_from_row(section.get('rows'), periods, period_table)
         if section.get('sections') is not None:
-            transactions += sum_rows_of_sections(section.get('sections'), periods)
-
-    return transactions
+            yield from iter_rows_of_sections(section.get('sections'), periods, period_table)
 
 
 def convert_transactions_from_json(transactions_json: list) -> list:
@@ -161,132 +423,255 @@ def convert_transactions_from_json(transactions_json: list) -> list:
     return transactions
 
 
-def convert():
+def iter_cashflow_file_transactions(file_path: str) -> Iterator[dict]:
+    """
+    Generator. Yields the formatted transactions of a x_cashflow.json file.
+    With ijson installed JSON reports are parsed incrementally in a single pass, one top level section at a time.
+    Raises ValueError if the file has no report data, e.g. a report that failed to download.
+    :param file_path: path to the cashflow file
+    :return: Iterator of formatted transactions
+    """
+    if not HAS_IJSON or serialization.get_file_format(file_path) != 'json':
+        cashflow = serialization.load_file(file_path)
+        cashflow = cashflow.get('data') if isinstance(cashflow, dict) else None
+        if not isinstance(cashflow, dict) or cashflow.get('period') is None:
+            raise ValueError(f'{file_path} has no cashflow report data.')
+        yield from iter_rows_of_sections(cashflow.get('sections') or {}, cashflow.get('period'))
+        return
+
+    periods = None
+    period_table = None
+    # Sections read before the periods, reports list their periods first so this normally stays empty
+    pending = {}
+
+    with open(file_path, 'rb') as file:
+        for key, value in iter_cashflow_json(file):
+            if key is None:
+                periods = value
+                period_table = helpers.build_period_table(periods)
+                yield from iter_rows_of_sections(pending, periods, period_table)
+                pending = {}
+            elif periods is None:
+                pending[key] = value
+            else:
+                yield from iter_rows_of_sections({key: value}, periods, period_table)
+
+    if periods is None:
+        raise ValueError(f'{file_path} has no cashflow report data.')
+
+
+def iter_cashflow_json(file) -> Iterator[tuple]:
+    """
+    Generator. Reads a cashflow report's periods and top level sections from a JSON file in a single ijson pass.
+    Only one section is held in memory at a time.
+    :param file: binary file object of the cashflow report
+    :return: iterator of (None, periods) and (section name, section) tuples, in file order
+    """
+    import ijson
+
+    builder = None
+    depth = 0
+    key = None
+    section_key = None
+
+    for prefix, event, value in ijson.parse(file, use_float=True):
+        if builder is None:
+            if prefix == 'data.sections' and event == 'map_key':
+                section_key = value
+                continue
+            if prefix == 'data.period':
+                key = None
+            elif section_key is not None and prefix == f'data.sections.{section_key}':
+                key = section_key
+            else:
+                continue
+            builder = ijson.ObjectBuilder()
+
+        builder.event(event, value)
+        if event in ('start_map', 'start_array'):
+            depth += 1
+        elif event in ('end_map', 'end_array'):
+            depth -= 1
+        if depth == 0:
+            yield key, builder.value
+            builder = None
+
+
+def iter_json_file_transactions() -> Iterator[dict]:
+    """
+    Generator. Yields the formatted transactions of every x_cashflow.json file.
+    :return: Iterator of formatted transactions
+    """
+    for file_path in get_cashflow_file_paths():
+        yield from iter_cashflow_file_transactions(file_path)
+
+
+def convert(fetch: bool = True):
     """
     Converts a farm's transactions into the needed json format
+    The cashflow files are streamed into transactions.json without building the full transactions list,
+    downloading them (fetch) still holds each whole report in memory, see create_cashflows.
+    :param fetch: Whether to download the cashflow reports first, False uses the existing x_cashflow.json files.
     """
-    transactions = []
     get_rev_equity_codes()
-    transactions_json = get_json_transactions()
-    transactions += convert_transactions_from_json(transactions_json)
-    with open(os.path.join(os.path.dirname(__file__), 'transactions.json'), 'w', encoding='utf-8') as file:
-        json.dump(transactions, file, indent=4)
+    if fetch:
+        create_cashflows()
+
+    file_path = helpers.get_output_path('Transactions', 'transactions.json')
+    input_files = [helpers.get_output_path('Accounts', 'revenue.json'),
+                   helpers.get_output_path('Accounts', 'equity.json')] + sorted(get_cashflow_file_paths())
+    inputs_hash = manifest.get_inputs_hash('transactions', __file__, input_files=input_files)
+    if manifest.is_unchanged('transactions', inputs_hash):
+        print('Transactions unchanged, skipping conversion.')
+        return
+
+    try:
+        with open(file_path + '.tmp', 'w', encoding='utf-8') as file:
+            serialization.dump_json_stream(iter_json_file_transactions(), file, indent=4)
+    except Exception:
+        # Keep the previous transactions.json and manifest entry when a cashflow file can't be converted
+        os.remove(file_path + '.tmp')
+        raise
+    serialization.replace_if_changed(file_path + '.tmp', file_path)
+    manifest.record('transactions', inputs_hash, [file_path])
     print('Transactions converted successfully.')
 
 
-def remove_duplicate_livestock_transactions():
+def remove_duplicate_livestock_transactions(purchase_account: str = None, sale_account: str = None):
     """
     Removes transactions found in both the livestock.json and transactions.json from the transactions.json
+    Farm transactions are hash indexed on (Year, Month, |Amount|, Account) so matching runs in linear time.
+    :param purchase_account: livestock tracker's purchase account, asked for if not given
+    :param sale_account: livestock tracker's sales account, asked for if not given
     """
-    with open(os.path.join(os.path.dirname(__file__), 'transactions.json'), 'r', encoding='utf-8') as file:
-        transactions = json.load(file)
-
-    with open(os.path.join(os.path.dirname(__file__), 'livestock.json'), 'r', encoding='utf-8') as file:
-        livestock = json.load(file)
+    transactions = serialization.load_file(helpers.get_output_path('Transactions', 'transactions.json'))
+    livestock = serialization.load_file(helpers.get_output_path('Transactions', 'livestock.json'))
 
-    purchase_account = input('Tracker purchase account: ')
-    sale_account = input('Tracker sales account: ')
+    if purchase_account is None:
+        purchase_account = input('Tracker purchase account: ')
+    if sale_account is None:
+        sale_account = input('Tracker sales account: ')
 
-    new_transactions = []
-    bad_transactions = []
+    transactions_index = index_transactions(transactions, livestock_match_key)
+    bad_positions = set()
+    matches = {'purchase': 0, 'sale': 0}
 
     for livestock_t in livestock:
-        for transaction in transactions:
-            if livestock_transaction_affected(livestock_t, transaction, purchase_account, sale_account):
-                bad_transactions.append(transaction)
+        key = livestock_transaction_key(livestock_t, purchase_account, sale_account)
+        if key is None or key not in transactions_index:
+            continue
+        matches[livestock_t.get('Transition')] += 1
+        bad_positions.update(transactions_index[key])
+
+    new_transactions = [transaction for position, transaction in enumerate(transactions)
+                        if position not in bad_positions]
 
-    for transaction in transactions:
-        if transaction not in bad_transactions:
-            new_transactions.append(transaction)
+    print(f"Matched {matches['purchase']} purchase and {matches['sale']} sale livestock transactions, "
+          f"removed {len(bad_positions)} transactions.")
 
-    with open(os.path.join(os.path.dirname(__file__), 'new_transactions.json'), 'w', encoding='utf-8') as file:
-        json.dump(new_transactions, file, indent=4)
+    serialization.dump_file(helpers.get_output_path('Transactions', 'new_transactions.json'), new_transactions)
 
 
-def livestock_transaction_affected(livestock_t: dict, transaction: dict, purchase_account: str, sale_account: str) -> bool:
+def index_transactions(transactions: list, key_function) -> dict:
     """
-    Checks if the livestock transaction and farm transaction are identical
-    :param livestock_t: livestock transaction
+    Creates a hash index of the transactions.
+    :param transactions: farm transactions
+    :param key_function: function returning a transaction's index key
+    :return: dictionary of key: list of transaction positions
+    """
+    index = {}
+    for position, transaction in enumerate(transactions):
+        index.setdefault(key_function(transaction), []).append(position)
+    return index
+
+
+def livestock_match_key(transaction: dict) -> tuple:
+    """
+    Returns the key livestock transactions are matched to a farm transaction on.
     :param transaction: farm transaction
+    :return: tuple: (Year, Month, |Amount|, Account)
+    """
+    return transaction.get('Year'), transaction.get('Month'), abs(transaction.get('Amount')), transaction.get('Account')
+
+
+def livestock_transaction_key(livestock_t: dict, purchase_account: str, sale_account: str) -> tuple | None:
+    """
+    Returns the farm transaction key the livestock transaction would be identical to
+    :param livestock_t: livestock transaction
     :param purchase_account: livestock tracker's purchase account
     :param sale_account: livestock tracker's sales account
-    :return: True or False
+    :return: tuple: (Year, Month, |Amount|, Account), None if the transaction can't be in the farm transactions
     """
-    if livestock_t.get('Transition') not in ['purchase', 'sale']:
-        return False
-    if abs(livestock_t.get('Amount')) != abs(transaction.get('Amount')):
-        return False
-    if livestock_t.get('Year') != transaction.get('Year'):
-        return False
-    if livestock_t.get('Month') != transaction.get('Month'):
-        return False
     transition = livestock_t.get('Transition')
-    if transition == 'purchase' and transaction.get('Account') != purchase_account:
-        return False
-    if transition == 'sale' and transaction.get('Account') != sale_account:
-        return False
-    return True
+    if transition not in ['purchase', 'sale'] or livestock_t.get('Amount') is None:
+        return None
+    account = purchase_account if transition == 'purchase' else sale_account
+    return livestock_t.get('Year'), livestock_t.get('Month'), abs(livestock_t.get('Amount')), account
 
 
 def remove_duplicate_crop_transactions():
     """
     Removes transactions found in both the invoices.json and transactions.json from the transactions.json
+    Every invoice line is matched against a hash index of the farm transactions on (Account, Year, Month, Type, Amount).
     """
-    with open(os.path.join(os.path.dirname(__file__), 'transactions.json'), 'r', encoding='utf-8') as file:
-        transactions = json.load(file)
+    transactions = serialization.load_file(helpers.get_output_path('Transactions', 'transactions.json'))
+    invoices = serialization.load_file(helpers.get_output_path('Transactions', 'invoices.json'))
+    all_accounts = serialization.load_file(helpers.get_output_path('Accounts', 'accounts.json'))
 
-    with open(os.path.join(os.path.dirname(__file__), 'invoices.json'), 'r', encoding='utf-8') as file:
-        invoices = json.load(file)
+    account_codes = build_account_codes(all_accounts)
+    transactions_index = index_transactions(transactions, crop_match_key)
+    bad_positions = set()
 
-    with open(os.path.join('Accounts', 'accounts.json'), 'r', encoding='utf-8') as file:
-        all_accounts = json.load(file)
+    for invoice in invoices:
+        for key in invoice_transaction_keys(invoice, account_codes):
+            bad_positions.update(transactions_index.get(key, ()))
 
-    new_transactions = []
-    bad_transactions = []
+    new_transactions = [transaction for position, transaction in enumerate(transactions)
+                        if position not in bad_positions]
 
-    for invoice in invoices:
-        for transaction in transactions:
-            if crop_transaction_affected(invoice, transaction, all_accounts):
-                bad_transactions.append(transaction)
+    print(f'Removed {len(bad_positions)} crop transactions.')
 
-    for transaction in transactions:
-        if transaction not in bad_transactions:
-            new_transactions.append(transaction)
+    serialization.dump_file(helpers.get_output_path('Transactions', 'new_transactions.json'), new_transactions)
 
-    with open(os.path.join(os.path.dirname(__file__), 'new_transactions.json'), 'w', encoding='utf-8') as file:
-        json.dump(new_transactions, file, indent=4)
+
+def crop_match_key(transaction: dict) -> tuple:
+    """
+    Returns the key crop invoice lines are matched to a farm transaction on.
+    :param transaction: farm transaction
+    :return: tuple: (Account, Year, Month, Type, Amount)
+    """
+    return (transaction.get('Account'), transaction.get('Year'), transaction.get('Month'),
+            transaction.get('Type'), float(transaction.get('Amount')))
 
 
-def crop_transaction_affected(invoice: dict, transaction: dict, all_accounts: list) -> bool:
+def invoice_transaction_keys(invoice: dict, account_codes: dict) -> list:
     """
-    Checks if the invoice and transaction are identical
+    Returns the farm transaction keys every line of the invoice would be identical to
     :param invoice: crop season invoice dict
-    :param transaction: farm transaction dict
-    :param all_accounts: list of all account
-    :return: True or False
+    :param account_codes: dictionary of account name: account code
+    :return: list of tuples: (Account, Year, Month, Type, Amount)
     """
-    invoice_accounts = resolve_account(invoice.get('lines')[0]['account'], all_accounts)
-
-    if transaction.get('Account') not in invoice_accounts:
-        return False
-    if transaction.get('Year') != invoice.get('year'):
-        return False
-    if transaction.get('Month') != invoice.get('month'):
-        return False
-    if float(transaction.get('Amount')) != float(invoice.get('lines')[0]['amount']):
-        return False
-    if transaction.get('Type') != invoice.get('transaction_type').capitalize():
-        return False
-    return True
+    keys = []
+    transaction_type = invoice.get('transaction_type').capitalize()
+
+    for line in invoice.get('lines'):
+        amount = float(line['amount'])
+        invoice_accounts = [line['account']]
+        if line['account'] in account_codes:
+            invoice_accounts.append(account_codes[line['account']])
+        for account in invoice_accounts:
+            keys.append((account, invoice.get('year'), invoice.get('month'), transaction_type, amount))
+
+    return keys
 
 
-def resolve_account(account: str, all_accounts: list) -> list | None:
+def build_account_codes(all_accounts: list) -> dict:
     """
-    Gets the account's name and code
-    :param account: account's name
+    Creates a dictionary of account names to codes, keeping the first account for each name
     :param all_accounts: all farm accounts
-    :return: list: [account_name, account_code]
+    :return: dictionary of account name: account code string
     """
+    account_codes = {}
     for acc in all_accounts:
-        if acc.get('Name') == account:
-            return [account, str(acc.get('Code'))]
+        account_codes.setdefault(acc.get('Name'), str(acc.get('Code')))
+    return account_codes
@@ -0,0 +1,103 @@
+"""
+Converts several farms at once, each farm in its own worker process.
+"""
+import contextlib
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from OAuth2 import oauth
+import helpers
+import scheduler
+import snapshots
+import stages
+import telemetry
+
+
+def read_farms_file(file_path: str) -> list:
+    """
+    Returns the farm shortcodes listed in a file, one per line. Blank lines and # comments are ignored.
+    :param file_path: Path to the farms file.
+    :return: List of farm shortcodes.
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        lines = [line.split('#')[0].strip() for line in file]
+    return [line for line in lines if line]
+
+
+def run_farm(farm_id: str, output_dir: str, stage_names: list, stage_options: dict = None,
+             workers: int = None) -> dict:
+    """
+    Runs the stages for a single farm, writing its outputs and log to the output directory.
+    Runs in a worker process.
+    :param farm_id: Farm shortcode.
+    :param output_dir: Farm's output directory.
+    :param stage_names: Names of the stages to run.
+    :param stage_options: Keyword arguments of the stages' run functions, see stages.get_stages.
+    :param workers: Maximum number of the farm's stages running at once, see scheduler.run_stages.
+    :return: Dictionary with the farm, its stage results and an error message if it failed.
+    """
+    helpers.FARM_ID = farm_id
+    helpers.OUTPUT_DIR = output_dir
+    os.makedirs(output_dir, exist_ok=True)
+
+    with open(os.path.join(output_dir, 'run.log'), 'w', encoding='utf-8') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            if snapshots.get_mode() is not None and not snapshots.open_bundle(snapshots.get_bundle_dir(farm_id)):
+                return {'farm': farm_id, 'results': {}, 'error': 'Could not open the snapshot bundle.'}
+            if stages.uses_network(stage_names):
+                oauth.start_token_refresher()
+            results = scheduler.run_stages(stages.get_stages(stage_options), stage_names, workers,
+                                           stages.before_stage)
+            snapshots.close_bundle()
+            telemetry.print_summary()
+            telemetry.write_run_files(output_dir, farm_id)
+        except Exception:
+            traceback.print_exc()
+            return {'farm': farm_id, 'results': {}, 'error': traceback.format_exc(limit=1).strip()}
+
+    failed = [name for name, result in results.items() if result != 'done']
+    return {
+        'farm': farm_id,
+        'results': results,
+        'error': f"Stages not completed: {', '.join(failed)}" if failed else None,
+    }
+
+
+def run_batch(farm_ids: list, output_root: str, stage_names: list, processes: int = None,
+              stage_options: dict = None, workers: int = None) -> list:
+    """
+    Converts every farm in its own worker process with its own output directory.
+    Workers share the OAuth token file and the API response cache, one farm failing doesn't stop the others.
+    :param farm_ids: Farm shortcodes.
+    :param output_root: Directory the farms' output directories are created in.
+    :param stage_names: Names of the stages to run for every farm.
+    :param processes: Maximum number of worker processes, defaults to the number of CPUs.
+    :param stage_options: Keyword arguments of the stages' run functions, see stages.get_stages.
+    :param workers: Maximum number of each farm's stages running at once, see scheduler.run_stages.
+    :return: List of farm result dictionaries, see run_farm.
+    """
+    reports = []
+
+    # A fresh process per farm keeps the module level state, e.g. the accounts index, separate.
+    with ProcessPoolExecutor(max_workers=processes, max_tasks_per_child=1) as executor:
+        futures = {
+            executor.submit(run_farm, farm_id, os.path.join(output_root, farm_id), stage_names,
+                            stage_options, workers): farm_id
+            for farm_id in farm_ids
+        }
+        for future in as_completed(futures):
+            try:
+                report = future.result()
+            except Exception as e:
+                report = {'farm': futures[future], 'results': {}, 'error': f'Worker crashed: {e}'}
+            print(f"{report['farm']}: {report['error'] or 'done'}")
+            reports.append(report)
+
+    failed = [report['farm'] for report in reports if report['error']]
+    print(f'Converted {len(reports) - len(failed)} of {len(reports)} farms.')
+    if failed:
+        print(f"Failed: {', '.join(sorted(failed))}")
+
+    return sorted(reports, key=lambda report: farm_ids.index(report['farm']))
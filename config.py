@@ -0,0 +1,51 @@
+"""
+Environment configuration.
+The .env file is read once, when a setting is first needed, and a setting is only required when it's used,
+so commands that don't use the API or the crop site run without their credentials.
+"""
+import os
+
+# Constants
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+ENV_FILE_PATH = os.path.join(ROOT_DIR, '.env')
+
+# Global Variables
+ENV_LOADED = False
+
+
+def load_env() -> None:
+    """
+    Loads the .env file into the environment, variables that are already set take precedence.
+    """
+    global ENV_LOADED
+
+    if ENV_LOADED:
+        return
+    ENV_LOADED = True
+
+    if os.path.isfile(ENV_FILE_PATH):
+        from dotenv import load_dotenv
+        load_dotenv(ENV_FILE_PATH)
+
+
+def get(name: str, default: str = None) -> str | None:
+    """
+    Returns an optional setting.
+    :param name: Environment variable name, e.g. 'API_TIMEOUT'.
+    :param default: Value if the variable isn't set.
+    :return: Setting value.
+    """
+    load_env()
+    return os.environ.get(name, default)
+
+
+def require(name: str) -> str:
+    """
+    Returns a required setting.
+    :param name: Environment variable name, e.g. 'FARM_SHORTCODE_ID'.
+    :return: Setting value.
+    """
+    value = get(name)
+    if value is None:
+        raise KeyError(f'{name} is not set, add it to the .env file (see .env.example).')
+    return value
@@ -2,36 +2,142 @@
 Helper functions.
 - OAuth
 - API requests
+- Dates
 """
-import json
+import math
 import os
-from time import time
-from typing import Any
+import threading
+from collections import deque
+from functools import lru_cache
+from time import perf_counter, time
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator
 from datetime import datetime
 
-import requests
-from dotenv import load_dotenv
-
+import config
+import serialization
+import snapshots
+import telemetry
 from OAuth2 import oauth
 
-load_dotenv()
-
-# Constants
-FARM_ID = os.environ['FARM_SHORTCODE_ID']
-CLIENT_ID = os.environ['CLIENT_ID']
-CLIENT_SECRET = os.environ['CLIENT_SECRET']
-API_URL = os.environ['API_URL']
-TOKEN_URL = os.environ['TOKEN_URL']
-AUTH_URL = os.environ['AUTH_URL']
-REDIRECT_URL = os.environ['REDIRECT_URI']
-FARM_COUNTRY = os.environ['FARM_COUNTRY']
-USER_NAME = os.environ['USER_NAME']
-PASSWORD = os.environ['PASSWORD']
-CROP_URL = os.environ['CROP_URL']
+if TYPE_CHECKING:
+    import requests
+
+# Settings resolved from the environment when first used, see __getattr__
+REQUIRED_SETTINGS = {
+    'FARM_ID': 'FARM_SHORTCODE_ID',
+    'CLIENT_ID': 'CLIENT_ID',
+    'CLIENT_SECRET': 'CLIENT_SECRET',
+    'API_URL': 'API_URL',
+    'TOKEN_URL': 'TOKEN_URL',
+    'AUTH_URL': 'AUTH_URL',
+    'REDIRECT_URL': 'REDIRECT_URI',
+    'FARM_COUNTRY': 'FARM_COUNTRY',
+    'USER_NAME': 'USER_NAME',
+    'PASSWORD': 'PASSWORD',
+    'CROP_URL': 'CROP_URL',
+}
+# Settings every command using the API needs
+API_SETTINGS = ('CLIENT_ID', 'CLIENT_SECRET', 'API_URL', 'TOKEN_URL', 'AUTH_URL', 'REDIRECT_URL')
+
+# Output
+ROOT_DIR = config.ROOT_DIR
+OUTPUT_DIR = config.get('OUTPUT_DIR') or ROOT_DIR
+
+# API client settings
+API_POOL_SIZE = int(config.get('API_POOL_SIZE', 10))
+API_TIMEOUT = float(config.get('API_TIMEOUT', 30))
+API_RETRIES = int(config.get('API_RETRIES', 3))
+API_BACKOFF = float(config.get('API_BACKOFF', 0.5))
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+API_WORKERS = int(config.get('API_WORKERS', 8))
+API_PAGE_SIZE = int(config.get('API_PAGE_SIZE', 100))
+CASHFLOW_SHARD_MONTHS = int(config.get('CASHFLOW_SHARD_MONTHS', 12))
+
+# Dates
+DATE_CACHE_SIZE = 4096
 
 # Global Variables
 OAUTH_DETAILS = None
 CURRENT_YEAR = None
+SESSION = None
+SESSION_LOCK = threading.Lock()
+
+
+def get_setting(name: str) -> str:
+    """
+    Returns a required setting, reading it from the environment on first use.
+    A value assigned to the module attribute, e.g. helpers.FARM_ID in a batch worker, takes precedence.
+    :param name: Setting name from REQUIRED_SETTINGS, e.g. 'FARM_ID'.
+    :return: Setting value.
+    """
+    value = globals().get(name)
+    if value is None:
+        value = globals()[name] = config.require(REQUIRED_SETTINGS[name])
+    return value
+
+
+def get_optional_setting(name: str) -> str | None:
+    """
+    Returns a required setting for a command that can run without it, e.g. the farm recorded in the manifest.
+    :param name: Setting name from REQUIRED_SETTINGS, e.g. 'FARM_ID'.
+    :return: Setting value, None if it isn't set.
+    """
+    return globals().get(name) or config.get(REQUIRED_SETTINGS[name])
+
+
+def __getattr__(name: str) -> str:
+    """
+    Resolves the required settings, e.g. helpers.FARM_ID, lazily.
+    :param name: Attribute name.
+    :return: Setting value.
+    """
+    if name in REQUIRED_SETTINGS:
+        return get_setting(name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def get_missing_settings(names: Iterable[str]) -> list:
+    """
+    Returns the environment variables of the required settings that aren't set.
+    :param names: Setting names from REQUIRED_SETTINGS, e.g. API_SETTINGS.
+    :return: List of environment variable names.
+    """
+    missing = []
+    for name in names:
+        try:
+            get_setting(name)
+        except KeyError:
+            missing.append(REQUIRED_SETTINGS[name])
+    return missing
+
+
+def join_output_path(*parts: str) -> str:
+    """
+    Returns a path inside the output directory without creating any directories, e.g. to describe a stage.
+    :param parts: Path parts relative to OUTPUT_DIR, e.g. 'Accounts', 'accounts.json'.
+    :return: File or directory path.
+    """
+    return os.path.join(OUTPUT_DIR, *parts)
+
+
+def get_output_dir(*parts: str) -> str:
+    """
+    Returns a directory inside the output directory, creating it if needed.
+    :param parts: Path parts relative to OUTPUT_DIR, e.g. 'Livestock', 'Tracker name'.
+    :return: Directory path.
+    """
+    path = join_output_path(*parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def get_output_path(*parts: str) -> str:
+    """
+    Returns the path of a file inside the output directory, creating its directory if needed.
+    :param parts: Path parts relative to OUTPUT_DIR, e.g. 'Accounts', 'accounts.json'.
+    :return: File path.
+    """
+    return os.path.join(get_output_dir(*parts[:-1]), parts[-1])
 
 
 def get_current_year() -> int:
@@ -49,6 +155,31 @@ def get_current_year() -> int:
     return CURRENT_YEAR
 
 
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def get_relative_date(date_string: str, date_format: str = '%Y-%m') -> tuple:
+    """
+    Returns the year relative to the current year and the month of a date string.
+    Results are memoized, so each distinct date string is only parsed once.
+    :param date_string: Date string, e.g. '2023-06' or '2023-06-30 00:00:00'.
+    :param date_format: strptime format of the date string.
+    :return: Tuple: (relative year, month).
+    """
+    date_object = datetime.strptime(date_string, date_format)
+    return date_object.year - get_current_year(), date_object.month
+
+
+def build_period_table(periods: dict) -> dict:
+    """
+    Creates a lookup table of a report's periods.
+    :param periods: Report's period dictionary of 'YYYY-MM': period details.
+    :return: Dictionary of 'YYYY-MM': (Type, relative year, month).
+    """
+    return {
+        date: (period.get('data_type').capitalize(), *get_relative_date(date))
+        for date, period in periods.items()
+    }
+
+
 def get_headers() -> dict:
     """
     Returns a dictionary of headers for API requests.
@@ -60,6 +191,49 @@ def get_headers() -> dict:
     }
 
 
+def get_session() -> 'requests.Session':
+    """
+    Returns the shared HTTP session for API requests.
+    The session keeps connections alive in a pool sized by API_POOL_SIZE and retries
+    5xx responses, connection errors and timeouts with a jittered exponential backoff.
+    :return: Requests session.
+    """
+    global SESSION
+
+    if SESSION is not None:
+        return SESSION
+
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    with SESSION_LOCK:
+        if SESSION is None:
+            retry = Retry(
+                total=API_RETRIES,
+                connect=API_RETRIES,
+                read=API_RETRIES,
+                status=API_RETRIES,
+                backoff_factor=API_BACKOFF,
+                backoff_jitter=API_BACKOFF,
+                status_forcelist=RETRY_STATUS_CODES,
+                allowed_methods=frozenset({'GET'}),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=API_POOL_SIZE, pool_maxsize=API_POOL_SIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update({
+                'Accept': 'application/json',
+                'Accept-Encoding': 'gzip, deflate',
+            })
+            SESSION = session
+
+    return SESSION
+
+
 def get_oauth_details() -> dict | None:
     """
     Returns the OAuth2 details from the JSON file.
@@ -67,16 +241,18 @@ def get_oauth_details() -> dict | None:
     """
     global OAUTH_DETAILS
 
-    if OAUTH_DETAILS is not None:
-        return OAUTH_DETAILS
+    # Read once, the token manager may reset OAUTH_DETAILS from another thread at any time
+    details = OAUTH_DETAILS
+    if details is not None:
+        return details
 
     try:
-        with open('OAuth2/oauth.json', 'r', encoding='utf-8') as file:
-            OAUTH_DETAILS = json.load(file)
-            return OAUTH_DETAILS
+        details = serialization.load_file(oauth.OAUTH_FILE_PATH)
+        OAUTH_DETAILS = details
+        return details
     except FileNotFoundError:
         print("OAuth JSON file not found.")
-    except json.JSONDecodeError:
+    except serialization.DecodeError:
         print("Invalid JSON format in the OAuth JSON file.")
 
     return None
@@ -84,16 +260,16 @@ def get_oauth_details() -> dict | None:
 
 def get_access_token() -> str | None:
     """
-    Returns the access token from the OAuth2 details.
+    Returns the access token from the OAuth2 details, refreshing it first if it has expired.
     :return: Access token value if successful, None otherwise.
     """
-    global OAUTH_DETAILS
-
-    if OAUTH_DETAILS is None:
-        OAUTH_DETAILS = get_oauth_details()
+    details = get_oauth_details()
+    if details is not None and details.get('expires_at', 0) <= time():
+        oauth.refresh_token()
+        details = get_oauth_details()
 
-    if OAUTH_DETAILS is not None:
-        return OAUTH_DETAILS.get('access_token')
+    if details is not None:
+        return details.get('access_token')
 
     return None
 
@@ -105,46 +281,200 @@ def get_url(api_type: str, path_vars: list = None) -> str:
     :param api_type: String from: 'accounts', 'account', 'livestock_list', 'livestock_transactions', 'livestock_account_mappings', 'cashflow'
     :return: API URL
     """
+    api_url = get_setting('API_URL')
+    farm_id = get_setting('FARM_ID')
     match api_type:
         case 'accounts':
-            return f'{API_URL}/farms/{FARM_ID}/accounts'
+            return f'{api_url}/farms/{farm_id}/accounts'
         case 'account':
-            return f'{API_URL}/farms/{FARM_ID}/account/{path_vars[0]}'
+            return f'{api_url}/farms/{farm_id}/account/{path_vars[0]}'
         case 'livestock_list':
-            return f'{API_URL}/farms/{FARM_ID}/livestock/trackers'
+            return f'{api_url}/farms/{farm_id}/livestock/trackers'
         case 'livestock_transactions':
-            return f'{API_URL}/farms/{FARM_ID}/livestock/transactions'
+            return f'{api_url}/farms/{farm_id}/livestock/transactions'
         case 'livestock_account_mappings':
-            return f'{API_URL}/farms/{FARM_ID}/livestock/{path_vars[0]}/account_mappings'
+            return f'{api_url}/farms/{farm_id}/livestock/{path_vars[0]}/account_mappings'
         case 'cashflow':
-            return f'{API_URL}/farms/{FARM_ID}/reports/cashflow'
+            return f'{api_url}/farms/{farm_id}/reports/cashflow'
 
 
-def get_api(api_type: str, query_params: dict = None, path_vars: list = None) -> Any | None:
+def get_api(api_type: str, query_params: dict = None, path_vars: list = None, use_cache: bool = True) -> Any | None:
     """
     Returns the JSON response from the specified GET request.
+    Responses are served from the API response cache while fresh and revalidated with the server once stale.
+    When recording a snapshot bundle every payload is saved to it, when replaying one the payload comes from it.
     :param path_vars:
     :param api_type: String from: 'accounts', 'livestock_list', 'livestock_transactions'
     :param query_params: dictionary of query parameters
+    :param use_cache: Whether to read from and save to the API response cache.
     :return: JSON-encoded content of a response if successful, None otherwise.
     """
+    from Cache import cache
+
+    start = perf_counter()
+    key = cache.make_key(api_type, path_vars, query_params, get_setting('FARM_ID'))
+
+    if snapshots.is_replaying():
+        body = snapshots.lookup(key)
+        if body is None:
+            print(f'Error getting {api_type}: not in the snapshot bundle')
+            return None
+        return serialization.loads(body)
+
+    import requests
+
     url = get_url(api_type, path_vars)
-    request = requests.get(url, headers=get_headers(), params=query_params or {}, timeout=10)
+    entry = cache.lookup(key) if use_cache else None
+
+    if entry is not None and cache.is_fresh(entry):
+        cache.count('hits')
+        telemetry.record_request(api_type, 200, perf_counter() - start, len(entry['body']), cache_result='hit')
+        snapshots.record(key, api_type, path_vars, query_params, entry['body'])
+        return serialization.loads(entry['body'])
+
+    try:
+        # Refreshes an expired token, which fails with a network or OAuth2 error, e.g. invalid_grant
+        access_token = get_access_token()
+    except Exception as e:
+        telemetry.record_request(api_type, 'error', perf_counter() - start,
+                                 cache_result='miss' if use_cache else 'bypass')
+        print('Error refreshing the access token:', e)
+        return None
+    headers = {'Authorization': f'Bearer {access_token}'}
+    headers.update(cache.conditional_headers(entry))
+    try:
+        request = get_session().get(url, headers=headers, params=query_params or {}, timeout=API_TIMEOUT)
+        if request.status_code == 401 and access_token is not None:
+            # The token expired or was revoked mid-run, retry once with a refreshed token
+            try:
+                oauth.refresh_token(failed_token=access_token)
+                access_token = get_access_token()
+            except Exception as e:
+                # The 401 response is recorded and reported below
+                print('Error refreshing the access token:', e)
+            else:
+                headers['Authorization'] = f'Bearer {access_token}'
+                request = get_session().get(url, headers=headers, params=query_params or {}, timeout=API_TIMEOUT)
+    except requests.RequestException as e:
+        telemetry.record_request(api_type, 'error', perf_counter() - start,
+                                 cache_result='miss' if use_cache else 'bypass')
+        print('Error getting ' + api_type)
+        print(e)
+        return None
+    latency = perf_counter() - start
+    retries = telemetry.get_retries(request)
+    if request.status_code == 304 and entry is not None:
+        cache.count('revalidated')
+        cache.refresh(key)
+        telemetry.record_request(api_type, 304, latency, len(request.content), retries, 'revalidated')
+        snapshots.record(key, api_type, path_vars, query_params, entry['body'])
+        return serialization.loads(entry['body'])
+    telemetry.record_request(api_type, request.status_code, latency, len(request.content), retries,
+                             'miss' if use_cache else 'bypass')
     if request.status_code == 200:
-        return request.json()
+        if use_cache:
+            cache.count('misses')
+            cache.store(key, api_type, request.content,
+                        request.headers.get('ETag'), request.headers.get('Last-Modified'))
+        snapshots.record(key, api_type, path_vars, query_params, request.content)
+        return serialization.loads(request.content)
     print('Error getting ' + api_type)
     print(request.status_code)
     print(request.text)
     return None
 
 
+def get_last_page(meta: dict | None, per_page: int) -> int | None:
+    """
+    Returns the number of the last page from a paginated response's meta.
+    :param meta: Response meta dictionary.
+    :param per_page: Number of records per page.
+    :return: Last page number if known, None otherwise.
+    """
+    if not meta:
+        return None
+    if meta.get('last_page') is not None:
+        return int(meta.get('last_page'))
+    if meta.get('total') is not None:
+        return max(math.ceil(int(meta.get('total')) / per_page), 1)
+    return None
+
+
+def iter_api(api_type: str,
+             query_params: dict = None,
+             path_vars: list = None,
+             per_page: int = None,
+             prefetch: int = None) -> Iterator[dict]:
+    """
+    Yields the records of a paginated API response page by page.
+    The first page's meta tells how many pages there are and the following pages are fetched
+    concurrently ahead of the consumer. Without a meta, pages are requested until a short page.
+    :param api_type: String from: 'livestock_list', 'livestock_transactions'
+    :param query_params: dictionary of query parameters
+    :param path_vars:
+    :param per_page: Number of records per page, defaults to API_PAGE_SIZE.
+    :param prefetch: Maximum number of pages fetched ahead, defaults to API_WORKERS.
+    :return: Iterator of records.
+    """
+    per_page = per_page or API_PAGE_SIZE
+    prefetch = max(API_WORKERS if prefetch is None else prefetch, 1)
+
+    def get_page(page: int) -> list:
+        response = get_api(api_type, {**(query_params or {}), 'per_page': per_page, 'page': page}, path_vars)
+        if response is None:
+            raise RuntimeError(f'Could not get page {page} of {api_type}.')
+        return response
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    first_page = get_page(1)
+    data = first_page.get('data') or []
+    yield from data
+
+    last_page = get_last_page(first_page.get('meta'), per_page)
+
+    if last_page is None:
+        page = 2
+        while len(data) >= per_page:
+            data = get_page(page).get('data') or []
+            yield from data
+            page += 1
+        return
+
+    with ThreadPoolExecutor(max_workers=prefetch) as executor:
+        pending = deque()
+        next_page = 2
+        while next_page <= last_page or pending:
+            while next_page <= last_page and len(pending) < prefetch:
+                pending.append(executor.submit(get_page, next_page))
+                next_page += 1
+            yield from pending.popleft().result().get('data') or []
+
+
+def concurrent_map(func: Callable, items: Iterable, workers: int = None) -> list:
+    """
+    Applies the function to every item using a bounded thread pool.
+    Runs serially when the worker count is 1 or less.
+    :param func: Function to apply.
+    :param items: Items to apply the function to.
+    :param workers: Maximum number of threads, defaults to API_WORKERS.
+    :return: List of results in the same order as the items.
+    """
+    workers = API_WORKERS if workers is None else workers
+    if workers <= 1:
+        return [func(item) for item in items]
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, items))
+
+
 def refresh_token_if_expired(force_refresh: bool = False):
     """
-    Checks if the access token is still valid and refreshes it if necessary.
+    Checks if the access token is still valid and refreshes it if it's close to expiring.
     """
-    global OAUTH_DETAILS
-    if force_refresh or OAUTH_DETAILS.get('expires_at', 0) <= time():
-        oauth.refresh_token()
+    oauth.refresh_token(force=force_refresh)
 
 
 def reset_oauth_details():
@@ -1,25 +1,180 @@
 """
 Main file for the program.
+Each subcommand only imports the modules and reads the settings it uses, so the offline commands start quickly
+and run without API or crop site credentials.
 """
+import argparse
+import os
+import sys
+
 from OAuth2 import oauth
-from Accounts import accounts
-from Livestock import livestock
-from Transactions import transactions
 import helpers
+import manifest
+import scheduler
+import snapshots
+import stages
+import telemetry
+
+# Constants
+PIPELINE_COMMAND = 'run'
+COMMAND_HELP = {
+    'accounts': 'Convert the farm\'s accounts.',
+    'livestock': 'Convert the livestock trackers\' transactions.',
+    'cashflows': 'Download the cashflow reports.',
+    'transactions': 'Convert the downloaded cashflow reports into transactions.',
+    'dedup-livestock': 'Remove the livestock tracker\'s transactions from the farm transactions.',
+    'crops': 'Scrape the crop season\'s activities into invoices.json.',
+    'dedup-crops': 'Remove the crop season\'s invoices from the farm transactions.',
+}
+
+
+def get_command_args(args: list) -> list:
+    """
+    Adds the run command to argument lists without a subcommand, e.g. 'accounts transactions' or '--force',
+    so the stage lists of earlier versions keep working.
+    :param args: Command line arguments.
+    :return: Arguments starting with a subcommand.
+    """
+    if not args or (args[0].startswith('-') and args[0] not in ('-h', '--help')):
+        return [PIPELINE_COMMAND] + args
+    if args[0] in stages.STAGE_NAMES and any(arg in stages.STAGE_NAMES for arg in args[1:]):
+        return [PIPELINE_COMMAND] + args
+    return args
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """
+    Returns the command line parser with a subcommand per stage and the run command for several stages.
+    :return: Argument parser.
+    """
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--farms', nargs='+', default=None, metavar='SHORTCODE',
+                        help='Convert several farms, each in its own process and output directory.')
+    common.add_argument('--farms-file', default=None,
+                        help='File with one farm shortcode per line to convert, like --farms.')
+    common.add_argument('--output-dir', default=None,
+                        help='Output directory. With --farms each farm is written to a subdirectory of it.')
+    common.add_argument('--processes', type=int, default=None,
+                        help='Maximum number of farms converted at once.')
+    common.add_argument('--force', action='store_true',
+                        help='Convert every stage even if its inputs are unchanged since the last run.')
+    snapshot_args = common.add_mutually_exclusive_group()
+    snapshot_args.add_argument('--record', default=None, metavar='BUNDLE_DIR',
+                               help='Save every API payload of the run to a snapshot bundle. '
+                                    'With --farms each farm is saved to a subdirectory of it.')
+    snapshot_args.add_argument('--replay', default=None, metavar='BUNDLE_DIR',
+                               help='Answer the API requests from a recorded snapshot bundle, '
+                                    'without OAuth or network access. Implies --force.')
+
+    parser = argparse.ArgumentParser(description="Converts a Figured farm into demo farm template JSON files.")
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+
+    run_parser = subparsers.add_parser(PIPELINE_COMMAND, parents=[common],
+                                       help='Run several stages, the default command.')
+    run_parser.add_argument('stages', nargs='*', default=stages.DEFAULT_STAGES, metavar='stage',
+                            help=f"Stages to run, from: {', '.join(stages.STAGE_NAMES)}. "
+                                 f"Defaults to: {' '.join(stages.DEFAULT_STAGES)}")
+    run_parser.add_argument('--workers', type=int, default=None,
+                            help='Maximum number of stages running at once, for each farm with --farms.')
+
+    for name in stages.STAGE_NAMES:
+        stage_parser = subparsers.add_parser(name, parents=[common], help=COMMAND_HELP[name])
+        stage_parser.set_defaults(stages=[name], workers=None)
+        match name:
+            case 'dedup-livestock':
+                stage_parser.add_argument('--purchase-account', default=None,
+                                          help='Purchase account code, asked for if not given.')
+                stage_parser.add_argument('--sale-account', default=None,
+                                          help='Sale account code, asked for if not given.')
+            case 'crops':
+                stage_parser.add_argument('--snapshot', default=None, metavar='HTML_FILE',
+                                          help='Parse a saved activity page instead of starting Chrome.')
+
+    return parser
+
+
+def get_stage_options(args: argparse.Namespace) -> dict:
+    """
+    Returns the keyword arguments of the stages' run functions from the subcommand's options.
+    :param args: Parsed arguments.
+    :return: Dictionary of stage name: keyword arguments, see stages.get_stages.
+    """
+    match args.command:
+        case 'dedup-livestock':
+            return {'dedup-livestock': {'purchase_account': args.purchase_account,
+                                        'sale_account': args.sale_account}}
+        case 'crops' if args.snapshot:
+            return {'crops': {'snapshot_file_path': args.snapshot}}
+    return {}
+
+
+def parse_args(args: list = None) -> argparse.Namespace:
+    """
+    Parses the command line arguments.
+    :param args: List of arguments, defaults to sys.argv.
+    :return: Parsed arguments.
+    """
+    parser = get_parser()
+    parsed = parser.parse_args(get_command_args(sys.argv[1:] if args is None else list(args)))
+    # Checked here instead of with choices, argparse rejects the default list of a '*' positional with choices
+    unknown = [name for name in parsed.stages if name not in stages.STAGE_NAMES]
+    if unknown:
+        parser.error(f"unknown stage: {', '.join(unknown)} (choose from {', '.join(stages.STAGE_NAMES)})")
+    return parsed
 
 
 def main():
     """
     Main function.
     """
-    oauth.initialise_oauth2()
-    accounts.convert()
-    helpers.refresh_token_if_expired()
-    livestock.convert()
-    helpers.refresh_token_if_expired()
-    transactions.convert()
-    # transactions.remove_duplicate_livestock_transactions()
-    # transactions.remove_duplicate_crop_transactions()
+    args = parse_args()
+    stage_options = get_stage_options(args)
+
+    if args.record or args.replay:
+        # Set in the environment too, so batch worker processes see it
+        os.environ['SNAPSHOT_MODE'] = 'record' if args.record else 'replay'
+        os.environ['SNAPSHOT_DIR'] = os.path.abspath(args.record or args.replay)
+    network = stages.uses_network(args.stages)
+
+    farm_ids = list(args.farms or [])
+    if args.farms_file:
+        # Only batch runs import batch, it loads multiprocessing
+        import batch
+        farm_ids += batch.read_farms_file(args.farms_file)
+
+    if args.force or args.replay:
+        # Replays convert every stage, the manifest may describe a run from other data in the output directory.
+        # Set in the environment too, so batch worker processes see it
+        os.environ['FORCE_CONVERT'] = '1'
+        manifest.FORCE = True
+
+    if args.output_dir and not farm_ids:
+        helpers.OUTPUT_DIR = args.output_dir
+
+    # Batch workers open their farm's own bundle
+    if snapshots.get_mode() is not None and not farm_ids and not snapshots.open_bundle():
+        return
+
+    if network:
+        missing = helpers.get_missing_settings(helpers.API_SETTINGS)
+        if missing:
+            print(f"The API needs these settings in the .env file: {', '.join(missing)}")
+            return
+        oauth.initialise_oauth2()
+        oauth.start_token_refresher()
+
+    if farm_ids:
+        import batch
+        output_root = args.output_dir or os.path.join(helpers.ROOT_DIR, 'Farms')
+        batch.run_batch(farm_ids, output_root, args.stages, args.processes, stage_options, args.workers)
+    else:
+        scheduler.run_stages(stages.get_stages(stage_options), args.stages, args.workers, stages.before_stage)
+        snapshots.close_bundle()
+
+    if network and not farm_ids:
+        telemetry.print_summary()
+        telemetry.write_run_files(helpers.OUTPUT_DIR, helpers.FARM_ID)
+    oauth.stop_token_refresher()
     print('Done!')
 
 
@@ -0,0 +1,174 @@
+"""
+Content-hash manifest for incremental re-conversion.
+Records a hash of each stage's inputs (API payloads, input files, config and converter code) and of the files it wrote,
+so a stage can be skipped when its inputs haven't changed and its outputs are still in place.
+"""
+import hashlib
+import json
+import os
+import threading
+
+import helpers
+import serialization
+
+# Constants
+MANIFEST_VERSION = 1
+MANIFEST_FILE_NAME = 'manifest.json'
+FORCE = os.environ.get('FORCE_CONVERT', '0').lower() not in ('0', 'false', 'no', '')
+# Modules every stage converts with, changing them re-converts every stage
+SHARED_CONVERTER_FILES = [helpers.__file__, serialization.__file__]
+
+# Global Variables
+LOCK = threading.Lock()
+
+
+def hash_data(data) -> str:
+    """
+    Returns the hash of JSON serialisable data, independent of dictionary key order.
+    :param data: JSON serialisable data.
+    :return: Hex digest.
+    """
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def hash_file(file_path: str) -> str | None:
+    """
+    Returns the hash of a file's contents.
+    :param file_path: Path to the file.
+    :return: Hex digest, None if the file doesn't exist.
+    """
+    if not os.path.isfile(file_path):
+        return None
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_config() -> dict:
+    """
+    Returns the configuration the converted output depends on.
+    Offline commands run without the farm settings, those are None then.
+    :return: Dictionary of config values.
+    """
+    return {
+        'version': MANIFEST_VERSION,
+        'farm': helpers.get_optional_setting('FARM_ID'),
+        'country': helpers.get_optional_setting('FARM_COUNTRY'),
+        'current_year': helpers.get_current_year(),
+    }
+
+
+def get_converter_hash(converter_file: str) -> str:
+    """
+    Returns the hash of a stage's converter code, so changing how a stage converts invalidates its manifest entry.
+    :param converter_file: Path of the stage's module, e.g. its __file__.
+    :return: Hex digest.
+    """
+    return hash_data([hash_file(file_path) for file_path in [converter_file] + SHARED_CONVERTER_FILES])
+
+
+def get_inputs_hash(stage: str, converter_file: str, payloads: list = None, input_files: list = None) -> str:
+    """
+    Returns the hash of everything a stage's output depends on.
+    :param stage: Stage name.
+    :param converter_file: Path of the stage's module, see get_converter_hash.
+    :param payloads: API payloads the stage converts.
+    :param input_files: Paths of the files the stage reads.
+    :return: Hex digest.
+    """
+    return hash_data({
+        'stage': stage,
+        'config': get_config(),
+        'converter': get_converter_hash(converter_file),
+        'payloads': [hash_data(payload) for payload in payloads or []],
+        'files': {os.path.relpath(path, helpers.OUTPUT_DIR): hash_file(path) for path in input_files or []},
+    })
+
+
+def get_manifest_path() -> str:
+    """
+    Returns the path of the output directory's manifest.
+    :return: File path.
+    """
+    return helpers.get_output_path(MANIFEST_FILE_NAME)
+
+
+def load_manifest() -> dict:
+    """
+    Returns the output directory's manifest.
+    :return: Manifest dictionary, empty if there's no valid manifest.
+    """
+    try:
+        manifest = serialization.load_file(get_manifest_path())
+    except (FileNotFoundError, serialization.DecodeError):
+        return {'stages': {}}
+    return manifest if manifest.get('version') == MANIFEST_VERSION else {'stages': {}}
+
+
+def save_manifest(manifest: dict) -> None:
+    """
+    Saves the manifest, replacing the previous one in a single step.
+    :param manifest: Manifest dictionary.
+    """
+    manifest['version'] = MANIFEST_VERSION
+    serialization.dump_file(get_manifest_path(), manifest)
+
+
+def output_unchanged(file_path: str, entry: dict) -> bool:
+    """
+    Checks if an output file still matches its manifest entry.
+    Only re-hashes the file when its size or modification time changed.
+    :param file_path: Path to the output file.
+    :param entry: Manifest entry of the file.
+    :return: True or False
+    """
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return False
+    if stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']:
+        return True
+    return hash_file(file_path) == entry['hash']
+
+
+def is_unchanged(stage: str, inputs_hash: str) -> bool:
+    """
+    Checks if a stage can be skipped: its inputs are the same as the last run and its outputs haven't changed.
+    :param stage: Stage name.
+    :param inputs_hash: Hash from get_inputs_hash.
+    :return: True or False
+    """
+    if FORCE:
+        return False
+
+    with LOCK:
+        entry = load_manifest()['stages'].get(stage)
+
+    if entry is None or entry['inputs'] != inputs_hash:
+        return False
+    return all(output_unchanged(os.path.join(helpers.OUTPUT_DIR, path), output)
+               for path, output in entry['outputs'].items())
+
+
+def record(stage: str, inputs_hash: str, output_files: list) -> None:
+    """
+    Saves a stage's inputs hash and the current state of its output files to the manifest.
+    :param stage: Stage name.
+    :param inputs_hash: Hash from get_inputs_hash.
+    :param output_files: Paths of the files the stage wrote.
+    """
+    outputs = {}
+    for file_path in output_files:
+        stat = os.stat(file_path)
+        outputs[os.path.relpath(file_path, helpers.OUTPUT_DIR)] = {
+            'hash': hash_file(file_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+        }
+
+    with LOCK:
+        manifest = load_manifest()
+        manifest['stages'][stage] = {'inputs': inputs_hash, 'outputs': outputs}
+        save_manifest(manifest)
@@ -0,0 +1,124 @@
+"""
+Dependency-aware stage scheduler.
+A stage is a dictionary with:
+- 'run': function running the stage
+- 'inputs': list of file paths the stage reads
+- 'outputs': list of file paths the stage writes
+- 'network': True if the stage makes API requests
+Stages writing the same output never run at the same time.
+"""
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable
+
+
+def get_producers(stages: dict, selected: list) -> dict:
+    """
+    Returns which of the selected stages writes each output.
+    :param stages: Dictionary of stage name: stage.
+    :param selected: Names of the stages to run.
+    :return: Dictionary of output path: stage name.
+    """
+    return {output: name for name in selected for output in stages[name]['outputs']}
+
+
+def get_dependencies(stages: dict, selected: list) -> dict:
+    """
+    Returns the selected stages each selected stage has to wait for.
+    :param stages: Dictionary of stage name: stage.
+    :param selected: Names of the stages to run.
+    :return: Dictionary of stage name: set of stage names.
+    """
+    producers = get_producers(stages, selected)
+    return {
+        name: {producers[path] for path in stages[name]['inputs'] if producers.get(path, name) != name}
+        for name in selected
+    }
+
+
+def get_conflicts(stages: dict, selected: list) -> dict:
+    """
+    Returns the selected stages each selected stage shares an output with and that come before it.
+    :param stages: Dictionary of stage name: stage.
+    :param selected: Names of the stages to run.
+    :return: Dictionary of stage name: set of stage names.
+    """
+    return {
+        name: {earlier for earlier in selected[:position]
+               if set(stages[earlier]['outputs']) & set(stages[name]['outputs'])}
+        for position, name in enumerate(selected)
+    }
+
+
+def get_missing_inputs(stage: dict, producers: dict) -> list:
+    """
+    Returns the stage's inputs that no selected stage writes and that don't exist yet.
+    :param stage: Stage dictionary.
+    :param producers: Dictionary of output path: stage name.
+    :return: List of missing file paths.
+    """
+    return [path for path in stage['inputs'] if path not in producers and not os.path.exists(path)]
+
+
+def run_stages(stages: dict, selected: list, workers: int = None, before_stage: Callable = None) -> dict:
+    """
+    Runs the selected stages, starting each one as soon as the stages writing its inputs have finished.
+    Independent stages run at the same time, stages writing the same output run one after another
+    in the selected order. A stage is skipped when a stage it depends on fails or one of its inputs is missing.
+    :param stages: Dictionary of stage name: stage.
+    :param selected: Names of the stages to run.
+    :param workers: Maximum number of stages running at once, defaults to the number of selected stages.
+    :param before_stage: Function called with the stage dictionary right before it's started.
+    :return: Dictionary of stage name: 'done', 'failed' or 'skipped'.
+    """
+    producers = get_producers(stages, selected)
+    dependencies = get_dependencies(stages, selected)
+    conflicts = get_conflicts(stages, selected)
+    results = {}
+    pending = list(selected)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=workers or max(len(selected), 1)) as executor:
+        while pending or running:
+            changed = True
+            while changed:
+                changed = False
+                for name in list(pending):
+                    if not conflicts[name] <= results.keys():
+                        continue
+                    states = {results.get(dependency) for dependency in dependencies[name]}
+                    if not states <= {'done'} and not states & {'failed', 'skipped'}:
+                        continue
+
+                    pending.remove(name)
+                    missing = get_missing_inputs(stages[name], producers)
+                    if states & {'failed', 'skipped'}:
+                        print(f'Skipping {name}: a stage it depends on did not complete.')
+                    elif missing:
+                        print(f'Skipping {name}: missing {", ".join(missing)}')
+                    else:
+                        if before_stage is not None:
+                            before_stage(stages[name])
+                        print(f'Starting {name}.')
+                        running[executor.submit(stages[name]['run'])] = name
+                        continue
+                    results[name] = 'skipped'
+                    changed = True
+
+            if not running:
+                for name in pending:
+                    print(f'Skipping {name}: its dependencies form a cycle.')
+                    results[name] = 'skipped'
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    future.result()
+                    results[name] = 'done'
+                except Exception as e:
+                    print(f'Stage {name} failed:', e)
+                    results[name] = 'failed'
+
+    return results
@@ -0,0 +1,232 @@
+"""
+Serialization of every file the tool reads and writes.
+- orjson when installed, stdlib json otherwise
+- Memory-mapped reads of large files
+- Formats: 'json' (pretty printed template output), 'compact', 'ndjson' (lists) and 'msgpack'
+"""
+import filecmp
+import json
+import mmap
+import os
+from typing import Any, Iterable, Iterator
+
+import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+config.load_env()
+
+# Constants
+FORMATS = ('json', 'compact', 'ndjson', 'msgpack')
+EXTENSIONS = {
+    '.json': 'json',
+    '.ndjson': 'ndjson',
+    '.msgpack': 'msgpack',
+}
+FORMAT_EXTENSIONS = {
+    'json': '.json',
+    'compact': '.json',
+    'ndjson': '.ndjson',
+    'msgpack': '.msgpack',
+}
+INTERMEDIATE_FORMAT = os.environ.get('INTERMEDIATE_FORMAT', 'compact')
+MMAP_THRESHOLD = 1024 * 1024
+DecodeError = json.JSONDecodeError
+
+
+def get_file_format(file_path: str) -> str:
+    """
+    Returns the format of a file from its extension.
+    :param file_path: Path to the file.
+    :return: Format name, 'json' for unknown extensions.
+    """
+    return EXTENSIONS.get(os.path.splitext(file_path)[1].lower(), 'json')
+
+
+def with_format_extension(file_path: str, fmt: str) -> str:
+    """
+    Returns the file path with the extension of the format.
+    :param file_path: Path to the file, e.g. 'Transactions/actuals_cashflow.json'.
+    :param fmt: Format name.
+    :return: File path, e.g. 'Transactions/actuals_cashflow.msgpack'.
+    """
+    return os.path.splitext(file_path)[0] + FORMAT_EXTENSIONS[fmt]
+
+
+def get_intermediate_path(file_path: str) -> str:
+    """
+    Returns the path of an intermediate file in the INTERMEDIATE_FORMAT.
+    :param file_path: Path to the file with any extension.
+    :return: File path.
+    """
+    return with_format_extension(file_path, INTERMEDIATE_FORMAT)
+
+
+def find_file(file_path: str) -> str | None:
+    """
+    Returns the first existing, non-empty variant of the file in any of the supported formats.
+    :param file_path: Path to the file with any extension, e.g. 'Livestock/original_livestock.json'.
+    :return: File path if found, None otherwise.
+    """
+    base_path = os.path.splitext(file_path)[0]
+    for extension in EXTENSIONS:
+        path = base_path + extension
+        if os.path.isfile(path) and os.path.getsize(path) > 0:
+            return path
+    return None
+
+
+def loads(data: bytes | bytearray | memoryview | str, fmt: str = 'json') -> Any:
+    """
+    Decodes serialized data.
+    :param data: Serialized data.
+    :param fmt: Format name, 'json' and 'compact' are decoded the same way.
+    :return: Decoded data.
+    """
+    if fmt == 'msgpack':
+        import msgpack
+        return msgpack.unpackb(data, raw=False)
+    if fmt == 'ndjson':
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return [loads(line) for line in data.splitlines() if line.strip()]
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def dumps(data: Any, fmt: str = 'compact', indent: int = 4, ensure_ascii: bool = True) -> bytes:
+    """
+    Encodes data.
+    'json' output is identical to json.dump with the same indent and ensure_ascii, so template files stay compatible.
+    :param data: Data to encode, 'ndjson' needs a list.
+    :param fmt: Format name.
+    :param indent: Indentation level for 'json'.
+    :param ensure_ascii: Whether to escape non-ASCII characters for 'json'.
+    :return: Encoded bytes.
+    """
+    match fmt:
+        case 'json':
+            return json.dumps(data, indent=indent, ensure_ascii=ensure_ascii).encode('utf-8')
+        case 'compact':
+            if orjson is not None:
+                try:
+                    return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+                except TypeError:
+                    # orjson doesn't handle e.g. integers over 64 bits, fall back to json
+                    pass
+            return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        case 'ndjson':
+            if not isinstance(data, list):
+                raise TypeError('NDJSON can only encode lists.')
+            return b''.join(dumps(item) + b'\n' for item in data)
+        case 'msgpack':
+            try:
+                import msgpack
+            except ImportError:
+                raise ImportError('MessagePack output needs the msgpack package.')
+            return msgpack.packb(data, use_bin_type=True)
+    raise ValueError(f'Unknown format: {fmt}. Use one of: {", ".join(FORMATS)}')
+
+
+def load_file(file_path: str, fmt: str = None) -> Any:
+    """
+    Reads and decodes a file, large files are memory-mapped instead of copied into memory.
+    :param file_path: Path to the file.
+    :param fmt: Format name, taken from the extension if not given.
+    :return: Decoded data.
+    """
+    fmt = fmt or get_file_format(file_path)
+    with open(file_path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size < MMAP_THRESHOLD:
+            return loads(file.read(), fmt)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                return loads(view, fmt)
+
+
+def iter_ndjson(file_path: str) -> Iterator[Any]:
+    """
+    Generator. Yields the records of an NDJSON file one line at a time.
+    :param file_path: Path to the NDJSON file.
+    :return: Iterator of records.
+    """
+    with open(file_path, 'rb') as file:
+        for line in file:
+            if line.strip():
+                yield loads(line)
+
+
+def dump_file(file_path: str, data: Any, fmt: str = 'json', indent: int = 4, ensure_ascii: bool = True) -> bool:
+    """
+    Encodes the data to a file, leaving the file untouched when its content is already identical.
+    :param file_path: Path to the file.
+    :param data: Data to encode.
+    :param fmt: Format name.
+    :param indent: Indentation level for 'json'.
+    :param ensure_ascii: Whether to escape non-ASCII characters for 'json'.
+    :return: True if the file was written, False if it was already up to date.
+    """
+    content = dumps(data, fmt, indent, ensure_ascii)
+    if file_has_content(file_path, content):
+        return False
+    with open(file_path + '.tmp', 'wb') as file:
+        file.write(content)
+    os.replace(file_path + '.tmp', file_path)
+    return True
+
+
+def file_has_content(file_path: str, content: bytes) -> bool:
+    """
+    Checks if a file already contains exactly the content.
+    :param file_path: Path to the file.
+    :param content: File content.
+    :return: True or False
+    """
+    try:
+        if os.path.getsize(file_path) != len(content):
+            return False
+        with open(file_path, 'rb') as file:
+            return file.read() == content
+    except FileNotFoundError:
+        return False
+
+
+def replace_if_changed(new_file_path: str, file_path: str) -> bool:
+    """
+    Moves a newly written file over the file, unless both files are identical.
+    :param new_file_path: Path to the newly written file, removed either way.
+    :param file_path: Path to the file to replace.
+    :return: True if the file was replaced, False if it was already up to date.
+    """
+    if os.path.isfile(file_path) and filecmp.cmp(new_file_path, file_path, shallow=False):
+        os.remove(new_file_path)
+        return False
+    os.replace(new_file_path, file_path)
+    return True
+
+
+def dump_json_stream(items: Iterable, file, indent: int = 4, ensure_ascii: bool = True) -> int:
+    """
+    Writes the items to the file as a JSON array one item at a time.
+    The output is identical to json.dump of the equivalent list.
+    :param items: Iterable of JSON serialisable items.
+    :param file: Writable text file.
+    :param indent: Indentation level.
+    :param ensure_ascii: Whether to escape non-ASCII characters.
+    :return: Number of items written.
+    """
+    prefix = ' ' * indent
+    count = 0
+    for item in items:
+        file.write(('[\n' if count == 0 else ',\n') + prefix)
+        file.write(json.dumps(item, indent=indent, ensure_ascii=ensure_ascii).replace('\n', '\n' + prefix))
+        count += 1
+    file.write('[]' if count == 0 else '\n]')
+    return count
@@ -0,0 +1,194 @@
+"""
+API snapshot bundles for offline runs.
+Record mode saves every API payload of a run into a versioned bundle directory,
+replay mode answers the API requests from a bundle without OAuth or any network access.
+A bundle is a bundle.json index of request key: payload file, plus the payload files in payloads/.
+"""
+import os
+import threading
+from datetime import datetime
+
+import config
+import helpers
+import serialization
+
+# Constants
+BUNDLE_VERSION = 1
+INDEX_FILE_NAME = 'bundle.json'
+PAYLOAD_DIR_NAME = 'payloads'
+MODES = ('record', 'replay')
+# Settings the request keys or the converted output depend on, replayed from the bundle
+BUNDLE_SETTINGS = ('FARM_ID', 'FARM_COUNTRY', 'CURRENT_YEAR', 'API_PAGE_SIZE', 'CASHFLOW_SHARD_MONTHS')
+
+# Global Variables
+BUNDLE_DIR = None
+ENTRIES = {}
+LOCK = threading.Lock()
+
+
+def get_mode() -> str | None:
+    """
+    Returns the snapshot mode, set with SNAPSHOT_MODE so batch worker processes share it.
+    :return: 'record', 'replay' or None.
+    """
+    mode = config.get('SNAPSHOT_MODE')
+    return mode if mode in MODES else None
+
+
+def get_bundle_dir(farm_id: str = None) -> str | None:
+    """
+    Returns the bundle directory, set with SNAPSHOT_DIR.
+    :param farm_id: Farm shortcode of a batch run, each farm has its own bundle in a subdirectory.
+    :return: Directory path, None if it isn't set.
+    """
+    bundle_dir = config.get('SNAPSHOT_DIR') or None
+    if bundle_dir is None or farm_id is None:
+        return bundle_dir
+    return os.path.join(bundle_dir, farm_id)
+
+
+def is_recording() -> bool:
+    """
+    Checks if API payloads are being saved to an open bundle.
+    :return: True or False
+    """
+    return BUNDLE_DIR is not None and get_mode() == 'record'
+
+
+def is_replaying() -> bool:
+    """
+    Checks if API requests are answered from a bundle instead of the network.
+    :return: True or False
+    """
+    return get_mode() == 'replay'
+
+
+def get_settings() -> dict:
+    """
+    Returns the current values of the BUNDLE_SETTINGS.
+    :return: Dictionary of setting name: value, settings that aren't set are left out.
+    """
+    settings = {'CURRENT_YEAR': helpers.get_current_year()}
+    for name in BUNDLE_SETTINGS:
+        try:
+            settings.setdefault(name, getattr(helpers, name))
+        except KeyError:
+            continue
+    return settings
+
+
+def load_index(bundle_dir: str) -> dict | None:
+    """
+    Returns a bundle's index.
+    :param bundle_dir: Bundle directory.
+    :return: Index dictionary, None if the bundle doesn't exist or is from another version.
+    """
+    try:
+        index = serialization.load_file(os.path.join(bundle_dir, INDEX_FILE_NAME))
+    except FileNotFoundError:
+        return None
+    except serialization.DecodeError:
+        print(f'Invalid JSON format in the snapshot bundle index {bundle_dir}.')
+        return None
+
+    if index.get('version') != BUNDLE_VERSION:
+        print(f"Snapshot bundle {bundle_dir} is version {index.get('version')}, expected {BUNDLE_VERSION}.")
+        return None
+    return index
+
+
+def open_bundle(bundle_dir: str = None) -> bool:
+    """
+    Opens a bundle for the mode from get_mode.
+    Recording adds to an existing bundle of the same version. Replaying applies the bundle's settings,
+    e.g. its farm and current year, so the run converts the same way as the recorded one.
+    :param bundle_dir: Bundle directory, defaults to get_bundle_dir.
+    :return: True if the bundle is open.
+    """
+    global BUNDLE_DIR
+
+    mode = get_mode()
+    bundle_dir = bundle_dir or get_bundle_dir()
+    if mode is None or bundle_dir is None:
+        print('Set both SNAPSHOT_MODE and SNAPSHOT_DIR to use a snapshot bundle.')
+        return False
+    index = load_index(bundle_dir)
+
+    if mode == 'replay':
+        if index is None:
+            print(f'No snapshot bundle to replay in {bundle_dir}.')
+            return False
+        for name, value in index['settings'].items():
+            setattr(helpers, name, value)
+        print(f"Replaying {len(index['entries'])} API payloads recorded {index['created_at']}.")
+    else:
+        os.makedirs(os.path.join(bundle_dir, PAYLOAD_DIR_NAME), exist_ok=True)
+
+    with LOCK:
+        ENTRIES.clear()
+        ENTRIES.update(index['entries'] if index is not None else {})
+    BUNDLE_DIR = bundle_dir
+    return True
+
+
+def close_bundle() -> None:
+    """
+    Writes the index of the bundle being recorded and closes the bundle.
+    """
+    global BUNDLE_DIR
+
+    if is_recording():
+        with LOCK:
+            entries = dict(ENTRIES)
+        serialization.dump_file(os.path.join(BUNDLE_DIR, INDEX_FILE_NAME), {
+            'version': BUNDLE_VERSION,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'settings': get_settings(),
+            'entries': entries,
+        })
+        print(f'{len(entries)} API payloads saved to the snapshot bundle {BUNDLE_DIR}.')
+
+    BUNDLE_DIR = None
+
+
+def record(key: str, api_type: str, path_vars: list | None, query_params: dict | None, body: bytes) -> None:
+    """
+    Saves an API payload to the bundle when recording.
+    :param key: Request key, see cache.make_key.
+    :param api_type: API type, see helpers.get_url.
+    :param path_vars: URL path variables.
+    :param query_params: Query parameters.
+    :param body: Response body.
+    """
+    if not is_recording():
+        return
+
+    file_name = os.path.join(PAYLOAD_DIR_NAME, f'{key}.json')
+    file_path = os.path.join(BUNDLE_DIR, file_name)
+    # Per thread temporary file, the same request can be made from several threads at once
+    temp_path = f'{file_path}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(body)
+    os.replace(temp_path, file_path)
+
+    with LOCK:
+        ENTRIES[key] = {
+            'api_type': api_type,
+            'path_vars': [str(var) for var in path_vars or []],
+            'query_params': {str(name): str(value) for name, value in (query_params or {}).items()},
+            'file': file_name,
+        }
+
+
+def lookup(key: str) -> bytes | None:
+    """
+    Returns a recorded API payload.
+    :param key: Request key, see cache.make_key.
+    :return: Response body, None if the bundle doesn't have the request.
+    """
+    with LOCK:
+        entry = ENTRIES.get(key)
+    if entry is None or BUNDLE_DIR is None:
+        return None
+    with open(os.path.join(BUNDLE_DIR, entry['file']), 'rb') as file:
+        return file.read()
@@ -0,0 +1,104 @@
+"""
+Pipeline stages run by the scheduler.
+"""
+from functools import partial
+
+from Accounts import accounts
+from Crops import crops
+from Livestock import livestock
+from Transactions import transactions
+import helpers
+import snapshots
+
+DEFAULT_STAGES = ['accounts', 'livestock', 'cashflows', 'transactions']
+STAGE_NAMES = ['accounts', 'livestock', 'cashflows', 'transactions', 'dedup-livestock', 'crops',
+               'dedup-crops']
+
+
+def get_stages(stage_options: dict = None) -> dict:
+    """
+    Returns the pipeline's stages with their inputs and outputs inside helpers.OUTPUT_DIR.
+    Nothing is created, the stages create their directories when they run.
+    :param stage_options: Dictionary of stage name: keyword arguments for its run function,
+    e.g. {'crops': {'snapshot_file_path': 'snapshot.html'}}.
+    :return: Dictionary of stage name: stage, see scheduler.
+    """
+    stages = {
+        'accounts': {
+            'run': accounts.convert,
+            'inputs': [],
+            'outputs': [helpers.join_output_path('Accounts', 'accounts.json'),
+                        helpers.join_output_path('Accounts', 'revenue.json'),
+                        helpers.join_output_path('Accounts', 'equity.json')],
+            'network': True,
+        },
+        'livestock': {
+            'run': livestock.convert,
+            'inputs': [],
+            'outputs': [helpers.join_output_path('Livestock')],
+            'network': True,
+        },
+        'cashflows': {
+            'run': transactions.create_cashflows,
+            'inputs': [],
+            'outputs': [transactions.get_cashflow_file_path(data_type)
+                        for data_type in transactions.CASHFLOW_DATA_TYPES],
+            'network': True,
+        },
+        'transactions': {
+            'run': partial(transactions.convert, fetch=False),
+            'inputs': [helpers.join_output_path('Accounts', 'revenue.json'),
+                       helpers.join_output_path('Accounts', 'equity.json')]
+                      + [transactions.get_cashflow_file_path(data_type)
+                         for data_type in transactions.CASHFLOW_DATA_TYPES],
+            'outputs': [helpers.join_output_path('Transactions', 'transactions.json')],
+            'network': False,
+        },
+        'dedup-livestock': {
+            'run': transactions.remove_duplicate_livestock_transactions,
+            'inputs': [helpers.join_output_path('Transactions', 'transactions.json'),
+                       helpers.join_output_path('Transactions', 'livestock.json')],
+            'outputs': [helpers.join_output_path('Transactions', 'new_transactions.json')],
+            'network': False,
+        },
+        'crops': {
+            'run': crops.convert,
+            'inputs': [],
+            'outputs': [helpers.join_output_path('Transactions', 'invoices.json')],
+            'network': False,
+        },
+        'dedup-crops': {
+            'run': transactions.remove_duplicate_crop_transactions,
+            'inputs': [helpers.join_output_path('Transactions', 'transactions.json'),
+                       helpers.join_output_path('Transactions', 'invoices.json'),
+                       helpers.join_output_path('Accounts', 'accounts.json')],
+            'outputs': [helpers.join_output_path('Transactions', 'new_transactions.json')],
+            'network': False,
+        },
+    }
+
+    for name, options in (stage_options or {}).items():
+        stages[name]['run'] = partial(stages[name]['run'], **options)
+
+    return stages
+
+
+def before_stage(stage: dict):
+    """
+    Makes sure the access token is valid before a stage that uses the API starts.
+    :param stage: Stage dictionary.
+    """
+    if stage['network'] and not snapshots.is_replaying():
+        helpers.refresh_token_if_expired()
+
+
+def uses_network(stage_names: list) -> bool:
+    """
+    Checks if any of the stages use the API. Nothing does when replaying a snapshot bundle.
+    :param stage_names: Names of the stages.
+    :return: True or False
+    """
+    if snapshots.is_replaying():
+        return False
+    stages = get_stages()
+    return any(stages[name]['network'] for name in stage_names)
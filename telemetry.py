@@ -0,0 +1,257 @@
+"""
+Network telemetry of the API layer.
+Every request is recorded with its API type, status, latency, response size, retries and cache result,
+aggregated into per-endpoint latency histograms and written as a JSON run summary and a Prometheus textfile.
+"""
+import bisect
+import math
+import os
+import threading
+
+import serialization
+
+# Constants
+TELEMETRY_ENABLED = os.environ.get('TELEMETRY_ENABLED', '1').lower() not in ('0', 'false', 'no', '')
+SUMMARY_FILE_NAME = 'telemetry.json'
+PROMETHEUS_FILE_NAME = 'telemetry.prom'
+# Directory of node_exporter's textfile collector, the textfile is written there too when set
+PROMETHEUS_DIR = os.environ.get('TELEMETRY_PROMETHEUS_DIR')
+METRIC_PREFIX = 'figured_api'
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PERCENTILES = (50, 95, 99)
+
+# Global Variables
+ENDPOINTS = {}
+LOCK = threading.Lock()
+
+
+def create_endpoint() -> dict:
+    """
+    Creates the counters of an endpoint.
+    :return: Endpoint dictionary.
+    """
+    return {
+        'requests': 0,
+        'statuses': {},
+        'cache': {},
+        'bytes': 0,
+        'retries': 0,
+        'seconds': 0.0,
+        'buckets': [0] * (len(HISTOGRAM_BUCKETS) + 1),
+        'latencies': [],
+    }
+
+
+def record_request(api_type: str, status: int | str, latency: float, response_bytes: int = 0,
+                   retries: int = 0, cache_result: str = 'bypass') -> None:
+    """
+    Records a finished request.
+    :param api_type: API type, see helpers.get_url, or 'token'.
+    :param status: Response status code, 'error' when no response was received.
+    :param latency: Seconds from sending the request to the response, including retries.
+    :param response_bytes: Size of the response body.
+    :param retries: Number of retries before the response.
+    :param cache_result: 'hit', 'miss', 'revalidated' or 'bypass'.
+    """
+    if not TELEMETRY_ENABLED:
+        return
+
+    with LOCK:
+        endpoint = ENDPOINTS.get(api_type)
+        if endpoint is None:
+            endpoint = ENDPOINTS[api_type] = create_endpoint()
+        endpoint['requests'] += 1
+        endpoint['statuses'][str(status)] = endpoint['statuses'].get(str(status), 0) + 1
+        endpoint['cache'][cache_result] = endpoint['cache'].get(cache_result, 0) + 1
+        endpoint['bytes'] += response_bytes
+        endpoint['retries'] += retries
+        endpoint['seconds'] += latency
+        endpoint['buckets'][bisect.bisect_left(HISTOGRAM_BUCKETS, latency)] += 1
+        endpoint['latencies'].append(latency)
+
+
+def get_retries(response) -> int:
+    """
+    Returns how many times urllib3 retried a request before the response.
+    :param response: requests Response.
+    :return: Number of retries.
+    """
+    retries = getattr(response.raw, 'retries', None)
+    return len(retries.history) if retries is not None else 0
+
+
+def get_percentile(sorted_values: list, percentile: float) -> float | None:
+    """
+    Returns the nearest-rank percentile of the values.
+    :param sorted_values: Values in ascending order.
+    :param percentile: Percentile from 0 to 100.
+    :return: Percentile value, None if there are no values.
+    """
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(percentile / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def get_summary() -> dict:
+    """
+    Returns the aggregated telemetry of every endpoint.
+    :return: Dictionary with the totals and API type: endpoint summary.
+    """
+    with LOCK:
+        endpoints = {api_type: dict(endpoint, latencies=sorted(endpoint['latencies']))
+                     for api_type, endpoint in ENDPOINTS.items()}
+
+    summary = {}
+    for api_type, endpoint in sorted(endpoints.items()):
+        latencies = endpoint['latencies']
+        summary[api_type] = {
+            'requests': endpoint['requests'],
+            'statuses': endpoint['statuses'],
+            'cache': endpoint['cache'],
+            'bytes': endpoint['bytes'],
+            'retries': endpoint['retries'],
+            'seconds': round(endpoint['seconds'], 6),
+            'latency': {
+                'mean': round(endpoint['seconds'] / endpoint['requests'], 6),
+                'max': round(latencies[-1], 6),
+                **{f'p{percentile}': round(get_percentile(latencies, percentile), 6) for percentile in PERCENTILES},
+            },
+            'histogram': {
+                **{str(bound): count for bound, count in zip(HISTOGRAM_BUCKETS, endpoint['buckets'])},
+                '+Inf': endpoint['buckets'][-1],
+            },
+        }
+
+    return {
+        'requests': sum(endpoint['requests'] for endpoint in summary.values()),
+        'bytes': sum(endpoint['bytes'] for endpoint in summary.values()),
+        'retries': sum(endpoint['retries'] for endpoint in summary.values()),
+        'seconds': round(sum(endpoint['seconds'] for endpoint in summary.values()), 6),
+        'endpoints': summary,
+    }
+
+
+def format_labels(labels: dict) -> str:
+    """
+    Formats Prometheus labels.
+    :param labels: Dictionary of label name: value.
+    :return: Label string, e.g. '{api_type="accounts"}'.
+    """
+    escaped = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def get_prometheus_text(labels: dict = None) -> str:
+    """
+    Returns the telemetry in the Prometheus text exposition format.
+    :param labels: Labels added to every sample, e.g. {'farm': 'ABC123'}.
+    :return: Prometheus textfile content.
+    """
+    labels = labels or {}
+    summary = get_summary()['endpoints']
+    with LOCK:
+        buckets = {api_type: list(endpoint['buckets']) for api_type, endpoint in ENDPOINTS.items()}
+
+    lines = [
+        f'# HELP {METRIC_PREFIX}_requests_total API requests by endpoint and status.',
+        f'# TYPE {METRIC_PREFIX}_requests_total counter',
+    ]
+    for api_type, endpoint in summary.items():
+        for status, count in sorted(endpoint['statuses'].items()):
+            lines.append(f'{METRIC_PREFIX}_requests_total'
+                         f'{format_labels({**labels, "api_type": api_type, "status": status})} {count}')
+
+    lines += [
+        f'# HELP {METRIC_PREFIX}_cache_total API requests by endpoint and response cache result.',
+        f'# TYPE {METRIC_PREFIX}_cache_total counter',
+    ]
+    for api_type, endpoint in summary.items():
+        for result, count in sorted(endpoint['cache'].items()):
+            lines.append(f'{METRIC_PREFIX}_cache_total'
+                         f'{format_labels({**labels, "api_type": api_type, "result": result})} {count}')
+
+    for name, key, help_text in [('response_bytes_total', 'bytes', 'Response body bytes by endpoint.'),
+                                 ('retries_total', 'retries', 'Retried requests by endpoint.')]:
+        lines += [f'# HELP {METRIC_PREFIX}_{name} {help_text}', f'# TYPE {METRIC_PREFIX}_{name} counter']
+        for api_type, endpoint in summary.items():
+            lines.append(f'{METRIC_PREFIX}_{name}{format_labels({**labels, "api_type": api_type})} {endpoint[key]}')
+
+    lines += [
+        f'# HELP {METRIC_PREFIX}_request_duration_seconds API request latency by endpoint.',
+        f'# TYPE {METRIC_PREFIX}_request_duration_seconds histogram',
+    ]
+    for api_type, endpoint in summary.items():
+        cumulative = 0
+        for bound, count in zip(list(HISTOGRAM_BUCKETS) + ['+Inf'], buckets[api_type]):
+            cumulative += count
+            lines.append(f'{METRIC_PREFIX}_request_duration_seconds_bucket'
+                         f'{format_labels({**labels, "api_type": api_type, "le": bound})} {cumulative}')
+        endpoint_labels = format_labels({**labels, 'api_type': api_type})
+        lines.append(f'{METRIC_PREFIX}_request_duration_seconds_sum{endpoint_labels} {endpoint["seconds"]}')
+        lines.append(f'{METRIC_PREFIX}_request_duration_seconds_count{endpoint_labels} {endpoint["requests"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_summary(file_path: str) -> None:
+    """
+    Writes the run summary JSON file.
+    :param file_path: Path to the JSON file.
+    """
+    serialization.dump_file(file_path, get_summary())
+
+
+def write_prometheus(file_path: str, labels: dict = None) -> None:
+    """
+    Writes the Prometheus textfile, replacing the previous one in a single step for the textfile collector.
+    :param file_path: Path to the .prom file.
+    :param labels: Labels added to every sample, e.g. {'farm': 'ABC123'}.
+    """
+    with open(file_path + '.tmp', 'w', encoding='utf-8') as file:
+        file.write(get_prometheus_text(labels))
+    os.replace(file_path + '.tmp', file_path)
+
+
+def write_run_files(output_dir: str, farm_id: str) -> None:
+    """
+    Writes the run summary and Prometheus textfile to the output directory, and to PROMETHEUS_DIR when set.
+    :param output_dir: Directory to write the files to.
+    :param farm_id: Farm shortcode, added as the farm label.
+    """
+    if not TELEMETRY_ENABLED:
+        return
+    labels = {'farm': farm_id}
+    write_summary(os.path.join(output_dir, SUMMARY_FILE_NAME))
+    write_prometheus(os.path.join(output_dir, PROMETHEUS_FILE_NAME), labels)
+    if PROMETHEUS_DIR:
+        write_prometheus(os.path.join(PROMETHEUS_DIR, f'{METRIC_PREFIX}_{farm_id}.prom'), labels)
+
+
+def print_summary() -> None:
+    """
+    Prints a table of the requests, time and latency percentiles of each endpoint.
+    """
+    summary = get_summary()
+    if not summary['requests']:
+        return
+
+    print(f"{'Endpoint':<28}{'Requests':>9}{'Errors':>8}{'Cached':>8}{'Retries':>8}"
+          f"{'Seconds':>9}{'p50':>8}{'p95':>8}{'p99':>8}")
+    for api_type, endpoint in summary['endpoints'].items():
+        errors = sum(count for status, count in endpoint['statuses'].items() if not status.startswith(('2', '3')))
+        cached = endpoint['cache'].get('hit', 0) + endpoint['cache'].get('revalidated', 0)
+        latency = endpoint['latency']
+        print(f"{api_type:<28}{endpoint['requests']:>9}{errors:>8}{cached:>8}{endpoint['retries']:>8}"
+              f"{endpoint['seconds']:>9.2f}{latency['p50']:>8.3f}{latency['p95']:>8.3f}{latency['p99']:>8.3f}")
+
+
+def reset() -> None:
+    """
+    Clears the recorded telemetry.
+    """
+    with LOCK:
+        ENDPOINTS.clear()
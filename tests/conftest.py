@@ -0,0 +1,74 @@
+"""
+Test configuration, the modules are imported from the repository root like main.py does.
+"""
+import os
+import sys
+from time import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Cache import cache  # noqa: E402
+import helpers  # noqa: E402
+
+
+class FakeResponse:
+    """
+    Stands in for a requests Response.
+    """
+
+    def __init__(self, status_code: int = 200, body: bytes = b'{}', headers: dict = None):
+        self.status_code = status_code
+        self.content = body
+        self.text = body.decode('utf-8')
+        self.headers = headers or {}
+        self.raw = None
+
+
+class FakeSession:
+    """
+    Stands in for the API session, answering requests with the queued responses in order,
+    or with the handler's response when one is set.
+    """
+
+    def __init__(self):
+        self.responses = []
+        self.requests = []
+        self.handler = None
+
+    def get(self, url: str, headers: dict = None, params: dict = None, timeout: float = None) -> FakeResponse:
+        self.requests.append({'url': url, 'headers': dict(headers or {}), 'params': dict(params or {})})
+        if self.handler is not None:
+            return self.handler(url, dict(params or {}))
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def api_cache(monkeypatch, tmp_path):
+    """
+    An empty, enabled API response cache in a temporary directory.
+    """
+    monkeypatch.setattr(cache, 'CACHE_FILE_PATH', str(tmp_path / 'cache.sqlite'))
+    monkeypatch.setattr(cache, 'CACHE_ENABLED', True)
+    monkeypatch.setattr(cache, 'CONNECTION', None)
+    monkeypatch.setattr(cache, 'STATS', dict.fromkeys(cache.STATS, 0))
+    yield cache
+    if cache.CONNECTION is not None:
+        cache.CONNECTION.close()
+
+
+@pytest.fixture
+def api_session(monkeypatch, api_cache):
+    """
+    A fake API session with a valid access token, helpers.get_api sends its requests to it.
+    """
+    session = FakeSession()
+    monkeypatch.setattr(helpers, 'get_session', lambda: session)
+    # Required settings are resolved lazily, so they're set in the module's namespace instead of with setattr
+    monkeypatch.setitem(vars(helpers), 'API_URL', 'https://api.test')
+    monkeypatch.setitem(vars(helpers), 'FARM_ID', 'farm')
+    monkeypatch.setattr(helpers, 'OAUTH_DETAILS', {'access_token': 'token-1', 'refresh_token': 'refresh',
+                                                   'expires_at': time() + 3600})
+    monkeypatch.delenv('SNAPSHOT_MODE', raising=False)
+    return session
@@ -0,0 +1,60 @@
+"""
+Tests for Accounts/accounts.py.
+"""
+import pytest
+
+import helpers
+import serialization
+from Accounts import accounts
+
+
+@pytest.mark.parametrize('name, system_account', [
+    ('Rounding', 'ROUNDING'),
+    ('Rounding8', 'ROUNDING'),
+    ('Rounding 8', 'ROUNDING'),
+    ('Unpaid expense claims (3564)', 'UNPAIDEXPCLM'),
+    ('  Unpaid   Expense Claims ', 'UNPAIDEXPCLM'),
+    ('ACCOUNTS PAYABLE (XERO)', 'CREDITORS'),
+    ('Accounts Payable (A/P) (deleted)', 'CREDITORS'),
+    ('GST', 'GST'),
+])
+def test_get_system_account_normalises_names(name, system_account):
+    assert accounts.get_system_account(name) == system_account
+
+
+@pytest.mark.parametrize('name', [None, '', 'Rounding Account', 'Sales 2', '(3564)'])
+def test_get_system_account_unknown_names(name):
+    assert accounts.get_system_account(name) is None
+
+
+def test_normalise_account_name():
+    assert accounts.normalise_account_name('Unpaid  Expense Claims (3564)') == 'unpaid expense claims'
+    assert accounts.normalise_account_name('Rounding8') == 'rounding'
+    # Only a trailing number is a suffix
+    assert accounts.normalise_account_name('2 Wages Payable') == '2 wages payable'
+
+
+def test_convert_accounts_with_suffixed_system_accounts(tmp_path, monkeypatch):
+    monkeypatch.setattr(helpers, 'OUTPUT_DIR', str(tmp_path))
+    farm_accounts = {
+        'a': {'code': '860', 'name': 'Rounding8', 'class': 'EXPENSE', 'system_account': True},
+        'b': {'code': '801', 'name': 'Unpaid expense claims (3564)', 'class': 'LIABILITY', 'system_account': True},
+        'c': {'code': '200', 'name': 'Sales', 'class': 'REVENUE', 'system_account': False},
+    }
+
+    assert accounts.convert_accounts(farm_accounts)
+
+    converted = serialization.load_file(helpers.get_output_path('Accounts', 'accounts.json'))
+    assert {account['Name']: account['SystemAccount'] for account in converted} == {
+        'Sales': '', 'Unpaid expense claims (3564)': 'UNPAIDEXPCLM', 'Rounding8': 'ROUNDING'}
+    assert serialization.load_file(helpers.get_output_path('Accounts', 'revenue.json')) == [200]
+    assert serialization.load_file(helpers.get_output_path('Accounts', 'equity.json')) == [801]
+
+
+def test_convert_accounts_rejects_unknown_system_accounts(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(helpers, 'OUTPUT_DIR', str(tmp_path))
+    farm_accounts = {'a': {'code': '1', 'name': 'Mystery', 'class': 'EXPENSE', 'system_account': True}}
+
+    assert not accounts.convert_accounts(farm_accounts)
+    assert 'Mystery is a system account' in capsys.readouterr().out
+    assert not (tmp_path / 'Accounts' / 'accounts.json').exists()
@@ -0,0 +1,94 @@
+"""
+Tests for Cache/cache.py and the cached requests of helpers.get_api.
+"""
+import itertools
+
+import helpers
+from Cache import cache
+from conftest import FakeResponse
+
+
+def test_get_ttl(monkeypatch):
+    monkeypatch.delenv('CACHE_TTL_CASHFLOW', raising=False)
+    assert cache.get_ttl('cashflow') == cache.CACHE_TTLS['cashflow']
+    assert cache.get_ttl('unknown') == cache.DEFAULT_TTL
+
+    monkeypatch.setenv('CACHE_TTL_CASHFLOW', '5')
+    assert cache.get_ttl('cashflow') == 5
+
+
+def test_entry_is_stale_after_its_ttl(api_cache, monkeypatch):
+    api_cache.store('key', 'cashflow', b'{}')
+    entry = api_cache.lookup('key')
+    assert api_cache.is_fresh(entry)
+
+    stored_at = entry['stored_at']
+    monkeypatch.setattr(cache, 'time', lambda: stored_at + cache.get_ttl('cashflow') + 1)
+    assert not api_cache.is_fresh(entry)
+
+
+def test_conditional_headers():
+    assert cache.conditional_headers(None) == {}
+    assert cache.conditional_headers({'etag': '"v1"', 'last_modified': 'Mon, 02 Jan 2023 00:00:00 GMT'}) == {
+        'If-None-Match': '"v1"',
+        'If-Modified-Since': 'Mon, 02 Jan 2023 00:00:00 GMT',
+    }
+
+
+def test_evicts_least_recently_used(api_cache, monkeypatch):
+    clock = itertools.count(1000)
+    monkeypatch.setattr(cache, 'time', lambda: next(clock))
+    monkeypatch.setattr(cache, 'CACHE_MAX_BYTES', 10)
+
+    api_cache.store('a', 'accounts', b'aaaa')
+    api_cache.store('b', 'accounts', b'bbbb')
+    api_cache.lookup('a')
+    api_cache.store('c', 'accounts', b'cccc')
+
+    assert api_cache.lookup('b') is None
+    assert api_cache.lookup('a')['body'] == b'aaaa'
+    assert api_cache.lookup('c')['body'] == b'cccc'
+    assert api_cache.get_stats()['evictions'] == 1
+
+
+def test_skips_bodies_larger_than_the_cache(api_cache, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_MAX_BYTES', 3)
+    api_cache.store('a', 'accounts', b'aaaa')
+
+    assert api_cache.lookup('a') is None
+
+
+def test_get_api_serves_fresh_entries_from_the_cache(api_session):
+    api_session.responses.append(FakeResponse(200, b'{"data": [1]}', {'ETag': '"v1"'}))
+
+    assert helpers.get_api('accounts') == {'data': [1]}
+    assert helpers.get_api('accounts') == {'data': [1]}
+    assert len(api_session.requests) == 1
+    assert cache.get_stats()['hits'] == 1
+
+
+def test_get_api_revalidates_stale_entries_with_their_etag(api_session, monkeypatch):
+    api_session.responses.append(FakeResponse(200, b'{"data": [1]}', {'ETag': '"v1"'}))
+    helpers.get_api('accounts')
+
+    stored_at = cache.lookup(cache.make_key('accounts', None, None, 'farm'))['stored_at']
+    monkeypatch.setattr(cache, 'time', lambda: stored_at + cache.get_ttl('accounts') + 1)
+    api_session.responses.append(FakeResponse(304, b''))
+
+    assert helpers.get_api('accounts') == {'data': [1]}
+    assert api_session.requests[1]['headers']['If-None-Match'] == '"v1"'
+    assert cache.get_stats()['revalidated'] == 1
+    # The server confirmed the entry, so its TTL starts again
+    assert cache.is_fresh(cache.lookup(cache.make_key('accounts', None, None, 'farm')))
+
+
+def test_get_api_replaces_changed_entries(api_session, monkeypatch):
+    api_session.responses.append(FakeResponse(200, b'{"data": [1]}', {'ETag': '"v1"'}))
+    helpers.get_api('accounts')
+
+    stored_at = cache.lookup(cache.make_key('accounts', None, None, 'farm'))['stored_at']
+    monkeypatch.setattr(cache, 'time', lambda: stored_at + cache.get_ttl('accounts') + 1)
+    api_session.responses.append(FakeResponse(200, b'{"data": [2]}', {'ETag': '"v2"'}))
+
+    assert helpers.get_api('accounts') == {'data': [2]}
+    assert cache.lookup(cache.make_key('accounts', None, None, 'farm'))['etag'] == '"v2"'
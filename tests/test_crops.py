@@ -0,0 +1,109 @@
+"""
+Tests for Crops/crops.py.
+"""
+import os
+
+import pytest
+
+import helpers
+from Crops import crops
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'crops_activity.html')
+EMPTY_FIXTURE_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'crops_activity_empty.html')
+
+pytest.importorskip('bs4')
+
+
+@pytest.fixture(autouse=True)
+def current_year(monkeypatch):
+    """
+    Fixes the current year the activity dates are relative to.
+    """
+    monkeypatch.setattr(helpers, 'CURRENT_YEAR', 2023)
+
+
+def crops_html(file_path: str = FIXTURE_PATH) -> str:
+    """
+    Returns a saved activity page fixture.
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+class FakeDriver:
+    """
+    Stands in for a WebDriver showing the activity page fixtures in turn, one per page_source read.
+    """
+
+    def __init__(self, *pages: str):
+        self.pages = list(pages)
+
+    @property
+    def page_source(self) -> str:
+        return self.pages.pop(0) if len(self.pages) > 1 else self.pages[0]
+
+
+def count_rows(driver: FakeDriver) -> int:
+    """
+    Counts the activity lines of the driver's page.
+    """
+    return len(crops.parse_activity_rows(driver.page_source))
+
+
+def test_parse_activity_rows_leaves_out_status_text():
+    rows = crops.parse_activity_rows(crops_html())
+
+    assert rows[0] == {'fields': ['Sowing', '15 Mar 2023', 'Seed', '10', '$12.50', '$1,250.00'], 'status': 'actuals'}
+    assert rows[2]['status'] == 'forecast'
+    assert len(rows[2]['fields']) == len(crops.ACTIVITY_LINE_FIELDS)
+    assert rows[4]['status'] is None
+
+
+def test_parse_snapshot(capsys):
+    invoices = crops.parse_snapshot(crops_html())
+
+    assert invoices == [
+        {
+            'transaction_type': 'actuals',
+            'year': 0,
+            'month': 3,
+            'lines': [
+                {'activity': 'Sowing', 'account': 'Seed', 'amount': '1250.0'},
+                {'activity': 'Fertiliser', 'account': 'Fertiliser', 'amount': '160.0'},
+            ],
+        },
+        {
+            'transaction_type': 'forecast',
+            'year': 1,
+            'month': 10,
+            'lines': [{'activity': 'Spraying', 'account': 'Chemicals', 'amount': '-120.0'}],
+        },
+    ]
+    assert 'Skipped 2 activity rows: 1 not a line, 1 no status' in capsys.readouterr().out
+
+
+def test_parse_snapshot_file():
+    assert crops.parse_snapshot_file(FIXTURE_PATH) == crops.parse_snapshot(crops_html())
+
+
+def test_parse_snapshot_of_an_empty_season(capsys):
+    assert crops.parse_snapshot(crops_html(EMPTY_FIXTURE_PATH)) == []
+    assert 'Skipped' not in capsys.readouterr().out
+
+
+def test_empty_activity_table_settles(monkeypatch):
+    clock = iter([0.0, 0.5, 1.0])
+    monkeypatch.setattr(crops, 'monotonic', lambda: next(clock))
+    settled = crops.get_settled_condition(count_rows, settle_time=1.0)
+    driver = FakeDriver(crops_html(EMPTY_FIXTURE_PATH))
+
+    assert [settled(driver) for _ in range(3)] == [False, False, True]
+
+
+def test_loading_activity_lines_restart_the_settle_time(monkeypatch):
+    clock = iter([0.0, 0.5, 1.0, 1.5])
+    monkeypatch.setattr(crops, 'monotonic', lambda: next(clock))
+    settled = crops.get_settled_condition(count_rows, settle_time=1.0)
+    driver = FakeDriver(crops_html(EMPTY_FIXTURE_PATH), crops_html(), crops_html())
+
+    assert [settled(driver) for _ in range(4)] == [False, False, False, True]
@@ -0,0 +1,126 @@
+"""
+Tests for helpers.py.
+"""
+import json
+from time import time
+
+import pytest
+
+import helpers
+from conftest import FakeResponse
+from OAuth2 import oauth
+
+RECORDS = [{'id': number} for number in range(1, 24)]
+
+
+def get_page_handler(meta: str = None, failed_page: int = None):
+    """
+    Returns a fake session handler serving RECORDS in pages, with the meta the API would send.
+    :param meta: 'last_page', 'total' or None for responses without a meta.
+    :param failed_page: Page answered with a server error.
+    """
+    def handler(url: str, params: dict) -> FakeResponse:
+        page, per_page = int(params['page']), int(params['per_page'])
+        if page == failed_page:
+            return FakeResponse(500, b'error')
+        body = {'data': RECORDS[(page - 1) * per_page:page * per_page]}
+        if meta == 'last_page':
+            body['meta'] = {'last_page': -(-len(RECORDS) // per_page)}
+        elif meta == 'total':
+            body['meta'] = {'total': len(RECORDS)}
+        return FakeResponse(200, json.dumps(body).encode('utf-8'))
+
+    return handler
+
+
+@pytest.mark.parametrize('meta', ['last_page', 'total', None])
+def test_iter_api_yields_every_page_in_order(api_session, meta):
+    api_session.handler = get_page_handler(meta)
+
+    assert list(helpers.iter_api('livestock_transactions', per_page=5, prefetch=3)) == RECORDS
+    pages = sorted(int(request['params']['page']) for request in api_session.requests)
+    # Without a meta the short fifth page ends the requests
+    assert pages == [1, 2, 3, 4, 5]
+
+
+def test_iter_api_raises_on_a_failed_page(api_session):
+    api_session.handler = get_page_handler('last_page', failed_page=3)
+
+    records = helpers.iter_api('livestock_transactions', per_page=5, prefetch=2)
+    with pytest.raises(RuntimeError, match='page 3'):
+        list(records)
+
+
+def test_iter_api_raises_on_a_failed_first_page(api_session):
+    api_session.handler = get_page_handler('last_page', failed_page=1)
+
+    with pytest.raises(RuntimeError, match='page 1'):
+        next(helpers.iter_api('livestock_transactions', per_page=5))
+
+
+def test_get_last_page():
+    assert helpers.get_last_page({'last_page': 4}, 10) == 4
+    assert helpers.get_last_page({'total': 41}, 10) == 5
+    assert helpers.get_last_page({'total': 0}, 10) == 1
+    assert helpers.get_last_page({}, 10) is None
+
+
+def refresh_to(token: str):
+    """
+    Returns a stand-in for oauth.refresh_token that saves a new access token.
+    """
+    def refresh_token(force: bool = False, failed_token: str = None) -> bool:
+        helpers.OAUTH_DETAILS = {'access_token': token, 'refresh_token': 'refresh', 'expires_at': time() + 3600}
+        return True
+
+    return refresh_token
+
+
+def fail_refresh(force: bool = False, failed_token: str = None) -> bool:
+    """
+    Stands in for oauth.refresh_token when the refresh token was revoked.
+    """
+    raise ValueError('(invalid_grant) The refresh token is invalid.')
+
+
+def test_get_api_retries_with_a_refreshed_token_after_401(api_session, monkeypatch):
+    monkeypatch.setattr(oauth, 'refresh_token', refresh_to('token-2'))
+    api_session.responses = [FakeResponse(401, b'expired'), FakeResponse(200, b'{"data": [1]}')]
+
+    assert helpers.get_api('accounts', use_cache=False) == {'data': [1]}
+    assert [request['headers']['Authorization'] for request in api_session.requests] \
+        == ['Bearer token-1', 'Bearer token-2']
+
+
+def test_get_api_returns_none_when_the_refresh_after_401_fails(api_session, monkeypatch, capsys):
+    monkeypatch.setattr(oauth, 'refresh_token', fail_refresh)
+    api_session.responses = [FakeResponse(401, b'expired')]
+
+    assert helpers.get_api('accounts', use_cache=False) is None
+    assert 'Error refreshing the access token: (invalid_grant)' in capsys.readouterr().out
+    assert len(api_session.requests) == 1
+
+
+def test_get_api_returns_none_when_an_expired_token_fails_to_refresh(api_session, monkeypatch, capsys):
+    monkeypatch.setattr(oauth, 'refresh_token', fail_refresh)
+    helpers.OAUTH_DETAILS['expires_at'] = time() - 1
+
+    assert helpers.get_api('accounts', use_cache=False) is None
+    assert 'Error refreshing the access token: (invalid_grant)' in capsys.readouterr().out
+    assert api_session.requests == []
+
+
+def test_get_api_returns_none_when_the_refreshed_token_fails_to_refresh(api_session, monkeypatch, capsys):
+    def refresh_token(force: bool = False, failed_token: str = None) -> bool:
+        if failed_token is None:
+            fail_refresh()
+        # The new token has already expired, so reading it refreshes again
+        helpers.OAUTH_DETAILS = {'access_token': 'token-2', 'refresh_token': 'refresh', 'expires_at': time() - 1}
+        return True
+
+    monkeypatch.setattr(oauth, 'refresh_token', refresh_token)
+    api_session.responses = [FakeResponse(401, b'expired')]
+
+    assert helpers.get_api('accounts', use_cache=False) is None
+    assert 'Error refreshing the access token: (invalid_grant)' in capsys.readouterr().out
+    assert len(api_session.requests) == 1
@@ -0,0 +1,185 @@
+"""
+Tests for Livestock/livestock.py.
+"""
+import json
+import os
+import random
+
+import pytest
+
+from conftest import FakeResponse
+import helpers
+import serialization
+from Benchmarks import synthetic
+from Livestock import livestock
+
+
+def convert_with_list_scan(transactions: list, trackers: list) -> dict:
+    """
+    The duplicate checks convert_transactions made before its transactions were hash indexed,
+    scanning each tracker's converted transactions with dictionary equality.
+    :return: Dictionary of tracker name: converted transactions.
+    """
+    stock_classes = {tracker['id']: {item['uuid']: item['name'] for item in tracker['stock_classes']}
+                     for tracker in trackers}
+    names = {tracker['id']: tracker['name'] for tracker in trackers}
+    converted = {tracker['name']: [] for tracker in trackers}
+
+    for transaction in transactions:
+        if transaction.get('tracker_id') not in names or transaction.get('transition') == 'opening':
+            continue
+        tracker_transactions = converted[names[transaction['tracker_id']]]
+        stock_class = stock_classes[transaction['tracker_id']].get(transaction.get('stock_class_id'))
+        if transaction.get('transition') == 'aging_in':
+            tracker_transactions[-1]['TransferIn'] = stock_class
+            continue
+
+        year, month = helpers.get_relative_date(transaction['accrual_date']['date'], '%Y-%m-%d %H:%M:%S')
+        new_transaction = {'StockClass': stock_class, 'Transition': transaction.get('transition'),
+                           'Quantity': transaction.get('quantity'), 'Year': year, 'Month': month}
+        if transaction.get('amount'):
+            new_transaction['Amount'] = abs(transaction.get('amount'))
+        if transaction.get('weight_per_head') == 0 or transaction.get('weight_per_head'):
+            new_transaction['Weight'] = transaction.get('weight_per_head')
+
+        if transaction.get('type'):
+            new_transaction['Type'] = transaction.get('type')
+        else:
+            find_transaction = dict(new_transaction, Type=None)
+            if find_transaction in tracker_transactions:
+                find_transaction['Type'] = 'forecast'
+                if find_transaction in tracker_transactions:
+                    continue
+                new_transaction['Type'] = 'forecast'
+            else:
+                new_transaction['Type'] = None
+        tracker_transactions.append(new_transaction)
+
+    return converted
+
+
+def get_transactions_with_duplicates(trackers: list) -> list:
+    """
+    Returns synthetic livestock transactions where some untyped transactions, and aging pairs, repeat.
+    """
+    transactions = synthetic.generate_livestock_transactions(trackers, seed=1)
+    rng = random.Random('duplicates')
+    duplicates = []
+    for position, transaction in enumerate(transactions):
+        if transaction['transition'] == 'aging_in' or rng.random() > 0.3:
+            continue
+        repeated = [dict(transaction, type=None)]
+        if transaction['transition'] == 'aging_out':
+            repeated.append(dict(transactions[position + 1], type=None))
+        duplicates.extend(repeated * rng.randint(1, 3))
+    return transactions + [dict(transaction, type=None) for transaction in transactions[:20]] + duplicates
+
+
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch):
+    """
+    A temporary output directory with the current year fixed.
+    """
+    monkeypatch.setattr(helpers, 'OUTPUT_DIR', str(tmp_path))
+    monkeypatch.setattr(helpers, 'CURRENT_YEAR', 2023)
+    return tmp_path
+
+
+def test_convert_transactions_matches_list_scan(output_dir):
+    trackers = synthetic.generate_trackers(seed=1)
+    transactions = get_transactions_with_duplicates(trackers)
+
+    livestock.convert_transactions(iter(transactions), trackers)
+
+    expected = convert_with_list_scan(transactions, trackers)
+    # Some of the repeated transactions were dropped as duplicates
+    assert sum(map(len, expected.values())) \
+        < sum(transaction['transition'] not in ('aging_in', 'opening') for transaction in transactions)
+    for tracker in trackers:
+        converted = serialization.load_file(helpers.get_output_path('Livestock', tracker['name'], 'transactions.json'))
+        assert converted == expected[tracker['name']]
+
+
+def test_untyped_duplicates_become_forecast_then_are_dropped(output_dir):
+    trackers = synthetic.generate_trackers(seed=1)
+    tracker = trackers[0]
+    transaction = {'tracker_id': tracker['id'], 'stock_class_id': tracker['stock_classes'][0]['uuid'],
+                   'transition': 'birth', 'quantity': 5, 'accrual_date': {'date': '2024-03-01 00:00:00'},
+                   'amount': None, 'weight_per_head': None, 'type': None}
+
+    livestock.convert_transactions([transaction] * 3, trackers)
+
+    converted = serialization.load_file(helpers.get_output_path('Livestock', tracker['name'], 'transactions.json'))
+    assert [item['Type'] for item in converted] == [None, 'forecast']
+
+
+def get_transactions_handler(transactions: list):
+    """
+    Returns a fake session handler serving the livestock transactions in pages.
+    """
+    def handler(url: str, params: dict) -> FakeResponse:
+        page, per_page = int(params['page']), int(params['per_page'])
+        return FakeResponse(200, json.dumps({'data': transactions[(page - 1) * per_page:page * per_page]}).encode())
+
+    return handler
+
+
+@pytest.fixture
+def livestock_api(output_dir, api_session, monkeypatch):
+    """
+    Fake livestock trackers and accounts, with the transactions served by the fake API session.
+    """
+    monkeypatch.setattr(livestock.manifest, 'FORCE', False)
+    trackers = synthetic.generate_trackers(seed=1)
+    monkeypatch.setattr(livestock, 'get_trackers', lambda: trackers)
+    monkeypatch.setattr(livestock, 'get_trackers_accounts',
+                        lambda items: [({'code': '100'}, {'code': '200'})] * len(items))
+    api_session.handler = get_transactions_handler(synthetic.generate_livestock_transactions(trackers, seed=1))
+    return api_session
+
+
+def fail_conversion(*args, **kwargs):
+    """
+    Stands in for a conversion that mustn't run.
+    """
+    raise AssertionError('Converted unchanged livestock')
+
+
+def test_convert_skips_unchanged_api_transactions(livestock_api, monkeypatch, capsys):
+    livestock.convert()
+    converted = os.listdir(os.path.join(helpers.OUTPUT_DIR, 'Livestock'))
+
+    monkeypatch.setattr(livestock, 'convert_transactions', fail_conversion)
+    monkeypatch.setattr(livestock, 'convert_trackers', fail_conversion)
+    livestock.convert()
+
+    assert 'Livestock unchanged, skipping conversion.' in capsys.readouterr().out
+    # The downloaded transactions were removed after hashing
+    assert os.listdir(os.path.join(helpers.OUTPUT_DIR, 'Livestock')) == converted
+
+
+def test_convert_reconverts_changed_api_transactions(livestock_api, api_cache, monkeypatch):
+    monkeypatch.setattr(api_cache, 'CACHE_ENABLED', False)
+    livestock.convert()
+    trackers = livestock.get_trackers()
+    livestock_api.handler = get_transactions_handler(synthetic.generate_livestock_transactions(trackers, seed=2))
+    converted = []
+    monkeypatch.setattr(livestock, 'convert_transactions', lambda transactions, items: converted.extend(transactions))
+
+    livestock.convert()
+
+    assert converted == synthetic.generate_livestock_transactions(trackers, seed=2)
+
+
+def test_convert_hashes_saved_transactions_without_the_api(livestock_api, monkeypatch, capsys):
+    trackers = livestock.get_trackers()
+    serialization.dump_file(helpers.get_output_path('Livestock', 'original_livestock.json'),
+                            synthetic.generate_livestock_transactions(trackers, seed=1))
+    livestock.convert()
+    livestock_api.handler = None
+
+    monkeypatch.setattr(livestock, 'convert_transactions', fail_conversion)
+    livestock.convert()
+
+    assert 'Livestock unchanged, skipping conversion.' in capsys.readouterr().out
+    assert livestock_api.requests == []
@@ -0,0 +1,45 @@
+"""
+Tests for stages.py and scheduler.py.
+"""
+import os
+
+import helpers
+import scheduler
+import stages
+
+
+def test_get_stages_creates_nothing(tmp_path, monkeypatch):
+    output_dir = tmp_path / 'output'
+    monkeypatch.setattr(helpers, 'OUTPUT_DIR', str(output_dir))
+
+    pipeline = stages.get_stages()
+    stages.uses_network(stages.STAGE_NAMES)
+
+    assert not output_dir.exists()
+    assert all(path.startswith(str(output_dir)) for stage in pipeline.values() for path in stage['outputs'])
+
+
+def test_skipped_stages_create_nothing(tmp_path, monkeypatch):
+    output_dir = tmp_path / 'output'
+    monkeypatch.setattr(helpers, 'OUTPUT_DIR', str(output_dir))
+
+    results = scheduler.run_stages(stages.get_stages(), ['transactions', 'dedup-livestock'])
+
+    assert results == {'transactions': 'skipped', 'dedup-livestock': 'skipped'}
+    assert not output_dir.exists()
+
+
+def test_stages_sharing_an_output_run_in_order():
+    order = []
+
+    def get_stage(name: str, output: str) -> dict:
+        return {'run': lambda: order.append(name), 'inputs': [], 'outputs': [output], 'network': False}
+
+    pipeline = {'first': get_stage('first', 'shared'), 'second': get_stage('second', 'shared'),
+                'other': get_stage('other', os.devnull)}
+
+    assert scheduler.get_conflicts(pipeline, ['first', 'second', 'other']) == {
+        'first': set(), 'second': {'first'}, 'other': set()}
+    assert scheduler.run_stages(pipeline, ['first', 'second', 'other']) == {
+        'first': 'done', 'second': 'done', 'other': 'done'}
+    assert order.index('first') < order.index('second')
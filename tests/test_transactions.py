@@ -0,0 +1,246 @@
+"""
+Tests for Transactions/transactions.py.
+"""
+import json
+import os
+
+import pytest
+
+import helpers
+import manifest
+from Benchmarks import synthetic
+from conftest import FakeResponse
+from Transactions import transactions
+
+DATE_END = '2025-12'
+COMPARE = 11
+
+
+def get_accounts() -> dict:
+    """
+    Returns a small synthetic farm's accounts.
+    """
+    return synthetic.generate_accounts(seed=1)
+
+
+def get_shards(accounts: dict, shard_months: int) -> list:
+    """
+    Returns the synthetic cashflow report of DATE_END split into shards like get_cashflows_api requests them.
+    """
+    return [synthetic.generate_cashflow_report(accounts, seed=1, date_end=date_end, compare=compare)
+            for date_end, compare in transactions.get_cashflow_shards(DATE_END, COMPARE, shard_months)]
+
+
+def get_first_rows(report: dict) -> dict:
+    """
+    Returns the rows of the report's first nested section.
+    """
+    section = next(iter(report['data']['sections'].values()))
+    return next(iter(section['sections'].values()))['rows']
+
+
+def get_transactions(report: dict) -> list:
+    """
+    Returns a report's converted transactions in a fixed order.
+    """
+    data = report['data']
+    return sorted(transactions.iter_rows_of_sections(data['sections'], data['period']),
+                  key=lambda transaction: json.dumps(transaction, sort_keys=True))
+
+
+def test_merge_cashflows_matches_unsharded_report():
+    accounts = get_accounts()
+    report = synthetic.generate_cashflow_report(accounts, seed=1, date_end=DATE_END, compare=COMPARE)
+    shards = get_shards(accounts, 6)
+
+    merged = transactions.merge_cashflows(shards)
+
+    assert len(shards) == 2
+    assert merged['data'] == report['data']
+    assert merged['meta'] == shards[0]['meta']
+
+
+def test_merge_cashflows_keeps_shards_unchanged():
+    shards = get_shards(get_accounts(), 6)
+    months = [len(shard['data']['period']) for shard in shards]
+
+    transactions.merge_cashflows(shards)
+
+    assert [len(shard['data']['period']) for shard in shards] == months
+
+
+def test_merge_cashflows_matches_rows_by_account():
+    accounts = get_accounts()
+    report = synthetic.generate_cashflow_report(accounts, seed=1, date_end=DATE_END, compare=COMPARE)
+    shards = get_shards(accounts, 6)
+    # An account added at the top of the second shard moves every row to the next key
+    rows = get_first_rows(shards[1])
+    shifted = {f'row-{index + 1}': row for index, row in enumerate(rows.values())}
+    rows.clear()
+    rows.update(shifted)
+
+    merged = transactions.merge_cashflows(shards)
+
+    assert sorted(map(transactions.get_row_identity, get_first_rows(merged).values())) \
+        == sorted(map(transactions.get_row_identity, get_first_rows(report).values()))
+    assert get_transactions(merged) == get_transactions(report)
+
+
+def test_merge_cashflows_keeps_accounts_only_some_shards_have():
+    shards = get_shards(get_accounts(), 6)
+    first_row = next(iter(get_first_rows(shards[1]).values()))
+    first_row['account_code'], first_row['account_name'] = 'new', 'New account'
+
+    rows = get_first_rows(transactions.merge_cashflows(shards))
+    months = {transactions.get_row_identity(row): sorted(row['data']) for row in rows.values()}
+
+    assert months[('new', 'New account')] == sorted(get_first_rows(shards[1])['row-0']['data'])
+    assert months[transactions.get_row_identity(get_first_rows(shards[0])['row-0'])] \
+        == sorted(get_first_rows(shards[0])['row-0']['data'])
+    assert len(rows) == len(get_first_rows(shards[0])) + 1
+
+
+def test_merge_cashflows_keeps_repeated_accounts_apart():
+    shards = get_shards(get_accounts(), 6)
+    for shard in shards:
+        rows = get_first_rows(shard)
+        rows['row-0']['account_code'], rows['row-0']['account_name'] = 'same', 'Same account'
+        rows['row-1']['account_code'], rows['row-1']['account_name'] = 'same', 'Same account'
+
+    rows = get_first_rows(transactions.merge_cashflows(shards))
+
+    assert rows['row-0']['data'] == {**get_first_rows(shards[0])['row-0']['data'],
+                                     **get_first_rows(shards[1])['row-0']['data']}
+    assert rows['row-1']['data'] == {**get_first_rows(shards[0])['row-1']['data'],
+                                     **get_first_rows(shards[1])['row-1']['data']}
+
+
+def test_merge_cashflows_missing_shard():
+    shards = get_shards(get_accounts(), 6)
+
+    assert transactions.merge_cashflows([shards[0], None]) is None
+
+
+def write_report(file_path, report: dict, period_first: bool = True) -> dict:
+    """
+    Writes a cashflow report as JSON, with its periods before or after its sections.
+    """
+    data = report['data']
+    if not period_first:
+        data = {'sections': data['sections'], 'period': data['period']}
+    with open(file_path, 'w', encoding='utf-8') as file:
+        json.dump({'data': data, 'meta': report['meta']}, file)
+    return data
+
+
+@pytest.mark.parametrize('period_first', [True, False])
+def test_iter_cashflow_json_reads_the_file_once(tmp_path, monkeypatch, period_first):
+    ijson = pytest.importorskip('ijson')
+    file_path = tmp_path / 'actuals_cashflow.json'
+    data = write_report(file_path, synthetic.generate_cashflow_report(get_accounts(), seed=1), period_first)
+    parse = ijson.parse
+    calls = []
+    monkeypatch.setattr(ijson, 'parse', lambda *args, **kwargs: calls.append(args) or parse(*args, **kwargs))
+
+    with open(file_path, 'rb') as file:
+        items = list(transactions.iter_cashflow_json(file))
+
+    expected = []
+    for key, value in data.items():
+        if key == 'period':
+            expected.append((None, value))
+        else:
+            expected.extend(value.items())
+    assert len(calls) == 1
+    assert items == expected
+
+
+@pytest.mark.parametrize('period_first', [True, False])
+def test_iter_cashflow_file_transactions_matches_full_load(tmp_path, monkeypatch, period_first):
+    pytest.importorskip('ijson')
+    file_path = tmp_path / 'actuals_cashflow.json'
+    data = write_report(file_path, synthetic.generate_cashflow_report(get_accounts(), seed=1), period_first)
+    full_load = list(transactions.iter_rows_of_sections(data['sections'], data['period']))
+
+    assert list(transactions.iter_cashflow_file_transactions(str(file_path))) == full_load
+
+    monkeypatch.setattr(transactions, 'HAS_IJSON', False)
+    assert list(transactions.iter_cashflow_file_transactions(str(file_path))) == full_load
+
+
+@pytest.fixture
+def farm_dir(tmp_path, monkeypatch):
+    """
+    An output directory with the account files the transactions stage reads.
+    """
+    monkeypatch.setattr(helpers, 'OUTPUT_DIR', str(tmp_path))
+    for file_name in ['revenue.json', 'equity.json']:
+        with open(helpers.get_output_path('Accounts', file_name), 'w', encoding='utf-8') as file:
+            json.dump([], file)
+    return tmp_path
+
+
+def get_cashflow_handler(failed_date_end: str = None):
+    """
+    Returns a fake session handler serving synthetic cashflow report shards.
+    :param failed_date_end: Shard answered with a server error.
+    """
+    accounts = get_accounts()
+
+    def handler(url: str, params: dict) -> FakeResponse:
+        if params['date_end'] == failed_date_end:
+            return FakeResponse(500, b'error')
+        report = synthetic.generate_cashflow_report(accounts, seed=1, data_type=params['data_type'],
+                                                    date_end=params['date_end'], compare=int(params['compare']))
+        return FakeResponse(200, json.dumps(report).encode('utf-8'))
+
+    return handler
+
+
+def test_convert_downloads_and_converts_the_shards(farm_dir, api_session):
+    api_session.handler = get_cashflow_handler()
+
+    transactions.convert()
+
+    with open(helpers.get_output_path('Transactions', 'transactions.json'), encoding='utf-8') as file:
+        assert json.load(file)
+    assert 'transactions' in manifest.load_manifest()['stages']
+
+
+def test_failed_shard_fails_the_stage(farm_dir, api_session):
+    shards = transactions.get_cashflow_shards(f'{helpers.get_current_year() + 2}-12', transactions.CASHFLOW_COMPARE,
+                                              helpers.CASHFLOW_SHARD_MONTHS)
+    api_session.handler = get_cashflow_handler(failed_date_end=shards[1][0])
+
+    with pytest.raises(RuntimeError, match='cashflow report'):
+        transactions.convert()
+
+    assert transactions.get_cashflow_file_paths() == []
+    assert not (farm_dir / 'Transactions' / 'transactions.json').exists()
+    assert 'transactions' not in manifest.load_manifest()['stages']
+
+
+@pytest.mark.parametrize('has_ijson', [True, False])
+def test_convert_rejects_a_cashflow_file_without_data(farm_dir, monkeypatch, has_ijson):
+    monkeypatch.setattr(transactions, 'HAS_IJSON', has_ijson and transactions.HAS_IJSON)
+    with open(helpers.get_output_path('Transactions', 'actuals_cashflow.json'), 'w', encoding='utf-8') as file:
+        json.dump({'data': None}, file)
+    monkeypatch.setattr(transactions, 'get_cashflow_file_paths',
+                        lambda: [helpers.get_output_path('Transactions', 'actuals_cashflow.json')])
+
+    with pytest.raises(ValueError, match='no cashflow report data'):
+        transactions.convert(fetch=False)
+
+    assert sorted(os.listdir(farm_dir / 'Transactions')) == ['actuals_cashflow.json']
+    assert 'transactions' not in manifest.load_manifest()['stages']
+
+
+def test_numpy_conversion_matches_pure_python(monkeypatch):
+    pytest.importorskip('numpy')
+    report = synthetic.generate_cashflow_report(get_accounts(), seed=1, date_end=DATE_END, compare=COMPARE)
+    data = report['data']
+    monkeypatch.setattr(transactions, 'HAS_NUMPY', False)
+    pure_python = list(transactions.iter_rows_of_sections(data['sections'], data['period']))
+
+    monkeypatch.setattr(transactions, 'HAS_NUMPY', True)
+    assert list(transactions.iter_rows_of_sections(data['sections'], data['period'])) == pure_python